@@ -1,12 +1,45 @@
 """
 run.py
 
-Entry point for the reportAI pipeline. This script bootstraps the environment, 
-downloads email and PDF reports, and ingests them into the AI summarization and 
-vectorization workflow.
+Entry point for the reportAI pipeline: scrape emails, download their PDF
+reports, summarise and vectorise them.
+
+The three stages run at the same time, each on its own thread, joined by
+bounded in-memory queues: every batch of emails the scraper writes goes
+straight to the downloader, and every PDF the downloader saves goes
+straight to ingestion, so a report is searchable minutes after its email
+lands instead of after the whole run. A queue that fills up (summaries are
+the slow part) holds the stage feeding it - backpressure - and nothing is
+lost if the process stops: emails_final, download_jobs and ingest_jobs
+are the real record, and each stage picks up its backlog from them when
+it starts.
+
+    python run/run.py                                  # everything, once
+    python run/run.py --lookback 12
+    python run/run.py --stages download,ingest         # no scraping
+    python run/run.py --watch                          # keep polling the mailbox
+    python run/run.py --download-workers 16 --ingest-concurrency 4
+
+Ctrl-C (or SIGTERM) stops gracefully: the scraper stops reading, the
+downloader finishes the batch in hand and ingestion the reports already
+started. A second Ctrl-C stops at once.
+
+Each stage is timed as it goes (helpers.metrics): a profile table is
+printed at the end, and --metrics-port / METRICS_TEXTFILE /
+METRICS_JSON_LOG expose the same numbers to Prometheus or a log shipper.
+Per-report progress is logged at INFO (failures at WARNING); -v adds the
+DEBUG detail of each stage.
 """
 
+import argparse
+import asyncio
+import logging
+import queue
+import signal
 import sys
+import threading
+import time
+import traceback
 from pathlib import Path
 
 # === Configure Module Search Path ===
@@ -14,23 +47,273 @@ from pathlib import Path
 # Add the src directory to sys.path
 sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
 
-# === Project-Specific Imports ===
-# The email_scraper module handles fetching and saving emails for downstream processing
-from downloaders.email_scraper import email_scraper
-# The pdf_downloader module handles extraction of PDF files from saved emails or other sources
-from downloaders.pdf_downloader import pdf_downloader
-# The summarization_vectorization module converts downloaded documents into vectors for semantic search
-from ai_summary.summarization_vectorization import ingest_and_vectorize_reports
+import configuration.system_config as sysconfig
+from helpers import metrics
+
+STAGES = ("scrape", "download", "ingest")
+_CLOSED = object()
+
+
+# ─── HAND-OFF ────────────────────────────────────────────────────────────────
+class Channel:
+    """
+    Bounded hand-off from one stage to the next. put() blocks while the
+    queue is full, unless the run is stopping or the consumer has gone.
+    take() returns what's waiting (at least one item), [] when *timeout*
+    passes with nothing, and None once the producer has closed the channel
+    and it's drained, or the run is stopping.
+    """
+
+    def __init__(self, name: str, maxsize: int, stop: threading.Event):
+        self.name = name
+        self.stop = stop
+        self.abandoned = threading.Event()
+        self.passed = 0
+        self._q: queue.Queue = queue.Queue(maxsize)
+        self._closed = False
+
+    def put(self, item) -> None:
+        while not (self.stop.is_set() or self.abandoned.is_set()):
+            try:
+                self._q.put(item, timeout=0.5)
+            except queue.Full:
+                continue
+            if item is not _CLOSED:
+                self.passed += 1
+            return
+
+    def put_all(self, items) -> None:
+        for item in items:
+            self.put(item)
+
+    def close(self) -> None:
+        self.put(_CLOSED)
+
+    def take(self, max_items: int = 1000, timeout: float | None = None) -> list | None:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not (self._closed or self.stop.is_set()):
+            wait = 0.5 if deadline is None else min(0.5, deadline - time.monotonic())
+            if wait <= 0:
+                return []
+            try:
+                items = [self._q.get(timeout=wait)]
+            except queue.Empty:
+                continue
+            while len(items) < max_items and items[-1] is not _CLOSED:
+                try:
+                    items.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            if items[-1] is _CLOSED:
+                self._closed = True
+                items.pop()
+            return items or None
+        return None
+
+
+# ─── STAGES ──────────────────────────────────────────────────────────────────
+def scrape_stage(args, inbox, outbox, stop) -> None:
+    from downloaders.email_scraper import email_scraper
+
+    lookback = args.lookback
+    while True:
+        with metrics.timer("scrape"):
+            email_scraper(lookback_days=lookback, on_written=outbox.put_all if outbox else None, stop=stop)
+        lookback = None   # later polls start from the newest email already imported
+        if not args.watch or stop.wait(args.watch):
+            return
+
+
+def download_stage(args, inbox, outbox, stop) -> None:
+    from downloaders import pdf_downloader as pdf
+
+    on_saved = (lambda report_id, bank: outbox.put((report_id, bank))) if outbox else None
+    pdf.BASE_DOWNLOAD.mkdir(parents=True, exist_ok=True)
+    try:
+        with pdf.connect() as conn:
+            pdf.ensure_schema(conn)
+            pdf.backfill_content_hashes(conn)
+            backlog = True
+            while not stop.is_set():
+                if backlog:
+                    added = pdf.enqueue_downloads(conn, pdf.HANDLERS)
+                    if added:
+                        print(f"Queued {added} new emails for download")
+                pdf.drain_queue(conn, pdf.HANDLERS, args.download_workers, args.per_bank, on_saved, stop)
+                if inbox is None:
+                    if not args.watch or stop.wait(args.watch):
+                        return
+                    continue
+                emails = inbox.take(timeout=args.watch)
+                if emails is None:
+                    # upstream finished: whatever it handed over is queued, one last drain
+                    pdf.drain_queue(conn, pdf.HANDLERS, args.download_workers, args.per_bank, on_saved, stop)
+                    return
+                # nothing new within --watch: look for retries and emails from other runs
+                backlog = not emails
+                pdf.enqueue_emails(conn, emails)
+    finally:
+        pdf.shutdown_driver_pool()
+
+
+def ingest_stage(args, inbox, outbox, stop) -> None:
+    from ai_summary.summarization_vectorization import ingest_and_vectorize_reports
+
+    feed = None
+    if args.mode == "batch":
+        # Message Batches take hours anyway: let upstream finish, then submit everything
+        while inbox is not None and inbox.take() is not None:
+            pass
+        if stop.is_set():
+            return
+    elif inbox is not None or args.watch:
+        async def feed():
+            if inbox is None:
+                return None if await asyncio.to_thread(stop.wait, args.watch) else []
+            return await asyncio.to_thread(inbox.take, timeout=args.watch)
+
+    ingest_and_vectorize_reports(
+        dry_run=args.dry_run,
+        batch=args.ingest_batch,
+        concurrency=args.ingest_concurrency,
+        mode=args.mode,
+        feed=feed,
+        stop=stop,
+    )
+
+
+RUNNERS = {"scrape": scrape_stage, "download": download_stage, "ingest": ingest_stage}
+
+
+# ─── ORCHESTRATION ───────────────────────────────────────────────────────────
+def prepare_schema() -> None:
+    """
+    Tables every stage reads, created up front in dependency order: on a new
+    database the stages would otherwise race (ingestion reads reports, which
+    the downloader creates, and the downloader alters emails_final).
+    """
+    from downloaders import email_scraper, pdf_downloader
+    from search.vector_index import connect
+
+    with connect() as conn:
+        with conn.cursor() as cur:
+            email_scraper.ensure_schema(cur)
+        pdf_downloader.ensure_schema(conn)
+
+
+def run_pipeline(args) -> int:
+    stop = threading.Event()
+    failed = []
+    stages = [s for s in STAGES if s in args.stages]
+    # a channel between each pair of neighbouring stages that both run
+    channels = {
+        (a, b): Channel(f"{a}→{b}", args.queue_size, stop)
+        for a, b in zip(STAGES, STAGES[1:]) if a in stages and b in stages
+    }
+
+    def stage_thread(name):
+        inbox = next((c for (a, b), c in channels.items() if b == name), None)
+        outbox = next((c for (a, b), c in channels.items() if a == name), None)
+        try:
+            RUNNERS[name](args, inbox, outbox, stop)
+            print(f"── {name} stage finished", flush=True)
+        except BaseException:
+            failed.append(name)
+            print(f"── {name} stage failed; stopping the pipeline", file=sys.stderr, flush=True)
+            traceback.print_exc()
+            stop.set()
+        finally:
+            if outbox:
+                outbox.close()
+            if inbox:
+                inbox.abandoned.set()
+
+    def on_signal(signum, frame):
+        print("\nStopping after the work in hand (again to stop now)...", flush=True)
+        stop.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    signal.signal(signal.SIGINT, on_signal)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, on_signal)
+
+    prepare_schema()
+    server = metrics.serve(args.metrics_port)
+    started = flushed = time.monotonic()
+    threads = [threading.Thread(target=stage_thread, args=(s,), name=s, daemon=True) for s in stages]
+    for t in threads:
+        t.start()
+    # join with a timeout so the main thread stays free to take signals
+    while any(t.is_alive() for t in threads):
+        for t in threads:
+            t.join(timeout=0.5)
+        if time.monotonic() - flushed >= sysconfig.METRICS_FLUSH_SECONDS:
+            metrics.write_textfile()
+            flushed = time.monotonic()
+
+    elapsed = time.monotonic() - started
+    metrics.event("run", seconds=round(elapsed, 3), stages=stages, failed=failed,
+                  handed_over={c.name: c.passed for c in channels.values()})
+    print(f"─── Pipeline finished in {elapsed:.0f} s ───")
+    for channel in channels.values():
+        print(f"  {channel.name}: {channel.passed} handed over")
+    if failed:
+        print(f"  failed stages: {', '.join(failed)}")
+    print(metrics.profile_table())
+    if metrics.write_textfile():
+        print(f"Metrics written to {sysconfig.METRICS_TEXTFILE}")
+    if server:
+        server.shutdown()
+    return 1 if failed else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape, download and ingest research reports")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"comma-separated subset of {','.join(STAGES)} (default: all)")
+    parser.add_argument("--lookback", type=int, default=None,
+                        help=f"days of mail to scan (default: since the last import, at most {sysconfig.DB_LAG_DAYS})")
+    parser.add_argument("--watch", type=float, nargs="?", const=sysconfig.PIPELINE_WATCH_SECONDS, default=None,
+                        metavar="SECONDS", help="keep running, polling for new mail every SECONDS "
+                                                f"(default {sysconfig.PIPELINE_WATCH_SECONDS})")
+    parser.add_argument("--download-workers", type=int, default=sysconfig.DOWNLOAD_WORKERS)
+    parser.add_argument("--per-bank", type=int, default=sysconfig.DOWNLOAD_PER_BANK,
+                        help="downloads in flight per bank")
+    parser.add_argument("--ingest-concurrency", type=int, default=sysconfig.SUMMARY_CONCURRENCY,
+                        help="reports summarised at once")
+    parser.add_argument("--ingest-batch", type=int, default=sysconfig.INGEST_CLAIM_BATCH,
+                        help="reports claimed per round trip")
+    parser.add_argument("--mode", choices=("realtime", "batch"), default="realtime",
+                        help="ingestion: per-report requests, or Message Batches for backfills")
+    parser.add_argument("--queue-size", type=int, default=sysconfig.PIPELINE_QUEUE_SIZE,
+                        help="items held between two stages before the earlier one waits")
+    parser.add_argument("--dry-run", action="store_true", help="ingestion only: summarise and store nothing")
+    parser.add_argument("--metrics-port", type=int, default=sysconfig.METRICS_PORT,
+                        help="serve Prometheus metrics on this port while running")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log each stage's per-item detail")
+    args = parser.parse_args(argv)
+    args.stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown or not args.stages:
+        parser.error(f"--stages takes a subset of {','.join(STAGES)}")
+    return args
+
 
+def setup_logging(verbose: bool) -> None:
+    """Our modules log at INFO (DEBUG with -v); libraries only warnings and up."""
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)-7s %(name)s: %(message)s",
+                        datefmt="%H:%M:%S")
+    for package in ("downloaders", "ai_summary", "helpers", "search"):
+        logging.getLogger(package).setLevel(logging.DEBUG if verbose else logging.INFO)
 
-# Print a startup banner to indicate the script has begun execution
-# flush=True ensures the message appears immediately in logs or console
-print("🔥  run.py starting up…", flush=True)
 
-# ----- Step 1: Email Scraping -----
-# By default, email_scraper() will look back a configurable number of days (DB_LAG_DAYS).
-# email_scraper(lookback_days=12)
+def main(argv=None) -> int:
+    # flush=True ensures the message appears immediately in logs or console
+    print("🔥  run.py starting up…", flush=True)
+    args = parse_args(argv)
+    setup_logging(args.verbose)
+    return run_pipeline(args)
 
-pdf_downloader()
 
-# ingest_and_vectorize_reports()
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
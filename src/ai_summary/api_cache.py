@@ -0,0 +1,208 @@
+"""
+api_cache.py
+
+Content-addressed cache for the paid API calls, kept in Postgres.
+
+* summary_cache   – keyed by the PDF's content hash plus everything that
+                    shapes the answer: prompt, model, sampling parameters,
+                    how much text and which page images go in. Changing
+                    the prompt (or any of those) changes the key, so only
+                    the affected entries miss; the old ones age out.
+* embedding_cache – keyed by the text's hash, embedding model and input_type.
+
+Re-running ingestion after a crash, a reset of report_vectors or a
+re-embed never sends the same work to Anthropic/Voyage twice. Each entry
+counts its hits and when it was last used; evict() drops entries unused
+for CACHE_MAX_AGE_DAYS and trims each table to CACHE_MAX_ROWS, least
+recently used first. ApiCache keeps hit/miss counters for one run.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import configuration.system_config as sysconfig
+from ai_summary import embeddings
+
+# ─── SCHEMA ──────────────────────────────────────────────────────────────────
+DDL = """
+CREATE TABLE IF NOT EXISTS summary_cache (
+  cache_key      TEXT PRIMARY KEY,
+  content_sha256 TEXT NOT NULL,
+  model          TEXT NOT NULL,
+  summary        TEXT NOT NULL,
+  created_at     TIMESTAMPTZ NOT NULL DEFAULT now(),
+  last_used      TIMESTAMPTZ NOT NULL DEFAULT now(),
+  hits           INT NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_summary_cache_last_used ON summary_cache(last_used);
+CREATE TABLE IF NOT EXISTS embedding_cache (
+  cache_key      TEXT PRIMARY KEY,
+  model          TEXT NOT NULL,
+  input_type     TEXT,
+  embedding      DOUBLE PRECISION[] NOT NULL,
+  created_at     TIMESTAMPTZ NOT NULL DEFAULT now(),
+  last_used      TIMESTAMPTZ NOT NULL DEFAULT now(),
+  hits           INT NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache(last_used);
+"""
+
+TABLES = ("summary_cache", "embedding_cache")
+
+
+def ensure_schema(cur) -> None:
+    cur.execute(DDL)
+
+
+# ─── KEYS ────────────────────────────────────────────────────────────────────
+def _digest(parts: dict) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def summary_key(content_sha256: Optional[str], **settings) -> Optional[str]:
+    """Key for a summary of these PDF bytes under *settings*; None without a content hash."""
+    if not content_sha256:
+        return None
+    return _digest({"content": content_sha256, **settings})
+
+
+def embedding_key(text: str, model: str, input_type: Optional[str] = "document") -> str:
+    return _digest({"text": hashlib.sha256(text.encode()).hexdigest(), "model": model, "input_type": input_type})
+
+
+# ─── CACHE ───────────────────────────────────────────────────────────────────
+@dataclass
+class CacheStats:
+    hits: Dict[str, int] = field(default_factory=lambda: {"summary": 0, "embedding": 0})
+    misses: Dict[str, int] = field(default_factory=lambda: {"summary": 0, "embedding": 0})
+
+
+class ApiCache:
+    """
+    Lookups and writes for one run. Every method takes the connection as its
+    first argument (so it can be handed to Ingestion.db as is). A read_only
+    cache (dry runs) still answers lookups but writes nothing, not even
+    hit counts; enabled=False turns it into a permanent miss.
+    """
+
+    def __init__(self, enabled: bool = sysconfig.API_CACHE, read_only: bool = False):
+        self.enabled = enabled
+        self.read_only = read_only
+        self.stats = CacheStats()
+
+    def _count(self, kind: str, hits: int, misses: int) -> None:
+        self.stats.hits[kind] += hits
+        self.stats.misses[kind] += misses
+
+    def _lookup(self, conn, table: str, column: str, keys: Sequence[str]) -> Dict[str, object]:
+        if self.read_only:
+            sql = f"SELECT cache_key, {column} FROM {table} WHERE cache_key = ANY(%s)"
+        else:
+            sql = (f"UPDATE {table} SET hits = hits + 1, last_used = now() "
+                   f"WHERE cache_key = ANY(%s) RETURNING cache_key, {column}")
+        return dict(conn.execute(sql, (list(keys),)).fetchall())
+
+    def get_summary(self, conn, key: Optional[str]) -> Optional[str]:
+        if not self.enabled or not key:
+            return None
+        summary = self._lookup(conn, "summary_cache", "summary", [key]).get(key)
+        self._count("summary", summary is not None, summary is None)
+        return summary
+
+    def put_summary(self, conn, key: Optional[str], content_sha256: str, model: str, summary: str) -> None:
+        if not self.enabled or self.read_only or not key or not summary:
+            return
+        conn.execute(
+            """
+            INSERT INTO summary_cache (cache_key, content_sha256, model, summary)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (cache_key) DO UPDATE SET summary = EXCLUDED.summary, last_used = now()
+            """,
+            (key, content_sha256, model, summary),
+        )
+
+    def get_embeddings(self, conn, keys: Sequence[str]) -> Dict[str, list]:
+        if not self.enabled or not keys:
+            return {}
+        found = self._lookup(conn, "embedding_cache", "embedding", set(keys))
+        hits = sum(1 for k in keys if k in found)
+        self._count("embedding", hits, len(keys) - hits)
+        return found
+
+    def put_embeddings(self, conn, rows: Iterable[Tuple[str, str, Optional[str], list]]) -> None:
+        """rows of (key, model, input_type, embedding)."""
+        rows = list(rows)
+        if not self.enabled or self.read_only or not rows:
+            return
+        with conn.cursor() as cur:
+            cur.executemany(
+                """
+                INSERT INTO embedding_cache (cache_key, model, input_type, embedding)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (cache_key) DO NOTHING
+                """,
+                rows,
+            )
+
+    def summary(self) -> str:
+        parts = []
+        for kind in ("summary", "embedding"):
+            hits, misses = self.stats.hits[kind], self.stats.misses[kind]
+            total = hits + misses
+            rate = f" ({hits / total:.0%})" if total else ""
+            parts.append(f"{kind} {hits}/{total} hits{rate}")
+        return "cache: " + ", ".join(parts)
+
+
+async def embed_cached(
+    conn,
+    cache: ApiCache,
+    apis,
+    items: Sequence[Tuple[object, str]],
+    model: str = sysconfig.EMBED_MODEL,
+    input_type: str = "document",
+) -> Tuple[Dict[object, list], Dict[object, Exception]]:
+    """
+    embeddings.embed_many() for (key, text) pairs, answering from the cache
+    first and caching whatever comes back. For callers that own *conn* on
+    the event loop thread (batch collection, re-embedding).
+    """
+    keys = {k: embedding_key(text, model, input_type) for k, text in items}
+    found = cache.get_embeddings(conn, list(keys.values()))
+    vectors = {k: found[keys[k]] for k, _ in items if keys[k] in found}
+    todo = [(k, text) for k, text in items if k not in vectors]
+    fresh, errors = await embeddings.embed_many(apis, todo, model=model, input_type=input_type)
+    cache.put_embeddings(conn, [(keys[k], model, input_type, emb) for k, emb in fresh.items()])
+    vectors.update(fresh)
+    return vectors, errors
+
+
+# ─── EVICTION ────────────────────────────────────────────────────────────────
+def evict(
+    conn,
+    max_age_days: Optional[float] = sysconfig.CACHE_MAX_AGE_DAYS,
+    max_rows: Optional[int] = sysconfig.CACHE_MAX_ROWS,
+) -> Dict[str, int]:
+    """Drop stale entries, then the least recently used beyond *max_rows*; rows removed per table."""
+    removed = {}
+    for table in TABLES:
+        n = 0
+        if max_age_days:
+            n += conn.execute(
+                f"DELETE FROM {table} WHERE last_used < now() - make_interval(secs => %s)",
+                (max_age_days * 86400,),
+            ).rowcount
+        if max_rows:
+            n += conn.execute(
+                f"""
+                DELETE FROM {table}
+                 WHERE cache_key IN (SELECT cache_key FROM {table}
+                                      ORDER BY last_used DESC OFFSET %s)
+                """,
+                (max_rows,),
+            ).rowcount
+        removed[table] = n
+    return removed
@@ -0,0 +1,369 @@
+"""
+batch_summaries.py
+
+Backfill path for ingestion: ingest_and_vectorize_reports(mode="batch").
+
+Pending reports are claimed from ingest_jobs with a lease long enough to
+outlive a batch, rendered, and packed into Message Batches submissions
+(bounded by request count and payload size). Every submitted batch and the
+reports in it are recorded in summary_batches / summary_batch_items, so a
+later run - after a restart, or the next night - picks up where this one
+left off: batches that have ended are collected, their summaries embedded
+and written to report_vectors, and anything that errored or expired goes
+back to the queue through the normal retry path.
+
+Reports whose bytes already have vectors, or a cached summary under the
+current prompt, are finished without a request, and identical PDFs inside
+one submission share a single request.
+
+Each report is one request here, so long reports get the first
+SUMMARY_TEXT_CHARS of text rather than the realtime path's map-reduce (a
+batch would need a second round for the reduce step). Their chunks are
+still stored and embedded in full when the batch is collected.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+import psycopg
+
+import configuration.system_config as sysconfig
+from ai_summary import api_cache, chunking, rate_limiting, text_extraction
+from ai_summary import summarization_vectorization as sv
+from helpers import metrics
+from helpers.job_queue import INGEST_QUEUE
+
+log = logging.getLogger(__name__)
+
+# ─── SCHEMA ──────────────────────────────────────────────────────────────────
+DDL = """
+CREATE TABLE IF NOT EXISTS summary_batches (
+  batch_id      TEXT PRIMARY KEY,
+  status        TEXT NOT NULL DEFAULT 'in_progress',   -- in_progress | ended | collected
+  request_count INT NOT NULL,
+  submitted_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+  ended_at      TIMESTAMPTZ,
+  collected_at  TIMESTAMPTZ
+);
+CREATE TABLE IF NOT EXISTS summary_batch_items (
+  report_id     UUID PRIMARY KEY,
+  batch_id      TEXT NOT NULL REFERENCES summary_batches(batch_id),
+  custom_id     TEXT NOT NULL,                         -- shared by identical PDFs
+  state         TEXT NOT NULL DEFAULT 'submitted'      -- submitted | done | errored
+);
+CREATE INDEX IF NOT EXISTS idx_summary_batch_items_batch
+  ON summary_batch_items(batch_id);
+"""
+
+
+def ensure_schema(conn: psycopg.Connection) -> None:
+    conn.execute(DDL)
+
+
+def record_batch(conn: psycopg.Connection, batch_id: str, members: dict[str, list]) -> None:
+    with conn.transaction():
+        conn.execute(
+            "INSERT INTO summary_batches (batch_id, request_count) VALUES (%s, %s)",
+            (batch_id, len(members)),
+        )
+        with conn.cursor() as cur:
+            cur.executemany(
+                """
+                INSERT INTO summary_batch_items (report_id, batch_id, custom_id)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (report_id) DO UPDATE
+                  SET batch_id = EXCLUDED.batch_id,
+                      custom_id = EXCLUDED.custom_id,
+                      state = 'submitted'
+                """,
+                [(rid, batch_id, cid) for cid, rids in members.items() for rid in rids],
+            )
+
+
+def open_batches(conn: psycopg.Connection) -> list[str]:
+    rows = conn.execute(
+        "SELECT batch_id FROM summary_batches WHERE status <> 'collected' ORDER BY submitted_at"
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def batch_members(conn: psycopg.Connection, batch_id: str) -> dict[str, list]:
+    members: dict[str, list] = {}
+    for cid, rid in conn.execute(
+        "SELECT custom_id, report_id FROM summary_batch_items WHERE batch_id = %s AND state = 'submitted'",
+        (batch_id,),
+    ):
+        members.setdefault(cid, []).append(rid)
+    return members
+
+
+def set_item_state(conn: psycopg.Connection, report_ids: list, state: str) -> None:
+    conn.execute(
+        "UPDATE summary_batch_items SET state = %s WHERE report_id = ANY(%s)",
+        (state, report_ids),
+    )
+
+
+# ─── SUBMISSION ──────────────────────────────────────────────────────────────
+@dataclass
+class PendingBatch:
+    """Requests collected for the next submission."""
+    requests: list = field(default_factory=list)
+    members: dict = field(default_factory=dict)    # custom_id -> [report_id]
+    by_sha: dict = field(default_factory=dict)     # content hash -> custom_id
+    size: int = 0
+
+    def add(self, custom_id: str, params: dict, report_id, content_sha256, size: int) -> None:
+        self.requests.append({"custom_id": custom_id, "params": params})
+        self.members[custom_id] = [report_id]
+        if content_sha256:
+            self.by_sha[content_sha256] = custom_id
+        self.size += size
+
+
+def request_size(params: dict) -> int:
+    # the images dominate; no need to serialise them just to measure
+    return sum(
+        len(b["source"]["data"]) if b["type"] == "image" else len(b["text"])
+        for m in params["messages"] for b in m["content"]
+    ) + 1024
+
+
+def render(path: str, pages: list | None) -> tuple[dict, list]:
+    """Request params for one report, and its page texts (extracted here if *pages* is None)."""
+    if pages is None:
+        pages = text_extraction.extract_pages(path)
+    return sv.summary_params(text_extraction.join_pages(pages), sv.pdf_images_to_base64(path)), pages
+
+
+class BatchIngestion:
+    def __init__(
+        self,
+        conn: psycopg.Connection,
+        apis: sv.Apis,
+        dry_run: bool = False,
+        wait: bool = False,
+        claim: int = sysconfig.BATCH_CLAIM,
+        max_requests: int = sysconfig.BATCH_MAX_REQUESTS,
+        max_bytes: int = sysconfig.BATCH_MAX_BYTES,
+        poll_seconds: float = sysconfig.BATCH_POLL_SECONDS,
+        render_workers: int = sysconfig.SUMMARY_CONCURRENCY,
+    ):
+        self.conn = conn
+        self.apis = apis
+        self.dry_run = dry_run
+        self.wait = wait
+        self.claim = claim
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.poll_seconds = poll_seconds
+        self.render_workers = render_workers
+        self.processed = 0
+        self.failed = 0
+        self.submitted = 0
+        self.cache = api_cache.ApiCache(read_only=dry_run)
+
+    def fail(self, report_id, error) -> None:
+        self.failed += 1
+        state = "skipped" if self.dry_run else sv.fail_report(self.conn, report_id, error)
+        log.warning("✗ %s failed (%s) – %s", report_id, error, state)
+
+    async def flush(self, pending: PendingBatch) -> PendingBatch:
+        if not pending.requests:
+            return pending
+        n_reports = sum(len(r) for r in pending.members.values())
+        if self.dry_run:
+            print(f"[DRY RUN] Would submit a batch of {len(pending.requests)} requests "
+                  f"({n_reports} reports, {pending.size / 1e6:.1f} MB)")
+        else:
+            batch = await rate_limiting.call_with_backoff(
+                lambda: self.apis.claude.messages.batches.create(requests=pending.requests)
+            )
+            record_batch(self.conn, batch.id, pending.members)
+            print(f"📦 Submitted {batch.id}: {len(pending.requests)} requests for {n_reports} reports")
+        self.submitted += n_reports
+        return PendingBatch()
+
+    async def embed_chunks(self, shas: list) -> None:
+        if self.dry_run:
+            return
+        errors = await chunking.embed_pending(self.conn, self.apis, shas)
+        if errors:
+            print(f"✗ {len(errors)} chunk embeddings failed (first: {next(iter(errors.values()))}); "
+                  f"reembed_reports() picks them up")
+
+    async def finish_cached(self, rows: list) -> None:
+        """Embed and store (report_id, path, received_ts, summary, sha) rows whose summary came from the cache."""
+        if not rows:
+            return
+        vectors, errors = await api_cache.embed_cached(
+            self.conn, self.cache, self.apis, [(r[0], r[3]) for r in rows]
+        )
+        for report_id, path, received_ts, summary, _ in rows:
+            if report_id in errors:
+                self.fail(report_id, f"embedding failed: {errors[report_id]}")
+                continue
+            if self.dry_run:
+                print(f"[DRY RUN] Would INSERT {report_id} from cached summary")
+            else:
+                sv.store_vectors(self.conn, report_id, path, received_ts, vectors[report_id], summary)
+                log.info("♻️ summary for %s found in cache", report_id)
+            self.processed += 1
+        await self.embed_chunks([r[4] for r in rows if r[4]])
+
+    async def submit_pending(self) -> None:
+        pending = PendingBatch()
+        sem = asyncio.Semaphore(self.render_workers)
+
+        async def rendered(item, pages):
+            async with sem:
+                try:
+                    return item, await asyncio.to_thread(render, item[1], pages)
+                except Exception as e:
+                    return item, e
+
+        while True:
+            with self.conn.cursor() as cur:
+                if self.dry_run:
+                    # a sample the size of one claim: enough to cost it, without rendering the backlog
+                    claimed = INGEST_QUEUE.peek(cur, self.claim)
+                    backlog = INGEST_QUEUE.counts(cur).get("pending", 0)
+                else:
+                    claimed = INGEST_QUEUE.claim(cur, self.claim, lease_seconds=sysconfig.BATCH_LEASE_SECONDS)
+            if not claimed:
+                break
+            rows = sv.fetch_reports(self.conn, [r for r, _ in claimed])
+            found = {row[0] for row in rows}
+            for report_id, _ in claimed:
+                if report_id not in found:
+                    self.fail(report_id, "report or its email row missing")
+
+            # reuse what's already summarised; render the rest concurrently, each
+            # distinct content once (copies ride along on the first one's request)
+            todo, cached, copies = [], [], {}
+            for report_id, path, received_ts, sha in rows:
+                done = sv.find_reusable(self.conn, sha)
+                if done:
+                    if not self.dry_run:
+                        sv.store_vectors(self.conn, report_id, path, received_ts, *done)
+                    log.info("♻️ reused summary for %s (identical content)", report_id)
+                    self.processed += 1
+                elif sha and sha in pending.by_sha:
+                    pending.members[pending.by_sha[sha]].append(report_id)
+                elif sha and sha in copies:
+                    copies[sha].append(report_id)
+                elif summary := self.cache.get_summary(self.conn, sv.summary_cache_key(sha, map_reduce=False)):
+                    cached.append((report_id, path, received_ts, summary, sha))
+                else:
+                    todo.append((report_id, path, sha))
+                    if sha:
+                        copies[sha] = []
+            await self.finish_cached(cached)
+            known = text_extraction.load_many(self.conn, [sha for _, _, sha in todo])
+
+            # packed as each one finishes, so only the open batch's images are held at once
+            for next_done in asyncio.as_completed([rendered(item, known.get(item[2])) for item in todo]):
+                (report_id, path, sha), result = await next_done
+                if isinstance(result, Exception):
+                    for rid in [report_id, *copies.get(sha, ())]:
+                        self.fail(rid, result)
+                    continue
+                p, pages = result
+                if not self.dry_run:
+                    if sha not in known:
+                        text_extraction.store_pages(self.conn, sha, pages)
+                    chunking.store_chunks(self.conn, sha, chunking.chunk_pages(pages))
+                size = request_size(p)
+                if pending.requests and (len(pending.requests) >= self.max_requests
+                                         or pending.size + size > self.max_bytes):
+                    pending = await self.flush(pending)
+                pending.add(str(report_id), p, report_id, sha, size)
+                pending.members[str(report_id)].extend(copies.get(sha, ()))
+            if self.dry_run:
+                print(f"[DRY RUN] Sized {len(claimed)} of {backlog} pending reports")
+                break
+        await self.flush(pending)
+
+    # ─── COLLECTION ──────────────────────────────────────────────────────────
+    async def collect(self, batch_id: str) -> None:
+        members = batch_members(self.conn, batch_id)
+        results = await rate_limiting.call_with_backoff(
+            lambda: self.apis.claude.messages.batches.results(batch_id)
+        )
+        summaries, errors = {}, {}
+        async for entry in results:
+            if entry.custom_id not in members:
+                continue
+            if entry.result.type == "succeeded":
+                summaries[entry.custom_id] = sv.response_text(entry.result.message.content)
+                usage = entry.result.message.usage
+                metrics.count("tokens", usage.input_tokens, api="claude", kind="input", batch=True)
+                metrics.count("tokens", usage.output_tokens, api="claude", kind="output", batch=True)
+            else:
+                detail = getattr(entry.result, "error", None)
+                errors[entry.custom_id] = f"batch request {entry.result.type}: {detail}"
+        for cid in members.keys() - summaries.keys() - errors.keys():
+            errors[cid] = "missing from batch results"
+
+        # cache the summaries first: a failed embed shouldn't cost a new batch request
+        reports = {cid: sv.fetch_reports(self.conn, members[cid]) for cid in summaries}
+        for cid, rows in reports.items():
+            sha = rows[0][3] if rows else None
+            self.cache.put_summary(self.conn, sv.summary_cache_key(sha, map_reduce=False), sha,
+                                   sv.SUMMARY_MODEL, summaries[cid])
+
+        # one embed call per EMBED_BATCH_SIZE summaries
+        vectors, failed = await api_cache.embed_cached(self.conn, self.cache, self.apis, list(summaries.items()))
+        for cid, e in failed.items():
+            errors[cid] = f"embedding failed: {e}"
+        for cid, emb in vectors.items():
+            for report_id, path, received_ts, _ in reports[cid]:
+                sv.store_vectors(self.conn, report_id, path, received_ts, emb, summaries[cid])
+                self.processed += 1
+            set_item_state(self.conn, members[cid], "done")
+        await self.embed_chunks([rows[0][3] for cid, rows in reports.items() if cid in vectors and rows])
+
+        for cid, error in errors.items():
+            for report_id in members[cid]:
+                self.fail(report_id, error)
+            set_item_state(self.conn, members[cid], "errored")
+        self.conn.execute(
+            "UPDATE summary_batches SET status = 'collected', collected_at = now() WHERE batch_id = %s",
+            (batch_id,),
+        )
+        print(f"✔️ Collected {batch_id}: {len(summaries)} summaries, {len(errors)} errors")
+
+    async def poll(self, wait: bool) -> int:
+        """Collect every ended batch; returns how many are still processing."""
+        while True:
+            still_open = 0
+            for batch_id in open_batches(self.conn):
+                batch = await rate_limiting.call_with_backoff(
+                    lambda: self.apis.claude.messages.batches.retrieve(batch_id)
+                )
+                if batch.processing_status != "ended":
+                    still_open += 1
+                    continue
+                self.conn.execute(
+                    "UPDATE summary_batches SET status = 'ended', ended_at = coalesce(ended_at, now()) "
+                    "WHERE batch_id = %s",
+                    (batch_id,),
+                )
+                await self.collect(batch_id)
+            if not still_open or not wait:
+                return still_open
+            print(f"Waiting on {still_open} batches...")
+            await asyncio.sleep(self.poll_seconds)
+
+    async def run(self) -> None:
+        ensure_schema(self.conn)
+        if not self.dry_run:
+            await self.poll(wait=False)   # whatever finished since the last run
+        await self.submit_pending()
+        if not self.dry_run:
+            still_open = await self.poll(wait=self.wait)
+            if still_open:
+                print(f"{still_open} batches still processing; run again later to collect them")
+        print(f"Batch mode: {self.submitted} reports submitted, {self.processed} ingested")
@@ -0,0 +1,211 @@
+"""
+chunking.py
+
+Reports split into token-budgeted chunks, each with its own vector.
+
+The summary request used to see text[:15000] and nothing else, and a report
+got one embedding (of its summary), so the back half of a long report was
+invisible and search couldn't say where in a report something was. Here the
+extracted pages are cut into chunks of at most CHUNK_TOKENS (estimated)
+tokens: short consecutive pages are packed together, and a long page is
+split at section breaks (blank lines), then lines, then sentences. Chunks
+are stored in report_chunks keyed by content hash, with page range and
+character offsets into the joined document text, and embedded in
+EMBED_BATCH_SIZE calls.
+
+Long reports are summarised map-reduce over groups of chunks
+(summarization_vectorization.map_reduce_summary); group_chunks() makes the
+groups.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import configuration.system_config as sysconfig
+from ai_summary import embeddings, rate_limiting, text_extraction
+from search import pgvector_store
+
+SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+
+class Chunk(NamedTuple):
+    chunk_no: int
+    page_start: int      # 1-based, inclusive
+    page_end: int
+    char_start: int      # offsets into text_extraction.join_pages(pages)
+    char_end: int
+    text: str
+
+
+# ─── SCHEMA ──────────────────────────────────────────────────────────────────
+DDL = """
+CREATE TABLE IF NOT EXISTS report_chunks (
+  content_sha256 TEXT NOT NULL,
+  chunk_no       INT  NOT NULL,
+  page_start     INT  NOT NULL,
+  page_end       INT  NOT NULL,
+  char_start     INT  NOT NULL,
+  char_end       INT  NOT NULL,
+  text           TEXT NOT NULL,
+  embedding      {vector_type},
+  embed_model    TEXT,
+  PRIMARY KEY (content_sha256, chunk_no)
+);
+"""
+
+
+def ensure_schema(cur) -> None:
+    pgvector_store.ensure_extension(cur, "report_chunks")
+    cur.execute(DDL.format(vector_type=pgvector_store.vector_type()))
+    pgvector_store.ensure_storage(cur, "report_chunks")
+
+
+# ─── SPLITTING ───────────────────────────────────────────────────────────────
+def tokens(text: str) -> int:
+    return rate_limiting.estimate_text_tokens(text)
+
+
+def split_spans(text: str, max_tokens: int, start: int = 0, separators: Sequence[str] = SEPARATORS) -> List[Tuple[int, int]]:
+    """(start, end) spans of *text* under *max_tokens* each, cut at the coarsest separator that works."""
+    if tokens(text) <= max_tokens:
+        return [(start, start + len(text))] if text.strip() else []
+    if not separators:
+        # no break left (a table, a URL...): hard cut
+        step = int(max_tokens * rate_limiting.CHARS_PER_TOKEN)
+        return [(start + i, start + min(i + step, len(text))) for i in range(0, len(text), step)]
+    sep, rest = separators[0], separators[1:]
+    spans: List[Tuple[int, int]] = []
+    current: Optional[List[int]] = None
+
+    def flush():
+        if current and text[current[0]:current[1]].strip():
+            spans.append((start + current[0], start + current[1]))
+
+    pos = 0
+    for piece in text.split(sep):
+        # each piece keeps its trailing separator, so nothing falls between chunks
+        a, b = pos, min(pos + len(piece) + len(sep), len(text))
+        pos = b
+        if tokens(text[a:b]) > max_tokens:
+            flush()
+            current = None
+            spans.extend(split_spans(text[a:b], max_tokens, start + a, rest))
+        elif current and tokens(text[current[0]:b]) <= max_tokens:
+            current[1] = b
+        else:
+            flush()
+            current = [a, b]
+    flush()
+    return spans
+
+
+def chunk_pages(pages: Sequence[str], max_tokens: int = sysconfig.CHUNK_TOKENS) -> List[Chunk]:
+    """Chunks of a document given its page texts; page ranges and offsets refer to join_pages(pages)."""
+    full = text_extraction.join_pages(pages)
+    offsets = text_extraction.page_offsets(pages)
+    spans: List[Tuple[int, int, int, int]] = []      # page_start, page_end, char_start, char_end
+    run: Optional[List[int]] = None                   # pages packed into the current chunk
+    for page_no, (start, text) in enumerate(zip(offsets, pages), start=1):
+        end = start + len(text)
+        if run and tokens(full[run[2]:end]) <= max_tokens:
+            run[1], run[3] = page_no, end
+            continue
+        if run:
+            spans.append(tuple(run))
+            run = None
+        if tokens(text) <= max_tokens:
+            if text.strip():
+                run = [page_no, page_no, start, end]
+        else:
+            spans.extend((page_no, page_no, a, b) for a, b in split_spans(text, max_tokens, start))
+    if run:
+        spans.append(tuple(run))
+    return [Chunk(i, ps, pe, a, b, full[a:b]) for i, (ps, pe, a, b) in enumerate(spans)]
+
+
+def group_chunks(chunks: Sequence[Chunk], max_tokens: int = sysconfig.SUMMARY_MAP_TOKENS) -> List[List[Chunk]]:
+    """Consecutive chunks packed into groups of at most *max_tokens*, one map call each."""
+    groups: List[List[Chunk]] = []
+    size = 0
+    for chunk in chunks:
+        n = tokens(chunk.text)
+        if groups and size + n <= max_tokens:
+            groups[-1].append(chunk)
+            size += n
+        else:
+            groups.append([chunk])
+            size = n
+    return groups
+
+
+# ─── STORAGE ─────────────────────────────────────────────────────────────────
+def load_chunks(conn, content_sha256: Optional[str]) -> Optional[List[Chunk]]:
+    if not content_sha256:
+        return None
+    rows = conn.execute(
+        "SELECT chunk_no, page_start, page_end, char_start, char_end, text "
+        "FROM report_chunks WHERE content_sha256 = %s ORDER BY chunk_no",
+        (content_sha256,),
+    ).fetchall()
+    return [Chunk(*r) for r in rows] or None
+
+
+def store_chunks(conn, content_sha256: Optional[str], chunks: Sequence[Chunk]) -> None:
+    if not content_sha256 or not chunks:
+        return
+    with conn.transaction():
+        with conn.cursor() as cur:
+            cur.executemany(
+                """
+                INSERT INTO report_chunks
+                  (content_sha256, chunk_no, page_start, page_end, char_start, char_end, text)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (content_sha256, chunk_no) DO NOTHING
+                """,
+                [(content_sha256, *c) for c in chunks],
+            )
+
+
+def unembedded(
+    conn,
+    shas: Optional[Sequence[str]] = None,
+    model: str = sysconfig.EMBED_MODEL,
+    limit: Optional[int] = None,
+) -> List[Tuple[Tuple[str, int], str]]:
+    """((content_sha256, chunk_no), text) for chunks of *shas* (None = any) with no vector from *model* yet."""
+    rows = conn.execute(
+        """
+        SELECT content_sha256, chunk_no, text
+          FROM report_chunks
+         WHERE (%(shas)s::text[] IS NULL OR content_sha256 = ANY(%(shas)s))
+           AND (embedding IS NULL OR embed_model IS DISTINCT FROM %(model)s)
+         ORDER BY content_sha256, chunk_no
+         LIMIT %(limit)s
+        """,
+        {"shas": None if shas is None else [s for s in shas if s], "model": model, "limit": limit},
+    ).fetchall()
+    return [((sha, no), text) for sha, no, text in rows]
+
+
+def store_embeddings(conn, vectors: Dict[Tuple[str, int], list], model: str = sysconfig.EMBED_MODEL) -> None:
+    if not vectors:
+        return
+    with conn.cursor() as cur:
+        cur.executemany(
+            "UPDATE report_chunks SET embedding = %s, embed_model = %s "
+            "WHERE content_sha256 = %s AND chunk_no = %s",
+            [(emb, model, sha, no) for (sha, no), emb in vectors.items()],
+        )
+
+
+async def embed_pending(conn, apis, shas: Sequence[str], model: str = sysconfig.EMBED_MODEL) -> Dict[Tuple[str, int], Exception]:
+    """
+    Embed every chunk of *shas* that has no vector yet; returns the errors.
+    For callers that own *conn* on the event loop thread.
+    """
+    todo = unembedded(conn, shas, model) if shas else []
+    if not todo:
+        return {}
+    vectors, errors = await embeddings.embed_many(apis, todo, model=model)
+    store_embeddings(conn, vectors, model)
+    return errors
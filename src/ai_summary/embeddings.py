@@ -0,0 +1,167 @@
+"""
+embeddings.py
+
+Batched Voyage embedding calls.
+
+voyage_client.embed takes a list, so rather than one call per summary the
+texts are packed into batches bounded by count (EMBED_BATCH_SIZE) and by
+estimated tokens (EMBED_BATCH_TOKENS), one call each, under the Voyage
+rate limiter. Results come back keyed by whatever the caller passed in
+(a report_id, usually).
+
+If the API rejects a batch outright (one over-long or malformed input is
+enough), the batch is split in half and retried until the bad input is
+isolated; everything else still gets its vector.
+
+* embed_many()      – embed a known set of texts (batch collection, re-embedding)
+* EmbeddingBatcher  – coalesce embed() calls from concurrent workers into
+                      batches, flushing when full or after max_wait seconds
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+import configuration.system_config as sysconfig
+from ai_summary import rate_limiting
+
+
+def plan_batches(
+    texts: Sequence[str],
+    batch_size: int = sysconfig.EMBED_BATCH_SIZE,
+    max_tokens: int = sysconfig.EMBED_BATCH_TOKENS,
+) -> List[List[int]]:
+    """Group text indices into batches within both limits (an over-long text goes alone)."""
+    batches, current, tokens = [], [], 0
+    for i, text in enumerate(texts):
+        n = rate_limiting.estimate_text_tokens(text)
+        if current and (len(current) >= batch_size or tokens + n > max_tokens):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(i)
+        tokens += n
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def embed_batch(
+    apis,
+    keys: Sequence[Hashable],
+    texts: Sequence[str],
+    model: str = sysconfig.EMBED_MODEL,
+    input_type: str = "document",
+) -> Tuple[Dict[Hashable, list], Dict[Hashable, Exception]]:
+    """One embed call for *texts*; on a rejected batch, split and retry the halves."""
+    import voyageai.error as voyage_error
+
+    try:
+        resp = await rate_limiting.embed(
+            apis.voyage, apis.voyage_limits, list(texts), model=model, input_type=input_type
+        )
+    except (voyage_error.InvalidRequestError, voyage_error.MalformedRequestError) as e:
+        if len(texts) == 1:
+            return {}, {keys[0]: e}
+        mid = len(texts) // 2
+        (ok_a, err_a), (ok_b, err_b) = await asyncio.gather(
+            embed_batch(apis, keys[:mid], texts[:mid], model, input_type),
+            embed_batch(apis, keys[mid:], texts[mid:], model, input_type),
+        )
+        return {**ok_a, **ok_b}, {**err_a, **err_b}
+    except Exception as e:
+        return {}, {k: e for k in keys}
+    if len(resp.embeddings) != len(texts):
+        e = RuntimeError(f"embed returned {len(resp.embeddings)} vectors for {len(texts)} inputs")
+        return {}, {k: e for k in keys}
+    return dict(zip(keys, resp.embeddings)), {}
+
+
+async def embed_many(
+    apis,
+    items: Sequence[Tuple[Hashable, str]],
+    model: str = sysconfig.EMBED_MODEL,
+    input_type: str = "document",
+    batch_size: int = sysconfig.EMBED_BATCH_SIZE,
+    max_tokens: int = sysconfig.EMBED_BATCH_TOKENS,
+) -> Tuple[Dict[Hashable, list], Dict[Hashable, Exception]]:
+    """Embed (key, text) pairs; returns ({key: vector}, {key: error})."""
+    keys = [k for k, _ in items]
+    texts = [t for _, t in items]
+    results = await asyncio.gather(*(
+        embed_batch(apis, [keys[i] for i in idx], [texts[i] for i in idx], model, input_type)
+        for idx in plan_batches(texts, batch_size, max_tokens)
+    ))
+    vectors, errors = {}, {}
+    for ok, err in results:
+        vectors.update(ok)
+        errors.update(err)
+    return vectors, errors
+
+
+class EmbeddingBatcher:
+    """
+    Shared by the ingestion workers: each awaits embed(text) for its own
+    summary, and the batcher sends whatever has queued up as one call -
+    as soon as a batch is full, or *max_wait* seconds after the first text
+    arrived. Call close() to flush the tail.
+    """
+
+    def __init__(
+        self,
+        apis,
+        model: str = sysconfig.EMBED_MODEL,
+        batch_size: int = sysconfig.EMBED_BATCH_SIZE,
+        max_tokens: int = sysconfig.EMBED_BATCH_TOKENS,
+        max_wait: float = sysconfig.EMBED_MAX_WAIT,
+    ):
+        self.apis = apis
+        self.model = model
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.max_wait = max_wait
+        self.calls = 0
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._tokens = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set = set()
+
+    async def embed(self, text: str) -> list:
+        n = rate_limiting.estimate_text_tokens(text)
+        if self._pending and self._tokens + n > self.max_tokens:
+            self._flush()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        self._tokens += n
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending, self._tokens = self._pending, [], 0
+        task = asyncio.ensure_future(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        self.calls += 1
+        keys = list(range(len(batch)))
+        vectors, errors = await embed_batch(self.apis, keys, [t for t, _ in batch], self.model)
+        for i, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if i in vectors:
+                future.set_result(vectors[i])
+            else:
+                future.set_exception(errors.get(i) or RuntimeError("no embedding returned"))
+
+    async def close(self) -> None:
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
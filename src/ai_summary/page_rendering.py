@@ -0,0 +1,132 @@
+"""
+page_rendering.py
+
+Page images for the summariser, rendered in small windows so memory stays
+bounded whatever the size of the PDF.
+
+convert_from_path on a whole document holds every page as a full-size PIL
+image at 200 dpi, then PNG- and base64-encodes the lot in memory. Here
+poppler renders a window of RENDER_WINDOW pages straight to JPEG/PNG files
+in a temp dir (scaled so the long edge is RENDER_MAX_EDGE, the size the
+API downsamples to anyway), and each file is read, base64-encoded and
+deleted one at a time. Windows run in a shared process pool, so pages of
+one document and pages of different documents render in parallel.
+Only the first RENDER_MAX_PAGES pages are rendered; the text layer still
+covers the rest.
+"""
+from __future__ import annotations
+
+import atexit
+import base64
+import io
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Optional
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+import configuration.system_config as sysconfig
+from helpers import metrics
+
+MEDIA_TYPES = {"jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+
+
+class PageImage(NamedTuple):
+    page: int
+    media_type: str
+    data: str          # base64
+
+
+def page_count(pdf_path: str, poppler_path: Optional[str] = sysconfig.POPPLER_PATH) -> int:
+    return int(pdfinfo_from_path(pdf_path, poppler_path=poppler_path or None)["Pages"])
+
+
+def render_window(
+    pdf_path: str,
+    first: int,
+    last: int,
+    fmt: str = sysconfig.RENDER_FORMAT,
+    max_edge: Optional[int] = sysconfig.RENDER_MAX_EDGE,
+    dpi: int = sysconfig.RENDER_DPI,
+    quality: int = sysconfig.RENDER_QUALITY,
+    poppler_path: Optional[str] = sysconfig.POPPLER_PATH,
+) -> List[PageImage]:
+    """Render pages first..last (1-based, inclusive). Runs in a pool worker."""
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"unsupported page image format: {fmt!r}")
+    out = []
+    with tempfile.TemporaryDirectory(prefix="pages-") as tmp:
+        paths = convert_from_path(
+            pdf_path,
+            dpi=dpi,
+            size=max_edge,                    # long edge, aspect kept; overrides dpi
+            first_page=first,
+            last_page=last,
+            output_folder=tmp,
+            paths_only=True,                  # poppler writes files; nothing decoded here
+            fmt="png" if fmt == "webp" else fmt,
+            jpegopt={"quality": quality, "optimize": True} if fmt == "jpeg" else None,
+            poppler_path=poppler_path or None,
+        )
+        for page, path in enumerate(paths, start=first):
+            if fmt == "webp":
+                from PIL import Image
+
+                with Image.open(path) as img:
+                    buf = io.BytesIO()
+                    img.save(buf, format="WEBP", quality=quality)
+                    raw = buf.getvalue()
+            else:
+                with open(path, "rb") as f:
+                    raw = f.read()
+            os.remove(path)
+            out.append(PageImage(page, MEDIA_TYPES[fmt], base64.b64encode(raw).decode("ascii")))
+    return out
+
+
+# ─── POOL ────────────────────────────────────────────────────────────────────
+# one pool of PDF_WORKERS processes for all CPU-bound PDF work (rendering
+# here, text extraction in text_extraction)
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=sysconfig.PDF_WORKERS or os.cpu_count() or 1)
+    return _pool
+
+
+@atexit.register
+def shutdown_pdf_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def render_pages(
+    pdf_path: str,
+    max_pages: Optional[int] = sysconfig.RENDER_MAX_PAGES,
+    window: int = sysconfig.RENDER_WINDOW,
+    pool: Optional[ProcessPoolExecutor] = None,
+    **opts,
+) -> List[PageImage]:
+    """
+    Page images for *pdf_path*, in page order. Windows of *window* pages
+    are rendered concurrently on *pool* (the shared pool by default).
+    """
+    pool = pool or get_pdf_pool()
+    with metrics.timer("render"):
+        last_page = page_count(pdf_path, opts.get("poppler_path", sysconfig.POPPLER_PATH))
+        if max_pages:
+            last_page = min(last_page, max_pages)
+        futures = [
+            pool.submit(render_window, pdf_path, first, min(first + window - 1, last_page), **opts)
+            for first in range(1, last_page + 1, window)
+        ]
+        images = [img for fut in futures for img in fut.result()]
+    metrics.count("pages", len(images), stage="render")
+    metrics.count("bytes", sum(len(img.data) * 3 // 4 for img in images), stage="render")
+    return images
@@ -0,0 +1,333 @@
+"""
+rate_limiting.py
+
+Client-side rate limiting for the Anthropic and Voyage APIs.
+
+Both APIs meter requests per minute and tokens per minute. Instead of a
+fixed pause between reports, every call reserves its estimated cost from a
+set of token buckets (requests, input tokens, output tokens) and only waits
+as long as the buckets say it must. When the response arrives the estimate
+is settled against the real usage, so unused output budget is handed back
+to the next caller straight away.
+
+A 429 pauses every caller on that limiter for the server's retry-after (or
+a jittered backoff), and the rate-limit headers Anthropic sends back are
+used to pull the local buckets down if the server sees less headroom than
+we do (other processes sharing the key, for instance).
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import math
+import struct
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+import configuration.system_config as system_config
+from helpers import metrics
+from helpers.downloader_helpers import backoff_delay
+
+# ─── TOKEN ESTIMATES ─────────────────────────────────────────────────────────
+CHARS_PER_TOKEN = 3.5          # errs high for English prose; better to wait than 429
+IMAGE_PIXELS_PER_TOKEN = 750
+IMAGE_MAX_EDGE = 1568          # the API scales images down to fit these
+IMAGE_MAX_PIXELS = 1_150_000
+
+
+def estimate_text_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def image_size(b64: str) -> Optional[Tuple[int, int]]:
+    """
+    (width, height) of a base64 PNG, JPEG or WebP, read from its header
+    without decoding the image; None if the format isn't recognised.
+    """
+    head = base64.b64decode(b64[:44])
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", head[16:24])
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        chunk = head[12:16]
+        if chunk == b"VP8 ":
+            w, h = struct.unpack("<HH", head[26:30])
+            return w & 0x3FFF, h & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(head[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+        return None
+    if head[:2] == b"\xff\xd8":
+        # walk the JPEG markers to the start-of-frame; it sits after the
+        # (usually small) quantisation/Huffman tables
+        data = base64.b64decode(b64[:87_384])
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xFF:
+                return None
+            marker = data[i + 1]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                h, w = struct.unpack(">HH", data[i + 5:i + 9])
+                return w, h
+            i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    scale = min(1.0, IMAGE_MAX_EDGE / max(width, height), math.sqrt(IMAGE_MAX_PIXELS / (width * height)))
+    return math.ceil(width * scale * height * scale / IMAGE_PIXELS_PER_TOKEN)
+
+
+def estimate_input_tokens(blocks: Iterable[Mapping]) -> int:
+    """Rough input-token count for a list of message content blocks."""
+    total = 0
+    for block in blocks:
+        if block.get("type") == "text":
+            total += estimate_text_tokens(block["text"])
+        elif block.get("type") == "image":
+            size = image_size(block["source"]["data"])
+            # unknown formats: assume a full-size page
+            total += estimate_image_tokens(*size) if size else estimate_image_tokens(IMAGE_MAX_EDGE, IMAGE_MAX_EDGE)
+    return total
+
+
+# ─── BUCKETS ─────────────────────────────────────────────────────────────────
+class TokenBucket:
+    """
+    Classic token bucket: *per_period* tokens refill evenly over *period*
+    seconds, up to a burst of *per_period*. The level may go negative when
+    a request turns out to cost more than was reserved; later callers then
+    wait the debt off.
+    """
+
+    def __init__(self, per_period: float, period: float = 60.0, clock=time.monotonic):
+        self.capacity = float(per_period)
+        self.rate = per_period / period
+        self.clock = clock
+        self.level = self.capacity
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, n: float) -> float:
+        """Seconds until *n* tokens are available (requests larger than the burst wait for a full bucket)."""
+        self._refill()
+        need = min(n, self.capacity) - self.level
+        return max(0.0, need / self.rate)
+
+    def take(self, n: float) -> None:
+        self._refill()
+        self.level -= n
+
+    def give(self, n: float) -> None:
+        self._refill()
+        self.level = min(self.capacity, self.level + n)
+
+    def clamp(self, remaining: float) -> None:
+        self._refill()
+        self.level = min(self.level, remaining)
+
+
+@dataclass
+class Reservation:
+    costs: Dict[str, float]
+    waited: float = 0.0
+
+
+@dataclass
+class LimiterStats:
+    calls: int = 0
+    throttled: int = 0        # 429 / overloaded responses
+    waited: float = 0.0       # seconds spent waiting on buckets or back-offs
+    tokens: Dict[str, float] = field(default_factory=dict)
+
+
+class RateLimiter:
+    """
+    A set of named buckets shared by every coroutine calling one API.
+
+    acquire() waits in FIFO order until all buckets can cover the request,
+    so a big request at the head of the line isn't starved by small ones.
+    """
+
+    # Anthropic rate-limit headers → bucket names
+    HEADERS = {
+        "requests": "anthropic-ratelimit-requests-remaining",
+        "input": "anthropic-ratelimit-input-tokens-remaining",
+        "output": "anthropic-ratelimit-output-tokens-remaining",
+    }
+
+    def __init__(self, name: str, period: float = 60.0, clock=time.monotonic, **per_period: Optional[float]):
+        self.name = name
+        self.clock = clock
+        self.buckets = {k: TokenBucket(v, period, clock) for k, v in per_period.items() if v}
+        self.blocked_until = 0.0
+        self.stats = LimiterStats()
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self, **costs: float) -> Reservation:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        start = self.clock()
+        async with self._lock:
+            while True:
+                wait = self.blocked_until - self.clock()
+                for key, bucket in self.buckets.items():
+                    wait = max(wait, bucket.delay(costs.get(key, 0)))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            for key, bucket in self.buckets.items():
+                bucket.take(costs.get(key, 0))
+        waited = self.clock() - start
+        self.stats.calls += 1
+        self.stats.waited += waited
+        return Reservation(dict(costs), waited)
+
+    def settle(self, reservation: Reservation, **actual: float) -> None:
+        """Replace the reserved estimate with what the call really used."""
+        for key, bucket in self.buckets.items():
+            if key in actual:
+                bucket.give(reservation.costs.get(key, 0) - actual[key])
+                self.stats.tokens[key] = self.stats.tokens.get(key, 0) + actual[key]
+
+    def back_off(self, seconds: float) -> None:
+        self.stats.throttled += 1
+        self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """Pull buckets down to the headroom the server reports."""
+        for key, header in self.HEADERS.items():
+            value = headers.get(header)
+            if key in self.buckets and value is not None:
+                try:
+                    self.buckets[key].clamp(float(value))
+                except ValueError:
+                    pass
+
+    def summary(self) -> str:
+        s = self.stats
+        used = ", ".join(f"{k}={v:,.0f}" for k, v in s.tokens.items())
+        return f"{self.name}: {s.calls} calls, {s.throttled} throttled, {s.waited:.1f}s waiting ({used})"
+
+
+def retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+# ─── API CALLS ───────────────────────────────────────────────────────────────
+def claude_limiter(period: float = 60.0) -> RateLimiter:
+    return RateLimiter(
+        "claude",
+        period,
+        requests=system_config.CLAUDE_RPM,
+        input=system_config.CLAUDE_INPUT_TPM,
+        output=system_config.CLAUDE_OUTPUT_TPM,
+    )
+
+
+def voyage_limiter(period: float = 60.0) -> RateLimiter:
+    return RateLimiter(
+        "voyage",
+        period,
+        requests=system_config.VOYAGE_RPM,
+        input=system_config.VOYAGE_TPM,
+    )
+
+
+async def create_message(
+    client,
+    limiter: RateLimiter,
+    attempts: int = system_config.API_MAX_ATTEMPTS,
+    **kwargs,
+):
+    """
+    anthropic AsyncAnthropic.messages.create under *limiter*. Output tokens
+    are reserved at max_tokens and settled from the response's usage.
+    """
+    import anthropic
+
+    blocks = [b for m in kwargs["messages"] for b in (m["content"] if isinstance(m["content"], list)
+                                                      else [{"type": "text", "text": m["content"]}])]
+    costs = {"requests": 1, "input": estimate_input_tokens(blocks), "output": kwargs["max_tokens"]}
+    for attempt in range(attempts):
+        res = await limiter.acquire(**costs)
+        metrics.count("wait_seconds", res.waited, api="claude")
+        try:
+            with metrics.timer("claude", model=kwargs.get("model")):
+                raw = await client.messages.with_raw_response.create(**kwargs)
+        except (anthropic.APIStatusError, anthropic.APIConnectionError, anthropic.APITimeoutError) as e:
+            # a dropped connection or a timeout is retried like a 5xx
+            limiter.settle(res, input=0, output=0)
+            status = getattr(e, "status_code", None)
+            if (status is not None and status != 429 and status < 500) or attempt == attempts - 1:
+                raise
+            metrics.count("retries", stage="claude", status=status or type(e).__name__)
+            limiter.back_off(retry_after(e.response.headers if status else None) or backoff_delay(
+                attempt, system_config.API_BACKOFF_BASE, system_config.API_BACKOFF_CAP))
+            continue
+        msg = raw.parse()
+        limiter.settle(res, input=msg.usage.input_tokens, output=msg.usage.output_tokens)
+        metrics.count("tokens", msg.usage.input_tokens, api="claude", kind="input")
+        metrics.count("tokens", msg.usage.output_tokens, api="claude", kind="output")
+        limiter.observe(raw.headers)
+        return msg
+
+
+async def embed(
+    client,
+    limiter: RateLimiter,
+    texts: list,
+    attempts: int = system_config.API_MAX_ATTEMPTS,
+    **kwargs,
+):
+    """voyageai AsyncClient.embed under *limiter*."""
+    import voyageai.error as voyage_error
+
+    costs = {"requests": 1, "input": sum(estimate_text_tokens(t) for t in texts)}
+    for attempt in range(attempts):
+        res = await limiter.acquire(**costs)
+        metrics.count("wait_seconds", res.waited, api="voyage")
+        try:
+            with metrics.timer("embed", model=kwargs.get("model")):
+                resp = await client.embed(texts, **kwargs)
+        except (voyage_error.RateLimitError, voyage_error.ServiceUnavailableError, voyage_error.ServerError,
+                voyage_error.APIConnectionError, voyage_error.Timeout) as e:
+            limiter.settle(res, input=0)
+            if attempt == attempts - 1:
+                raise
+            metrics.count("retries", stage="embed", error=type(e).__name__)
+            limiter.back_off(retry_after(e.headers) or backoff_delay(
+                attempt, system_config.API_BACKOFF_BASE, system_config.API_BACKOFF_CAP))
+            continue
+        limiter.settle(res, input=resp.total_tokens)
+        metrics.count("tokens", resp.total_tokens, api="voyage", kind="input")
+        metrics.count("texts", len(texts), stage="embed")
+        return resp
+
+
+async def call_with_backoff(fn, attempts: int = system_config.API_MAX_ATTEMPTS):
+    """
+    Await fn() with the same 429/5xx/connection retry policy as
+    create_message, for calls that aren't metered by a limiter (batch
+    create/retrieve/results).
+    """
+    import anthropic
+
+    for attempt in range(attempts):
+        try:
+            return await fn()
+        except (anthropic.APIStatusError, anthropic.APIConnectionError, anthropic.APITimeoutError) as e:
+            status = getattr(e, "status_code", None)
+            if (status is not None and status != 429 and status < 500) or attempt == attempts - 1:
+                raise
+            await asyncio.sleep(retry_after(e.response.headers if status else None) or backoff_delay(
+                attempt, system_config.API_BACKOFF_BASE, system_config.API_BACKOFF_CAP))
@@ -1,21 +1,37 @@
 #!/usr/bin/env python3
 # ingest_reports.py
 """
-Simple PDF ingestion and vectorization pipeline with print logging.
+PDF ingestion and vectorization pipeline: summarise, tag and embed every
+report waiting in the ingest queue.
 Run `ingest_and_vectorize_reports(dry_run=True)` from your REPL or another script.
+
+Reports are claimed from the queue and summarised several at a time on
+async Anthropic/Voyage clients, paced by the token buckets in
+rate_limiting (which also does the retrying) rather than a fixed pause.
+Reports too long for one request are summarised map-reduce over their
+chunks (see chunking), and every chunk gets its own vector. mode="batch"
+hands backfills to the Message Batches API instead (see batch_summaries).
+
+Run totals are printed; per-report detail and failures go to the module
+logger (`run.py -v` for DEBUG).
 """
+from __future__ import annotations
+
 import os
-import io
-import base64
-import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 
 import psycopg
 import psycopg.errors
 import anthropic
 import voyageai
-from PyPDF2 import PdfReader
-from pdf2image import convert_from_path
 from configuration import system_config as sysconfig
+from helpers import metrics
+from helpers.job_queue import INGEST_QUEUE
+from ai_summary import api_cache, chunking, embeddings, page_rendering, rate_limiting, tagging, text_extraction
+from search import pgvector_store
 
 # ─── Configuration ─────────────────────────────────────────────────────────────
 DSN = sysconfig.DSN               # Postgres connection info (string or dict)
@@ -23,51 +39,76 @@ CLAUDE_KEY = sysconfig.API_KEY     # Anthropic API key
 VOYAGE_KEY = sysconfig.VOYAGE_KEY  # Voyage API key
 POPPLER_PATH = sysconfig.POPPLER_PATH  # Path to poppler binaries
 
+log = logging.getLogger(__name__)
+
 # ─── Initialize clients ─────────────────────────────────────────────────────────
-claude_client = anthropic.Anthropic(api_key=CLAUDE_KEY)
-voyage_client = voyageai.Client(api_key=VOYAGE_KEY)
+@dataclass
+class Apis:
+    """API clients and the limiters that pace them; pass your own to point at stubs."""
+    claude: object
+    voyage: object
+    claude_limits: rate_limiting.RateLimiter
+    voyage_limits: rate_limiting.RateLimiter
+
+
+def default_apis() -> Apis:
+    return Apis(
+        # retries are ours (rate_limiting), so the SDKs' own are switched off
+        claude=anthropic.AsyncAnthropic(api_key=CLAUDE_KEY, base_url=sysconfig.ANTHROPIC_BASE_URL, max_retries=0),
+        voyage=voyageai.AsyncClient(api_key=VOYAGE_KEY, base_url=sysconfig.VOYAGE_BASE_URL),
+        claude_limits=rate_limiting.claude_limiter(),
+        voyage_limits=rate_limiting.voyage_limiter(),
+    )
 
 # ─── Helpers ───────────────────────────────────────────────────────────────────
+SUMMARY_PROMPT = (
+    "You are a rates trader. Summarise this PDF into subsections with no opinions, "
+    "then tag it by country, region, topic, impact and macro. Record both with the "
+    "record_summary tool."
+)
+SUMMARY_MODEL = "claude-sonnet-4-20250514"
+SUMMARY_MAX_TOKENS = 3000
+SUMMARY_TEMPERATURE = 0.6
+SUMMARY_TEXT_CHARS = 15000   # longer reports go map-reduce (batch mode truncates)
+MAP_PROMPT = (
+    "You are a rates trader. Below are pages {first}-{last} of a longer research report. "
+    "Write concise notes on what they say: views, forecasts, figures, trade ideas and the "
+    "reasoning behind them, with no opinions of your own. Notes only, no tags."
+)
+
+
 def extract_text(pdf_path: str) -> str:
-    print(f"Extracting text from {pdf_path}")
-    reader = PdfReader(pdf_path)
-    return "\n".join(page.extract_text() or "" for page in reader.pages)
+    return text_extraction.join_pages(text_extraction.extract_pages(pdf_path))
 
 
-def pdf_images_to_base64(pdf_path: str) -> list[str]:
-    print(f"Converting all pages of {pdf_path} to images")
-    images = convert_from_path(
-        pdf_path,
-        poppler_path=POPPLER_PATH or None
-    )
-    encoded = []
-    for img in images:
-        buf = io.BytesIO()
-        img.save(buf, format='PNG')
-        encoded.append(base64.b64encode(buf.getvalue()).decode('utf-8'))
-    return encoded
+def pdf_images_to_base64(pdf_path: str) -> list[page_rendering.PageImage]:
+    log.debug("rendering pages of %s", pdf_path)
+    return page_rendering.render_pages(pdf_path, poppler_path=POPPLER_PATH)
+
 
-def query_claude(text: str, images_b64: list[str], prompt: str) -> str:
-    print("Querying Claude for summary")
+def summary_blocks(
+    text: str, images: list[page_rendering.PageImage], prompt: str, text_chars: int | None = SUMMARY_TEXT_CHARS
+) -> list[dict]:
     blocks = []
     if text:
-        blocks.append({"type": "text", "text": text[:15000]})
-    for img in images_b64:
-        blocks.append({"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": img}})
+        blocks.append({"type": "text", "text": text[:text_chars] if text_chars else text})
+    for img in images:
+        blocks.append({"type": "image", "source": {"type": "base64", "media_type": img.media_type, "data": img.data}})
     blocks.append({"type": "text", "text": prompt})
+    return blocks
 
-    resp = claude_client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=3000,
-        temperature=0.6,
-        messages=[{"role": "user", "content": blocks}]
-    )
-    summary = resp.content
+
+def response_text(summary) -> str:
     # Ensure summary is a plain string
     if isinstance(summary, list):
         lines = []
         for item in summary:
-            if hasattr(item, 'text'):
+            if getattr(item, 'type', None) == 'tool_use':
+                # record_summary: summary plus a normalised Tags block
+                lines.append(tagging.summary_from_tool(item.input))
+            elif isinstance(item, dict) and item.get('type') == 'tool_use':
+                lines.append(tagging.summary_from_tool(item.get('input')))
+            elif hasattr(item, 'text'):
                 lines.append(item.text)
             elif isinstance(item, dict) and 'text' in item:
                 lines.append(item['text'])
@@ -77,84 +118,538 @@ def query_claude(text: str, images_b64: list[str], prompt: str) -> str:
     return summary
 
 
+def summary_params(
+    text: str,
+    images_b64: list[page_rendering.PageImage],
+    prompt: str | None = None,
+    text_chars: int | None = SUMMARY_TEXT_CHARS,
+) -> dict:
+    """messages.create arguments for one report (also the params of a batch request)."""
+    prompt = prompt or SUMMARY_PROMPT
+    return dict(
+        model=SUMMARY_MODEL,
+        max_tokens=SUMMARY_MAX_TOKENS,
+        temperature=SUMMARY_TEMPERATURE,
+        tools=[tagging.SUMMARY_TOOL],
+        tool_choice=tagging.TOOL_CHOICE,
+        messages=[{"role": "user", "content": summary_blocks(text, images_b64, prompt, text_chars)}]
+    )
+
+
+def section_params(group: list[chunking.Chunk]) -> dict:
+    """messages.create arguments for the map step over one group of chunks."""
+    first, last = group[0].page_start, group[-1].page_end
+    text = "\n".join(c.text for c in group)
+    return dict(
+        model=SUMMARY_MODEL,
+        max_tokens=sysconfig.SUMMARY_MAP_MAX_TOKENS,
+        temperature=SUMMARY_TEMPERATURE,
+        messages=[{"role": "user", "content": [
+            {"type": "text", "text": text},
+            {"type": "text", "text": MAP_PROMPT.format(first=first, last=last)},
+        ]}]
+    )
+
+
+def summary_cache_key(content_sha256: str | None, prompt: str | None = None, map_reduce: bool = True) -> str | None:
+    """
+    summary_cache key: the PDF's bytes plus everything summary_params() sends
+    with them, and how long reports are handled (map-reduce, or truncated
+    as batch mode does).
+    """
+    long_reports = ([MAP_PROMPT, sysconfig.CHUNK_TOKENS, sysconfig.SUMMARY_MAP_TOKENS,
+                     sysconfig.SUMMARY_MAP_MAX_TOKENS] if map_reduce else "truncate")
+    return api_cache.summary_key(
+        content_sha256,
+        prompt=prompt or SUMMARY_PROMPT,
+        model=SUMMARY_MODEL,
+        max_tokens=SUMMARY_MAX_TOKENS,
+        temperature=SUMMARY_TEMPERATURE,
+        tool=tagging.SUMMARY_TOOL,
+        text_chars=SUMMARY_TEXT_CHARS,
+        images=[sysconfig.RENDER_MAX_PAGES, sysconfig.RENDER_MAX_EDGE, sysconfig.RENDER_DPI,
+                sysconfig.RENDER_FORMAT, sysconfig.RENDER_QUALITY],
+        long_reports=long_reports,
+    )
+
+
+async def query_claude(
+    apis: Apis,
+    text: str,
+    images_b64: list[page_rendering.PageImage],
+    prompt: str,
+    text_chars: int | None = SUMMARY_TEXT_CHARS,
+) -> str:
+    log.debug("querying Claude for summary")
+    resp = await rate_limiting.create_message(
+        apis.claude, apis.claude_limits, **summary_params(text, images_b64, prompt, text_chars)
+    )
+    return response_text(resp.content)
+
+
+async def map_reduce_summary(
+    apis: Apis, chunks: list[chunking.Chunk], images_b64: list[page_rendering.PageImage], prompt: str
+) -> str:
+    """
+    Summary of a report too long for one request: each group of chunks is
+    condensed to notes (all groups at once, paced by the limiter), then the
+    notes - in page order - go in with the page images and the usual prompt.
+    """
+    groups = chunking.group_chunks(chunks)
+    log.debug("querying Claude for %d section notes", len(groups))
+
+    async def section(group):
+        resp = await rate_limiting.create_message(apis.claude, apis.claude_limits, **section_params(group))
+        return f"[pages {group[0].page_start}-{group[-1].page_end}]\n{response_text(resp.content)}"
+
+    notes = await asyncio.gather(*(section(g) for g in groups))
+    text = "Notes on each section of the report, in page order:\n\n" + "\n\n".join(notes)
+    return await query_claude(apis, text, images_b64, prompt, text_chars=None)
 
-def get_embedding(text: str) -> list[float]:
-    print("Getting embedding from Voyage")
-    resp = voyage_client.embed([text], model="voyage-large-2", input_type="document")
+
+async def get_embedding(apis: Apis, text: str) -> list[float]:
+    log.debug("getting embedding from Voyage")
+    resp = await rate_limiting.embed(
+        apis.voyage, apis.voyage_limits, [text], model=sysconfig.EMBED_MODEL, input_type="document"
+    )
     return resp.embeddings[0]
 
-# ─── Pipeline ─────────────────────────────────────────────────────────────────
-def ingest_and_vectorize_reports(dry_run: bool = False):
-    print(f"-------------- Starting ingestion: dry_run={dry_run} ----------------------")
-    # Connect using dict or connection string
-    if isinstance(DSN, dict):
-        conn = psycopg.connect(**DSN, autocommit=True)
-    else:
-        conn = psycopg.connect(DSN, autocommit=True)
-    cur = conn.cursor()
+# ─── Database ──────────────────────────────────────────────────────────────────
+# Reports without vectors are queued in ingest_jobs; each worker claims a few
+# at a time with SKIP LOCKED, so several ingestion processes can run at once.
+ENQUEUE_SQL = """
+SELECT r.report_id, r.bank_tag
+  FROM reports r
+ WHERE NOT EXISTS (SELECT 1 FROM report_vectors v WHERE v.report_id = r.report_id)
+"""
 
-    # Ensure report_vectors table exists
-    print("Ensuring 'report_vectors' table exists...")
+
+def ensure_report_vectors(cur) -> None:
+    pgvector_store.ensure_extension(cur, "report_vectors")
     cur.execute(
-        """
+        f"""
         CREATE TABLE IF NOT EXISTS report_vectors (
             report_id UUID PRIMARY KEY,
             report_path TEXT NOT NULL,
             email_received_ts TIMESTAMP WITH TIME ZONE,
-            embedding DOUBLE PRECISION[],
+            embedding {pgvector_store.vector_type()},
             summary TEXT
         );
+        -- when the row landed, so search indexes can pick up only what's new
+        ALTER TABLE report_vectors
+          ADD COLUMN IF NOT EXISTS ingested_at TIMESTAMPTZ NOT NULL DEFAULT now();
+        CREATE INDEX IF NOT EXISTS idx_report_vectors_ingested
+          ON report_vectors(ingested_at, report_id);
+        -- when the embedding was last written (reembed_reports moves it on)
+        ALTER TABLE report_vectors
+          ADD COLUMN IF NOT EXISTS embedded_at TIMESTAMPTZ NOT NULL DEFAULT now();
+        CREATE INDEX IF NOT EXISTS idx_report_vectors_embedded
+          ON report_vectors(embedded_at, report_id);
+        -- full-text index over the summaries (search.hybrid_search)
+        ALTER TABLE report_vectors
+          ADD COLUMN IF NOT EXISTS summary_tsv tsvector
+          GENERATED ALWAYS AS (to_tsvector('{sysconfig.FTS_CONFIG}', coalesce(summary, ''))) STORED;
+        CREATE INDEX IF NOT EXISTS idx_report_vectors_summary_tsv
+          ON report_vectors USING gin (summary_tsv);
         """
     )
+    pgvector_store.ensure_storage(cur, "report_vectors")
 
-    # Fetch reports that haven't been vectorized yet
-    cur.execute(
+
+def enqueue_reports(conn, keys=None) -> int:
+    """Queue (report_id, bank_tag) pairs, or every report without vectors when *keys* is None."""
+    with conn.cursor() as cur:
+        if keys is None:
+            return INGEST_QUEUE.enqueue_query(cur, ENQUEUE_SQL)
+        INGEST_QUEUE.enqueue(cur, keys)
+        return len(keys)
+
+
+def fetch_reports(conn, report_ids: list) -> list:
+    return conn.execute(
         """
-        SELECT r.report_id, r.report_path, e.received_ts
+        SELECT r.report_id, r.report_path, e.received_ts, r.content_sha256
           FROM reports r
           JOIN emails_final e ON r.entry_id = e.entry_id
-         WHERE r.report_id NOT IN (SELECT report_id FROM report_vectors)
+         WHERE r.report_id = ANY(%s)
          ORDER BY r.downloaded_at;
+        """,
+        (report_ids,)
+    ).fetchall()
+
+
+def claim_reports(conn, batch: int, dry_run: bool) -> tuple[int, list]:
+    """
+    (jobs claimed, rows to process). The rows can be fewer - or none - when
+    a claimed report or its email is gone, so whether the queue is drained
+    is the first number's call, not the rows'.
+    """
+    with conn.cursor() as cur:
+        # a dry run only looks at what's runnable; it never takes leases
+        claimed = INGEST_QUEUE.peek(cur, 10**6) if dry_run else INGEST_QUEUE.claim(cur, batch)
+        if not claimed:
+            return 0, []
+        rows = fetch_reports(conn, [r for r, _ in claimed])
+        if not dry_run:
+            found = {row[0] for row in rows}
+            for report_id, _ in claimed:
+                if report_id not in found:
+                    INGEST_QUEUE.fail(cur, report_id, "report or its email row missing")
+    return len(claimed), rows
+
+
+def find_reusable(conn, content_sha256):
+    """(embedding, summary) already stored for a report with the same bytes."""
+    if not content_sha256:
+        return None
+    return conn.execute(
         """
-    )
-    rows = cur.fetchall()
-    if not rows:
-        print("No new reports to ingest.")
-        cur.close()
-        conn.close()
-        return
-
-    for report_id, path, received_ts in rows:
-        print(f"Processing report_id={report_id}, path={path}, received_ts={received_ts}")
-        text = extract_text(path)
-        images = pdf_images_to_base64(path)
-        summary = query_claude(
-            text,
-            images,
-            "You are a rates trader. Summarise this PDF into subsections with no opinions, then output topical tags: country, region, topic, impact, macro."
+        SELECT v.embedding::real[], v.summary
+          FROM report_vectors v
+          JOIN reports r ON r.report_id = v.report_id
+         WHERE r.content_sha256 = %s
+         LIMIT 1;
+        """,
+        (content_sha256,)
+    ).fetchone()
+
+
+def store_vectors(conn, report_id, path, received_ts, emb, summary):
+    # the vectors row and the job's done flag land together or not at all
+    with metrics.timer("vector_insert", trace={"report_id": report_id}), conn.transaction():
+        conn.execute(
+            """
+            INSERT INTO report_vectors
+              (report_id, report_path, email_received_ts, embedding, summary)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (report_id) DO NOTHING;
+            """,
+            (report_id, path, received_ts, emb, summary)
         )
-        emb = get_embedding(summary)
+        tagging.store_tags(conn, report_id, tagging.parse_tags(summary))
+        with conn.cursor() as cur:
+            INGEST_QUEUE.done(cur, report_id)
+
+
+def fail_report(conn, report_id, error) -> str:
+    with conn.cursor() as cur:
+        return INGEST_QUEUE.fail(cur, report_id, error)
+
+# ─── Pipeline ─────────────────────────────────────────────────────────────────
+class Ingestion:
+    """
+    One ingestion run. Up to *concurrency* reports are in flight; PDF work
+    runs on worker threads and every database call goes through a single
+    db thread, so the one connection is never used from two places at once.
+    """
+
+    def __init__(self, conn, apis: Apis, dry_run: bool, batch: int, concurrency: int):
+        self.conn = conn
+        self.apis = apis
+        self.dry_run = dry_run
+        self.batch = batch
+        self.concurrency = concurrency
+        self.processed = 0
+        self.failed = 0
+        self._db = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+        # summaries from all workers share embed calls
+        self.embedder = embeddings.EmbeddingBatcher(apis)
+        self.cache = api_cache.ApiCache(read_only=dry_run)
+        # content hash -> summary/embedding being produced right now
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    async def db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._db, fn, self.conn, *args)
+
+    async def pages(self, path, content_sha256) -> list[str]:
+        # parsed once per distinct PDF; later runs read report_pages
+        pages = await self.db(text_extraction.load_pages, content_sha256)
+        if pages is None:
+            pages = await asyncio.to_thread(text_extraction.extract_pages, path)
+            if not self.dry_run:
+                await self.db(text_extraction.store_pages, content_sha256, pages)
+        return pages
+
+    async def embed_chunks(self, content_sha256) -> None:
+        """Vectors for this report's chunks that don't have one yet (shares the embed batches)."""
+        todo = await self.db(chunking.unembedded, [content_sha256])
+        if not todo:
+            return
+        results = await asyncio.gather(*(self.embedder.embed(text) for _, text in todo), return_exceptions=True)
+        vectors = {key: emb for (key, _), emb in zip(todo, results) if not isinstance(emb, BaseException)}
+        await self.db(chunking.store_embeddings, vectors)
+        if len(vectors) < len(todo):
+            error = next(e for e in results if isinstance(e, BaseException))
+            raise RuntimeError(f"{len(todo) - len(vectors)} of {len(todo)} chunk embeddings failed: {error}")
+
+    async def embed(self, text: str) -> list[float]:
+        key = api_cache.embedding_key(text, sysconfig.EMBED_MODEL)
+        found = await self.db(self.cache.get_embeddings, [key])
+        if key in found:
+            return found[key]
+        log.debug("getting embedding from Voyage")
+        emb = await self.embedder.embed(text)
+        await self.db(self.cache.put_embeddings, [(key, sysconfig.EMBED_MODEL, "document", emb)])
+        return emb
 
-        if dry_run:
+    async def summarise(self, path, content_sha256) -> tuple[list[float], str]:
+        key = summary_cache_key(content_sha256)
+        summary = await self.db(self.cache.get_summary, key)
+
+        pages = None
+        chunks = await self.db(chunking.load_chunks, content_sha256)
+        if chunks is None:
+            pages = await self.pages(path, content_sha256)
+            chunks = chunking.chunk_pages(pages)
+            if not self.dry_run:
+                await self.db(chunking.store_chunks, content_sha256, chunks)
+        # chunk vectors are only kept for stored chunks
+        chunk_vectors = None
+        if content_sha256 and not self.dry_run:
+            chunk_vectors = asyncio.ensure_future(self.embed_chunks(content_sha256))
+
+        try:
+            if summary is None:
+                text = text_extraction.join_pages(pages or await self.pages(path, content_sha256))
+                images = await asyncio.to_thread(pdf_images_to_base64, path)
+                if len(text) <= SUMMARY_TEXT_CHARS:
+                    summary = await query_claude(self.apis, text, images, SUMMARY_PROMPT)
+                else:
+                    summary = await map_reduce_summary(self.apis, chunks, images, SUMMARY_PROMPT)
+                await self.db(self.cache.put_summary, key, content_sha256, SUMMARY_MODEL, summary)
+            else:
+                log.debug("summary for %s found in cache", path)
+            emb = await self.embed(summary)
+        except BaseException:
+            if chunk_vectors is not None:
+                chunk_vectors.cancel()   # the retry redoes whatever's missing
+            raise
+        if chunk_vectors is not None:
+            await chunk_vectors
+        return emb, summary
+
+    async def process(self, report_id, path, received_ts, content_sha256) -> None:
+        log.debug("processing report_id=%s, path=%s, received_ts=%s", report_id, path, received_ts)
+
+        # Same bytes already summarised (or being summarised) under another report: reuse that work
+        done = await self.db(find_reusable, content_sha256)
+        pending = self._inflight.get(content_sha256) if content_sha256 else None
+        if done or pending:
+            emb, summary = done or await pending
+            if self.dry_run:
+                print(f"[DRY RUN] Would reuse summary for {report_id} (identical content)")
+            else:
+                await self.db(store_vectors, report_id, path, received_ts, emb, summary)
+                log.info("♻️ reused summary for %s (identical content)", report_id)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        if content_sha256:
+            self._inflight[content_sha256] = future
+        try:
+            emb, summary = await self.summarise(path, content_sha256)
+            future.set_result((emb, summary))
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved; waiters get it re-raised
+            raise
+        finally:
+            self._inflight.pop(content_sha256, None)
+
+        if self.dry_run:
             print(f"[DRY RUN] Would INSERT {report_id} with embedding length {len(emb)}")
         else:
-            print(f"Inserting vectors for {report_id}")
-            cur.execute(
-                """
-                INSERT INTO report_vectors
-                  (report_id, report_path, email_received_ts, embedding, summary)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (report_id) DO NOTHING;
-                """,
-                (report_id, path, received_ts, emb, summary)
-            )
-            print(f"✔️ Ingested {report_id}")
+            await self.db(store_vectors, report_id, path, received_ts, emb, summary)
+            log.info("✔️ ingested %s", report_id)
+
+    async def worker(self, queue: asyncio.Queue) -> None:
+        while (row := await queue.get()) is not None:
+            report_id = row[0]
+            try:
+                with metrics.timer("report", trace={"report_id": report_id}):
+                    await self.process(*row)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                state = "skipped" if self.dry_run else await self.db(fail_report, report_id, e)
+                log.warning("✗ %s failed (%s) – %s", report_id, e, state)
+
+    async def run(self, feed=None, stop=None) -> None:
+        """
+        Work through ingest_jobs. Without *feed* the run ends when nothing is
+        left to claim. With it, an empty queue means ``await feed()``: a list
+        of (report_id, bank_tag) to queue and carry on with (an empty list
+        re-checks for any report without vectors), or None to finish. Once
+        *stop* (a threading.Event) is set nothing more is claimed; reports
+        already claimed are finished.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+        workers = [asyncio.create_task(self.worker(queue)) for _ in range(self.concurrency)]
+        try:
+            while stop is None or not stop.is_set():
+                claimed, rows = await self.db(claim_reports, self.batch, self.dry_run)
+                for row in rows:
+                    await queue.put(row)
+                if self.dry_run:
+                    break
+                if claimed:
+                    continue
+                keys = await feed() if feed else None
+                if keys is None:
+                    break
+                await self.db(enqueue_reports, keys or None)
+        finally:
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+            await self.embedder.close()
+            self._db.shutdown()
+        print(f"Embedded in {self.embedder.calls} Voyage calls")
 
 
-        # pause 60 seconds before processing the next report
-        print("Waiting 60 seconds before next report...")
-        time.sleep(60)
+def ingest_and_vectorize_reports(
+    dry_run: bool = False,
+    batch: int = sysconfig.INGEST_CLAIM_BATCH,
+    concurrency: int = sysconfig.SUMMARY_CONCURRENCY,
+    apis: Apis | None = None,
+    mode: str = "realtime",
+    wait: bool = False,
+    feed=None,
+    stop=None,
+):
+    """
+    mode="realtime" summarises reports as they're claimed. mode="batch"
+    submits them as Message Batches for backfills: finished batches from
+    earlier runs are collected first, then pending reports are submitted;
+    with wait=True the call polls until everything it submitted is in.
+    *feed* keeps a realtime run going as new reports arrive, and *stop*
+    ends it early (Ingestion.run).
+    """
+    if mode not in ("realtime", "batch"):
+        raise ValueError(f"unknown ingestion mode: {mode!r}")
+    if feed is not None and mode != "realtime":
+        raise ValueError("a feed of new reports needs mode='realtime'")
+    print(f"-------------- Starting ingestion: dry_run={dry_run} mode={mode} ----------------------")
+    # Connect using dict or connection string
+    if isinstance(DSN, dict):
+        conn = psycopg.connect(**DSN, autocommit=True)
+    else:
+        conn = psycopg.connect(DSN, autocommit=True)
+    cur = conn.cursor()
+
+    # Ensure report_vectors table exists
+    ensure_report_vectors(cur)
 
+    text_extraction.ensure_schema(cur)
+    api_cache.ensure_schema(cur)
+    chunking.ensure_schema(cur)
+    tagging.ensure_schema(cur)
+    if not dry_run:
+        evicted = api_cache.evict(conn)
+        if any(evicted.values()):
+            print(f"Evicted from cache: {evicted}")
+
+    # Queue reports that haven't been vectorized yet
+    INGEST_QUEUE.ensure(cur)
+    added = INGEST_QUEUE.enqueue_query(cur, ENQUEUE_SQL)
+    INGEST_QUEUE.reap(cur)
     cur.close()
+    if added:
+        print(f"Queued {added} new reports for ingestion")
+
+    apis = apis or default_apis()
+    if mode == "batch":
+        from ai_summary import batch_summaries
+        run = batch_summaries.BatchIngestion(conn, apis, dry_run, wait)
+    else:
+        run = Ingestion(conn, apis, dry_run, batch, concurrency)
+    asyncio.run(run.run() if mode == "batch" else run.run(feed, stop))
+
+    if not run.processed and not run.failed:
+        print("No new reports to ingest.")
+    print(apis.claude_limits.summary())
+    print(apis.voyage_limits.summary())
+    print(run.cache.summary())
+    conn.close()
+    print(f"Batch complete: {run.processed} ingested, {run.failed} failed.")
+
+
+def reembed_reports(model: str = sysconfig.EMBED_MODEL, chunk: int = 1000, apis: Apis | None = None):
+    """
+    Recompute every stored embedding from its summary with *model*, e.g.
+    after moving off voyage-large-2. Walks report_vectors a chunk at a time
+    and embeds each chunk in EMBED_BATCH_SIZE calls, then does the same for
+    report_chunks rows not yet embedded with *model*.
+
+    If *model*'s vectors have another dimension, both pgvector columns are
+    resized (pgvector_store.resize) before the first write; until the run
+    ends, search only sees the rows done so far. Stop ingestion and point
+    EMBED_MODEL / EMBED_DIM at the new model before such a run.
+    """
+    print(f"-------------- Re-embedding summaries with {model} ----------------------")
+    apis = apis or default_apis()
+    conn = psycopg.connect(**DSN, autocommit=True) if isinstance(DSN, dict) else psycopg.connect(DSN, autocommit=True)
+    api_cache.ensure_schema(conn)
+    chunking.ensure_schema(conn)
+    cache = api_cache.ApiCache()
+    checked = False
+
+    def fit_columns(vectors) -> None:
+        # the first vectors back give the model's dimension; both tables follow it
+        nonlocal checked
+        if vectors and not checked:
+            checked = True
+            dim = len(next(iter(vectors.values())))
+            for table in pgvector_store.TABLES:
+                pgvector_store.resize(conn, table, dim)
+
+    async def run_chunks():
+        done = 0
+        while todo := chunking.unembedded(conn, None, model, limit=chunk):
+            vectors, errors = await embeddings.embed_many(apis, todo, model=model)
+            fit_columns(vectors)
+            chunking.store_embeddings(conn, vectors, model)
+            done += len(vectors)
+            for key, e in errors.items():
+                log.warning("✗ chunk %s: %s", key, e)
+            if not vectors:
+                break
+            print(f"Re-embedded {done} chunks so far")
+        return done
+
+    async def run():
+        done = failed = 0
+        last = None
+        while True:
+            rows = conn.execute(
+                """
+                SELECT report_id, summary
+                  FROM report_vectors
+                 WHERE summary IS NOT NULL
+                   AND (%(last)s::uuid IS NULL OR report_id > %(last)s::uuid)
+                 ORDER BY report_id
+                 LIMIT %(chunk)s;
+                """,
+                {"last": last, "chunk": chunk}
+            ).fetchall()
+            if not rows:
+                return done, failed, await run_chunks()
+            last = rows[-1][0]
+            vectors, errors = await api_cache.embed_cached(conn, cache, apis, rows, model=model)
+            fit_columns(vectors)
+            with conn.cursor() as cur:
+                cur.executemany(
+                    "UPDATE report_vectors SET embedding = %s, embedded_at = now() WHERE report_id = %s",
+                    [(emb, rid) for rid, emb in vectors.items()]
+                )
+            for rid, e in errors.items():
+                log.warning("✗ %s: %s", rid, e)
+            done += len(vectors)
+            failed += len(errors)
+            print(f"Re-embedded {done} summaries so far")
+
+    done, failed, chunks_done = asyncio.run(run())
+    print(f"Re-embedded {chunks_done} report chunks")
+    print(cache.summary())
     conn.close()
-    print("Batch complete.")
+    print(f"Re-embedding complete: {done} updated, {failed} failed.")
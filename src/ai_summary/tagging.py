@@ -0,0 +1,239 @@
+"""
+tagging.py
+
+Topical tags of each report as rows, not prose.
+
+The summary prompt asks for tags (country, region, topic, impact, macro),
+and they used to come back however Claude felt like writing them that day,
+at the end of the free-text summary - filtering by country meant a LIKE
+over every summary. Now the summary request forces a call to the
+record_summary tool (SUMMARY_TOOL), whose JSON schema has the summary and
+one list per facet. The tags are validated and normalised, rendered back
+as a fixed "Tags:" block at the end of the stored summary (so the cache,
+duplicate reuse and full-text search keep working on plain text), and
+written to report_tags(report_id, facet, value) alongside report_vectors.
+
+parse_tags() reads a "Tags:" block back - the fixed one, and the looser
+shapes older summaries have ("**Country:** Japan, US", "- Region: Asia",
+"country: Japan; region: Asia") - which is also how backfill() tags
+reports ingested before this.
+
+    cd src && python -m ai_summary.tagging backfill
+
+Queries over the tags are in search.facets.
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import string
+from typing import Dict, List, Optional
+
+FACETS = ("country", "region", "topic", "impact", "macro")
+MAX_VALUES = 12          # per facet
+MAX_VALUE_CHARS = 60
+
+SUMMARY_TOOL = {
+    "name": "record_summary",
+    "description": "Record the summary of the report and its topical tags.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "summary": {"type": "string", "description": "The summary, in subsections, as markdown."},
+            "tags": {
+                "type": "object",
+                "properties": {
+                    "country": {"type": "array", "items": {"type": "string"},
+                                "description": "Countries the report is about, full English names."},
+                    "region": {"type": "array", "items": {"type": "string"},
+                               "description": "Regions, e.g. Asia, Europe, Euro Area, Latin America."},
+                    "topic": {"type": "array", "items": {"type": "string"},
+                              "description": "Short topics, e.g. monetary policy, yield curve, credit."},
+                    "impact": {"type": "array", "items": {"type": "string"},
+                               "description": "Market impact, e.g. hawkish, dovish, risk-off, curve steepening."},
+                    "macro": {"type": "array", "items": {"type": "string"},
+                              "description": "Macro themes, e.g. inflation, growth, employment."},
+                },
+                "required": list(FACETS),
+            },
+        },
+        "required": ["summary", "tags"],
+    },
+}
+TOOL_CHOICE = {"type": "tool", "name": SUMMARY_TOOL["name"]}
+
+ALIASES = {
+    "us": "United States", "u.s": "United States", "usa": "United States", "u.s.a": "United States",
+    "united states of america": "United States", "america": "United States",
+    "uk": "United Kingdom", "u.k": "United Kingdom", "britain": "United Kingdom", "great britain": "United Kingdom",
+    "eu": "European Union", "ez": "Euro Area", "eurozone": "Euro Area", "euro zone": "Euro Area",
+    "euro-area": "Euro Area", "em": "Emerging Markets", "dm": "Developed Markets",
+    "apac": "Asia Pacific", "asia-pacific": "Asia Pacific", "latam": "Latin America",
+    "prc": "China", "mainland china": "China", "korea": "South Korea",
+}
+
+# ─── SCHEMA ──────────────────────────────────────────────────────────────────
+DDL = """
+CREATE TABLE IF NOT EXISTS report_tags (
+  report_id UUID NOT NULL,
+  facet     TEXT NOT NULL,
+  value     TEXT NOT NULL,
+  PRIMARY KEY (report_id, facet, value)
+);
+-- facet filters and counts are index-only scans on this one
+CREATE INDEX IF NOT EXISTS idx_report_tags_facet_value
+  ON report_tags(facet, value, report_id);
+"""
+
+
+def ensure_schema(cur) -> None:
+    cur.execute(DDL)
+
+
+# ─── VALIDATION ──────────────────────────────────────────────────────────────
+def normalise(facet: str, value: str) -> Optional[str]:
+    value = " ".join(str(value).strip(" \t*_`#-•.;:\"'()[]").split())
+    if not value or len(value) > MAX_VALUE_CHARS or value.lower() in ("n/a", "na", "none", "various", "global macro"):
+        return None
+    if facet in ("country", "region"):
+        alias = ALIASES.get(value.lower())
+        if alias:
+            return alias
+        # keep acronyms (GCC, CEE), capitalise the rest
+        return value if value.isupper() and len(value) <= 4 else string.capwords(value)
+    return value.lower()
+
+
+def validate_tags(tags) -> Dict[str, List[str]]:
+    """{facet: [values]} from whatever came back: known facets only, cleaned, deduplicated, capped."""
+    out: Dict[str, List[str]] = {}
+    if not isinstance(tags, dict):
+        return out
+    for facet, values in tags.items():
+        facet = str(facet).strip().lower().rstrip("s") if str(facet).lower() != "countries" else "country"
+        if facet not in FACETS:
+            continue
+        if isinstance(values, str):
+            values = re.split(r"[,;|/]", values)
+        if not isinstance(values, list):
+            continue
+        clean = []
+        for v in values:
+            v = normalise(facet, v) if isinstance(v, (str, int, float)) else None
+            if v and v not in clean:
+                clean.append(v)
+        if clean:
+            out[facet] = clean[:MAX_VALUES]
+    return out
+
+
+def render_tags(tags: Dict[str, List[str]]) -> str:
+    return "Tags:\n" + "\n".join(f"{f}: {', '.join(tags[f])}" for f in FACETS if tags.get(f))
+
+
+def summary_from_tool(tool_input) -> str:
+    """Stored summary text for a record_summary call: the summary, then the tags block."""
+    if not isinstance(tool_input, dict):
+        return str(tool_input)
+    summary = str(tool_input.get("summary") or "").strip()
+    tags = validate_tags(tool_input.get("tags"))
+    return f"{summary}\n\n{render_tags(tags)}" if tags else summary
+
+
+# ─── PARSING ─────────────────────────────────────────────────────────────────
+_FACET = r"(countr(?:y|ies)|regions?|topics?|impacts?|macros?)"
+_LINE_START = re.compile(r"^\s*(?:[-*•#>]+\s*)*(?:\*\*|__)?\s*" + _FACET + r"\s*(?:\*\*|__)?\s*[:：]", re.I)
+_INLINE = re.compile(r"(?:^|[;|,]\s*|\s)(?:\*\*|__)?" + _FACET + r"(?:\*\*|__)?\s*[:：]", re.I)
+_HEADER = re.compile(r"^\W*(?:topical\s+)?tags\b", re.I)
+
+
+def parse_tags(summary: Optional[str]) -> Dict[str, List[str]]:
+    """
+    Tags from the text of a summary: every line that starts with a facet
+    name and a colon (markdown bullets and bold allowed), several facets on
+    one line included. Later lines for the same facet add to it. When
+    there is a "Tags" heading, only what follows the last one is read, so a
+    sentence in the body that happens to start with "Impact:" is left alone.
+    """
+    found: Dict[str, list] = {}
+    if not summary:
+        return {}
+    lines = summary.splitlines()
+    headers = [i for i, line in enumerate(lines) if _HEADER.match(line)]
+    for line in lines[headers[-1]:] if headers else lines:
+        line = re.sub(r"^\W*(?:topical\s+)?tags\b\W*", "", line, flags=re.I)
+        if not _LINE_START.match(line):
+            continue
+        marks = list(_INLINE.finditer(line))
+        for m, nxt in zip(marks, marks[1:] + [None]):
+            values = line[m.end(): nxt.start() if nxt else len(line)]
+            facet = m.group(1).lower()
+            facet = "country" if facet.startswith("countr") else facet.rstrip("s")
+            found.setdefault(facet, []).extend(re.split(r"[,;|/]", values.replace("**", "")))
+    return validate_tags(found)
+
+
+# ─── STORAGE ─────────────────────────────────────────────────────────────────
+def store_many(conn, tagged: Dict[object, Dict[str, List[str]]]) -> None:
+    """Replace the tags of each report in {report_id: tags}."""
+    if not tagged:
+        return
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM report_tags WHERE report_id = ANY(%s)", (list(tagged),))
+        cur.executemany(
+            "INSERT INTO report_tags (report_id, facet, value) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING",
+            [(rid, facet, value) for rid, tags in tagged.items() for facet, values in tags.items() for value in values],
+        )
+
+
+def store_tags(conn, report_id, tags: Dict[str, List[str]]) -> None:
+    store_many(conn, {report_id: tags})
+
+
+def backfill(conn, chunk: int = 1000, retag: bool = False) -> int:
+    """Tag stored reports from their summaries (untagged ones only unless *retag*); returns reports tagged."""
+    tagged = 0
+    last = None
+    while True:
+        rows = conn.execute(
+            """
+            SELECT v.report_id, v.summary
+              FROM report_vectors v
+             WHERE v.summary IS NOT NULL
+               AND (%(last)s::uuid IS NULL OR v.report_id > %(last)s::uuid)
+               AND (%(retag)s OR NOT EXISTS (SELECT 1 FROM report_tags t WHERE t.report_id = v.report_id))
+             ORDER BY v.report_id
+             LIMIT %(chunk)s
+            """,
+            {"last": last, "retag": retag, "chunk": chunk},
+        ).fetchall()
+        if not rows:
+            return tagged
+        last = rows[-1][0]
+        found = {rid: parse_tags(summary) for rid, summary in rows}
+        found = {rid: tags for rid, tags in found.items() if tags or retag}
+        if not found:
+            continue
+        with conn.transaction():
+            store_many(conn, found)
+        tagged += sum(1 for tags in found.values() if tags)
+        print(f"Tagged {tagged} reports so far")
+
+
+def main() -> None:
+    from search.vector_index import connect
+
+    parser = argparse.ArgumentParser(description="report_tags maintenance")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("backfill", help="tag stored reports from the Tags block of their summaries")
+    b.add_argument("--retag", action="store_true", help="re-parse reports that already have tags")
+    args = parser.parse_args()
+
+    conn = connect()
+    ensure_schema(conn)
+    print(f"Backfill complete: {backfill(conn, retag=args.retag)} reports tagged.")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
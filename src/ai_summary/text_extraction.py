@@ -0,0 +1,140 @@
+"""
+text_extraction.py
+
+Text layer of the reports, extracted once and kept.
+
+PyPDF2's page.extract_text() is the most CPU-hungry step of ingestion, and
+it used to run serially on one core for every report, every time, with the
+result thrown away after the summary request. Here pages are extracted
+EXTRACT_WINDOW at a time on the shared PDF process pool, and the per-page
+text is stored in report_pages keyed by the PDF's content hash, with each
+page's character offset in the joined document text. Re-runs, duplicates,
+re-summarisation and search indexing read it back instead of parsing the
+PDF again. Postgres compresses the text column itself, so there are no
+sidecar files to manage. A generated tsvector column with a GIN index
+makes the text searchable too (see search.hybrid_search).
+
+* extract_pages()      – page texts straight from the PDF (no database)
+* load_pages()/store_pages() – report_pages read/write
+* document_text()      – joined text for one report, extracting only on a miss
+"""
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from PyPDF2 import PdfReader
+
+import configuration.system_config as sysconfig
+from ai_summary import page_rendering
+from helpers import metrics
+
+PAGE_SEPARATOR = "\n"
+log = logging.getLogger(__name__)
+
+# ─── SCHEMA ──────────────────────────────────────────────────────────────────
+DDL = """
+CREATE TABLE IF NOT EXISTS report_pages (
+  content_sha256 TEXT NOT NULL,
+  page_no        INT  NOT NULL,      -- 1-based
+  char_start     INT  NOT NULL,      -- offset of the page in the joined document text
+  text           TEXT NOT NULL,
+  PRIMARY KEY (content_sha256, page_no)
+);
+-- full-text index over the report text (search.hybrid_search)
+ALTER TABLE report_pages
+  ADD COLUMN IF NOT EXISTS tsv tsvector
+  GENERATED ALWAYS AS (to_tsvector('{fts_config}', text)) STORED;
+CREATE INDEX IF NOT EXISTS idx_report_pages_tsv ON report_pages USING gin (tsv);
+"""
+
+
+def ensure_schema(cur) -> None:
+    cur.execute(DDL.format(fts_config=sysconfig.FTS_CONFIG))
+
+
+# ─── EXTRACTION ──────────────────────────────────────────────────────────────
+def extract_window(pdf_path: str, first: int, last: int) -> List[str]:
+    """Text of pages first..last (1-based, inclusive). Runs in a pool worker."""
+    reader = PdfReader(pdf_path)
+    # PDF text can carry NULs, which Postgres text won't take
+    return [(reader.pages[i].extract_text() or "").replace("\x00", "") for i in range(first - 1, last)]
+
+
+def extract_pages(
+    pdf_path: str,
+    window: int = sysconfig.EXTRACT_WINDOW,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> List[str]:
+    """Per-page text of *pdf_path*, windows extracted concurrently on *pool*."""
+    log.debug("extracting text from %s", pdf_path)
+    pool = pool or page_rendering.get_pdf_pool()
+    with metrics.timer("extract"):
+        n_pages = len(PdfReader(pdf_path).pages)
+        futures = [
+            pool.submit(extract_window, pdf_path, first, min(first + window - 1, n_pages))
+            for first in range(1, n_pages + 1, window)
+        ]
+        pages = [text for fut in futures for text in fut.result()]
+    metrics.count("pages", len(pages), stage="extract")
+    return pages
+
+
+def join_pages(pages: Sequence[str]) -> str:
+    return PAGE_SEPARATOR.join(pages)
+
+
+def page_offsets(pages: Sequence[str]) -> List[int]:
+    """Where each page starts in join_pages(pages)."""
+    offsets, pos = [], 0
+    for text in pages:
+        offsets.append(pos)
+        pos += len(text) + len(PAGE_SEPARATOR)
+    return offsets
+
+
+# ─── STORAGE ─────────────────────────────────────────────────────────────────
+def load_many(conn, shas: Sequence[str]) -> Dict[str, List[str]]:
+    """{content_sha256: [page text, ...]} for the hashes already extracted."""
+    out: Dict[str, List[str]] = {}
+    shas = [s for s in shas if s]
+    if not shas:
+        return out
+    for sha, text in conn.execute(
+        "SELECT content_sha256, text FROM report_pages WHERE content_sha256 = ANY(%s) "
+        "ORDER BY content_sha256, page_no",
+        (shas,),
+    ):
+        out.setdefault(sha, []).append(text)
+    return out
+
+
+def load_pages(conn, content_sha256: Optional[str]) -> Optional[List[str]]:
+    return load_many(conn, [content_sha256]).get(content_sha256) if content_sha256 else None
+
+
+def store_pages(conn, content_sha256: Optional[str], pages: Sequence[str]) -> None:
+    if not content_sha256 or not pages:
+        return
+    with conn.transaction():
+        with conn.cursor() as cur:
+            cur.executemany(
+                """
+                INSERT INTO report_pages (content_sha256, page_no, char_start, text)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (content_sha256, page_no) DO NOTHING
+                """,
+                [(content_sha256, i, start, text)
+                 for i, (start, text) in enumerate(zip(page_offsets(pages), pages), start=1)],
+            )
+
+
+def document_text(conn, content_sha256: Optional[str], pdf_path: str, save: bool = True) -> str:
+    """Joined text of a report: from report_pages if it's there, else from the PDF (and stored)."""
+    pages = load_pages(conn, content_sha256)
+    if pages is None:
+        pages = extract_pages(pdf_path)
+        if save:
+            store_pages(conn, content_sha256, pages)
+    return join_pages(pages)
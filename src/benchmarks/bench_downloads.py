@@ -0,0 +1,70 @@
+"""
+PDF download throughput: the old one-email-at-a-time loop vs the
+concurrent engine in pdf_downloader, against local portals.
+
+Two fake portals are started: a fast one behind the JPM handler and a
+slow one behind the GS handler. Nothing touches Postgres.
+
+    cd src && python -m benchmarks.bench_downloads --emails 40 --slow 2.0
+"""
+import argparse
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import configuration.system_config as system_config
+import downloaders.pdf_downloader as pdf_downloader
+from benchmarks.pdf_server import PdfServer
+from benchmarks.synthetic import gs_email_html, jpm_email_html
+
+
+def make_jobs(root: Path, jpm: PdfServer, gs: PdfServer, n: int) -> list:
+    mail = root / "emails"
+    mail.mkdir()
+    t0 = datetime(2024, 1, 1)
+    jobs = []
+    for i in range(n):
+        bank, srv, render = ("JPM", jpm, jpm_email_html) if i % 2 else ("GS", gs, gs_email_html)
+        subject = f"Rates note {i}"
+        html_path = mail / f"2024-01-01_00-00-00 - {subject}.html"
+        html_path.write_text(render(srv.url(f"{bank.lower()}-{i}.pdf"), subject), encoding="utf-8")
+        jobs.append((bank, f"entry-{i}", html_path, t0 + timedelta(seconds=i)))
+    return jobs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--emails", type=int, default=40)
+    parser.add_argument("--fast", type=float, default=0.2, help="JPM portal latency (s)")
+    parser.add_argument("--slow", type=float, default=2.0, help="GS portal latency (s)")
+    parser.add_argument("--size-kb", type=int, default=512)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with PdfServer(latency=args.fast, size_kb=args.size_kb) as jpm, \
+            PdfServer(latency=args.slow, size_kb=args.size_kb) as gs:
+        results = {}
+        for mode in ("serial", "concurrent"):
+            with tempfile.TemporaryDirectory() as tmp:
+                root = Path(tmp)
+                pdf_downloader.BASE_DOWNLOAD = root / "reports"
+                # fresh download state per mode: the second mode would otherwise
+                # get 304s for the first one's files (and it'd land in DOWNLOAD_FOLDER)
+                system_config.DOWNLOAD_STATE_FOLDER = str(root / "reports" / ".state")
+                jobs = make_jobs(root, jpm, gs, args.emails)
+                t0 = time.perf_counter()
+                if mode == "serial":
+                    ok = sum(1 for job in jobs if pdf_downloader.fetch_one(job))
+                else:
+                    ok = sum(1 for _, result, err in
+                             pdf_downloader.download_concurrently(jobs, workers=args.workers) if err is None)
+                results[mode] = (time.perf_counter() - t0, ok)
+
+    for mode, (secs, ok) in results.items():
+        print(f"  {mode:10}: {secs:7.2f} s  {ok}/{args.emails} ok  {ok / secs:6.1f} PDFs/s")
+    print(f"  speed-up  : {results['serial'][0] / results['concurrent'][0]:7.1f}x", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+emails_final insert throughput: per-row INSERT vs buffered binary COPY.
+
+Writes synthetic rows into a scratch table (dropped afterwards) on the
+Postgres configured in system_config.DSN.
+
+    cd src && python -m benchmarks.bench_email_insert --n 5000 --raw-kb 60
+"""
+import argparse
+import os
+import time
+from functools import partial
+from datetime import datetime, timedelta
+
+import psycopg
+
+import configuration.system_config as sys_config
+from downloaders.email_scraper import EmailBatchWriter, EMAIL_COLUMNS
+
+TABLE = "emails_final_bench"
+DDL = f"""
+DROP TABLE IF EXISTS {TABLE};
+CREATE TABLE {TABLE} (
+  entry_id    TEXT PRIMARY KEY,
+  received_ts TIMESTAMP NOT NULL,
+  bank_tag    VARCHAR(20) NOT NULL,
+  subject     TEXT NOT NULL,
+  body_snip   TEXT,
+  file_path   TEXT NOT NULL,
+  html_path   TEXT,
+  raw_msg     BYTEA NOT NULL,
+  imported_at TIMESTAMPTZ DEFAULT now()
+);
+"""
+
+
+def synthetic_rows(n: int, raw_kb: int, prefix: str) -> list[tuple]:
+    t0 = datetime(2024, 1, 1)
+    raw = os.urandom(raw_kb * 1024)
+    return [
+        (
+            f"{prefix}-{i:08d}",
+            t0 + timedelta(minutes=i),
+            "GS",
+            f"Synthetic research note {i}",
+            "body " * 100,
+            f"/tmp/{prefix}/{i}.eml",
+            f"/tmp/{prefix}/{i}.html",
+            raw,
+        )
+        for i in range(n)
+    ]
+
+
+def per_row(conn: psycopg.Connection, rows: list[tuple]) -> None:
+    sql = f"INSERT INTO {TABLE} ({', '.join(EMAIL_COLUMNS)}) VALUES ({', '.join(['%s'] * len(EMAIL_COLUMNS))})"
+    with conn.cursor() as cur:
+        for row in rows:
+            cur.execute(sql, row)
+
+
+def buffered(conn: psycopg.Connection, rows: list[tuple], batch: int) -> None:
+    with EmailBatchWriter(conn, table=TABLE, max_rows=batch) as writer:
+        for row in rows:
+            writer.add(row)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--n", type=int, default=5000, help="rows per run")
+    parser.add_argument("--raw-kb", type=int, default=60, help="raw_msg size in KiB")
+    parser.add_argument("--batch", type=int, default=sys_config.EMAIL_BATCH_ROWS, help="COPY batch size")
+    args = parser.parse_args()
+    runs = (
+        ("per-row INSERT", per_row),
+        ("buffered COPY", partial(buffered, batch=args.batch)),
+    )
+
+    with psycopg.connect(**sys_config.DSN, autocommit=True) as conn:
+        conn.execute(DDL)
+        try:
+            results = {}
+            for name, fn in runs:
+                rows = synthetic_rows(args.n, args.raw_kb, name.split()[0])
+                t0 = time.perf_counter()
+                fn(conn, rows)
+                results[name] = time.perf_counter() - t0
+            mb = args.n * args.raw_kb / 1024
+            for name, secs in results.items():
+                print(f"  {name:15}: {secs:8.2f} s  {args.n / secs:9.0f} rows/s  {mb / secs:8.1f} MB/s")
+            print(f"  speed-up       : {results['per-row INSERT'] / results['buffered COPY']:8.1f}x", flush=True)
+        finally:
+            conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Embedding round trips: one embed call per summary (the old get_embedding)
+vs the batched stage, against the local Voyage stub. A few inputs are
+poisoned so the stub rejects any batch containing them, to show the
+split-and-retry path isolating just those.
+
+    cd src && python -m benchmarks.bench_embeddings --summaries 2000
+"""
+import argparse
+import asyncio
+import time
+
+import voyageai
+
+from ai_summary import embeddings
+from ai_summary.rate_limiting import RateLimiter
+from ai_summary.summarization_vectorization import Apis
+from benchmarks.llm_server import LlmServer
+from benchmarks.synthetic import report_text
+
+POISON = "<<reject>>"
+
+
+def make_apis(srv: LlmServer) -> Apis:
+    return Apis(
+        claude=None,
+        voyage=voyageai.AsyncClient(api_key="stub", base_url=srv.voyage_url),
+        claude_limits=RateLimiter("claude"),
+        voyage_limits=RateLimiter("voyage", 60, requests=srv.embed_limits["requests"].capacity),
+    )
+
+
+async def one_by_one(apis: Apis, items, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def run(key, text):
+        async with sem:
+            vectors, errors = await embeddings.embed_batch(apis, [key], [text])
+            return vectors, errors
+
+    results = await asyncio.gather(*(run(k, t) for k, t in items))
+    return {k: v for ok, _ in results for k, v in ok.items()}, {k: e for _, err in results for k, e in err.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--summaries", type=int, default=2000)
+    parser.add_argument("--chars", type=int, default=2500, help="summary length")
+    parser.add_argument("--poisoned", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.25, help="stub latency per embed call (s)")
+    parser.add_argument("--concurrency", type=int, default=8, help="in-flight calls for the one-by-one run")
+    args = parser.parse_args()
+
+    items = [(i, report_text(args.chars, seed=i)) for i in range(args.summaries)]
+    step = max(1, args.summaries // max(1, args.poisoned))
+    for i in range(0, min(args.summaries, step * args.poisoned), step):
+        items[i] = (i, items[i][1] + POISON)
+
+    results = {}
+    for mode in ("one by one", "batched"):
+        # the stub's embed latency is latency/5
+        with LlmServer(latency=args.latency * 5, embed_rpm=1_000_000, embed_tpm=10 ** 12,
+                       reject_marker=POISON) as srv:
+            apis = make_apis(srv)
+            t0 = time.perf_counter()
+            if mode == "one by one":
+                vectors, errors = asyncio.run(one_by_one(apis, items, args.concurrency))
+            else:
+                vectors, errors = asyncio.run(embeddings.embed_many(apis, items))
+            results[mode] = (time.perf_counter() - t0, srv.stats["embed_calls"], len(vectors), len(errors))
+
+    for mode, (secs, calls, ok, bad) in results.items():
+        print(f"  {mode:10}: {secs:7.2f} s  {calls:5} calls  {ok} embedded  {bad} rejected")
+    print(f"  calls saved: {results['one by one'][1] / results['batched'][1]:5.1f}x  "
+          f"speed-up: {results['one by one'][0] / results['batched'][0]:5.1f}x", flush=True)
+
+
+if __name__ == "__main__":
+    main()
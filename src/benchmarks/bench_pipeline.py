@@ -0,0 +1,318 @@
+"""
+End-to-end pipeline throughput, fully offline: run/run.py's streaming
+pipeline over a synthetic mailbox, with a local stand-in for everything
+it normally talks to.
+
+* mail     - --emails bank research alerts (J.P. Morgan and Goldman Sachs
+             shaped HTML linking to a PDF) plus --noise meeting invites the
+             scraper should drop, written as an .eml archive (MAIL_SOURCE="eml")
+* portals  - one PdfServer per bank serving --pages page PDFs of --size-kb,
+             with --latency / --jitter and a --error-rate of 503s
+* APIs     - LlmServer for Claude and Voyage, enforcing --rpm / --itpm /
+             --otpm per simulated minute of --period seconds (the client
+             limiters are scaled to match)
+* Postgres - a scratch cluster (benchmarks.scratch_db), or --dsn
+
+Reported: per-stage calls, throughput, p50/p99 latency and errors (from
+helpers.metrics), end-to-end latency from an email's import to its report
+being searchable, queue outcomes, and peak RSS of the process and its
+workers. Everything is saved as JSON; --compare an earlier file to see the
+change per stage.
+
+Page rendering needs poppler; without it, stub page images stand in and
+the render stage times only that.
+
+    cd src && python -m benchmarks.bench_pipeline --emails 100
+    cd src && python -m benchmarks.bench_pipeline --emails 100 --error-rate 0.05 --compare bench_pipeline-old.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import configuration.system_config as sysconfig
+from benchmarks.llm_server import LlmServer
+from benchmarks.pdf_server import PdfServer
+from benchmarks.scratch_db import ScratchPostgres, configure
+from benchmarks.synthetic import gs_email_html, jpm_email_html, make_email, page_images_b64
+from helpers import metrics
+
+try:  # for the whole process tree; resource (self only, Unix) otherwise
+    import psutil
+except ImportError:
+    psutil = None
+
+RUN_PY = Path(__file__).resolve().parents[2] / "run" / "run.py"
+BANKS = {"JPM": ("J.P. Morgan", jpm_email_html), "GS": ("Goldman Sachs", gs_email_html)}
+
+
+# ─── CORPUS ──────────────────────────────────────────────────────────────────
+def write_mailbox(folder: Path, portals: dict, n: int, noise: int, seed: int = 0) -> int:
+    """*n* research alerts and *noise* invites as .eml files, received over the last hour."""
+    rng = random.Random(seed)
+    folder.mkdir(parents=True)
+    now = datetime.now()
+    banks = list(portals)
+    for i in range(n + noise):
+        received = now - timedelta(seconds=rng.uniform(60, 3600))
+        if i < n:
+            bank = banks[i % len(banks)]
+            name, render = BANKS[bank]
+            subject = f"{name} Rates Strategy: curve note {i}"
+            raw = make_email(subject, render(portals[bank].url(f"{bank.lower()}-{i}.pdf"), subject), received)
+        else:
+            subject = f"Microsoft Teams meeting: desk sync {i}"
+            raw = make_email(subject, f"<p>{subject}</p>", received, sender="calendar@example.com")
+        (folder / f"{i:06d}.eml").write_bytes(raw)
+    return n + noise
+
+
+# ─── MEASUREMENT ─────────────────────────────────────────────────────────────
+class PeakRss:
+    """Samples resident memory of this process and its children every *interval* seconds."""
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss", daemon=True)
+
+    def _sample(self) -> int:
+        if psutil is None:
+            import resource  # ru_maxrss: KiB on Linux, bytes on macOS
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return rss if os.uname().sysname == "Darwin" else rss * 1024
+        proc = psutil.Process()
+        total = proc.memory_info().rss
+        for child in proc.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._sample())
+
+    def __enter__(self) -> "PeakRss":
+        self.peak = self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._sample())
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"n": 0}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"n": len(ordered), "p50": pick(0.5), "p99": pick(0.99), "max": ordered[-1]}
+
+
+def database_results(dsn: dict) -> dict:
+    import psycopg
+
+    with psycopg.connect(**dsn, autocommit=True) as conn:
+        counts = dict(zip(
+            ("emails", "reports", "vectors", "tags"),
+            conn.execute(
+                "SELECT (SELECT count(*) FROM emails_final), (SELECT count(*) FROM reports), "
+                "(SELECT count(*) FROM report_vectors), (SELECT count(DISTINCT report_id) FROM report_tags)"
+            ).fetchone(),
+        ))
+        jobs = {
+            table: dict(conn.execute(f"SELECT state, count(*) FROM {table} GROUP BY state").fetchall())
+            for table in ("download_jobs", "ingest_jobs")
+        }
+        # email imported -> summary and vectors stored: when the report became searchable
+        latency = [row[0] for row in conn.execute(
+            """
+            SELECT extract(epoch FROM v.ingested_at - e.imported_at)::float8
+              FROM report_vectors v
+              JOIN reports r ON r.report_id = v.report_id
+              JOIN emails_final e ON e.entry_id = r.entry_id
+            """
+        )]
+        first = conn.execute(
+            "SELECT extract(epoch FROM (SELECT min(ingested_at) FROM report_vectors) "
+            "- (SELECT min(imported_at) FROM emails_final))::float8"
+        ).fetchone()[0]
+    return {"counts": counts, "jobs": jobs, "end_to_end": percentiles(latency), "first_searchable": first}
+
+
+# ─── RUN ─────────────────────────────────────────────────────────────────────
+def setup(root: Path, args, pdf_servers: dict, llm: LlmServer) -> None:
+    """Point system_config at the stand-ins, before any pipeline module reads it."""
+    sysconfig.MSG_FOLDER = str(root / "emails")
+    sysconfig.DOWNLOAD_FOLDER = str(root / "reports")
+    sysconfig.DOWNLOAD_STATE_FOLDER = str(root / "reports" / ".state")
+    sysconfig.SEARCH_INDEX_FOLDER = str(root / "reports" / ".search")
+    sysconfig.MAIL_SOURCE = "eml"
+    sysconfig.MAILBOX_PATH = str(root / "mailbox")
+    sysconfig.ANTHROPIC_BASE_URL = llm.base_url
+    sysconfig.VOYAGE_BASE_URL = llm.voyage_url
+    # the client paces itself per real minute; the stub's minute is --period seconds
+    scale = 60.0 / args.period
+    sysconfig.CLAUDE_RPM = args.rpm * scale
+    sysconfig.CLAUDE_INPUT_TPM = args.itpm * scale
+    sysconfig.CLAUDE_OUTPUT_TPM = args.otpm * scale
+    sysconfig.VOYAGE_RPM = args.embed_rpm * scale
+    sysconfig.VOYAGE_TPM = args.embed_tpm * scale
+
+    if not (shutil.which("pdftoppm") or (sysconfig.POPPLER_PATH and os.path.isdir(sysconfig.POPPLER_PATH))):
+        import ai_summary.summarization_vectorization as sv
+
+        def stub_images(pdf_path):
+            with metrics.timer("render", stub=True):
+                return page_images_b64(min(args.pages, sysconfig.RENDER_MAX_PAGES))
+
+        sv.pdf_images_to_base64 = stub_images
+        print("poppler not found: stub page images stand in for rendering", flush=True)
+
+
+def load_run_module():
+    spec = importlib.util.spec_from_file_location("reportai_run", RUN_PY)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench(args) -> dict:
+    root = Path(tempfile.mkdtemp(prefix="bench-pipeline-"))
+    db = None if args.dsn else ScratchPostgres(str(root / "pg"))
+    try:
+        with PdfServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                       size_kb=args.size_kb, pages=args.pages) as jpm, \
+                PdfServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          size_kb=args.size_kb, pages=args.pages) as gs, \
+                LlmServer(rpm=args.rpm, input_tpm=args.itpm, output_tpm=args.otpm,
+                          embed_rpm=args.embed_rpm, embed_tpm=args.embed_tpm,
+                          period=args.period, latency=args.api_latency) as llm:
+            portals = {"JPM": jpm, "GS": gs}
+            dsn = db.start() if db else _dsn_dict(args.dsn)
+            configure(dsn)
+            setup(root, args, portals, llm)
+            written = write_mailbox(root / "mailbox", portals, args.emails, args.noise)
+            print(f"Corpus: {written} emails in {root / 'mailbox'}", flush=True)
+
+            run = load_run_module()
+            metrics.reset()
+            argv = ["--lookback", "1", "--download-workers", str(args.workers),
+                    "--ingest-concurrency", str(args.concurrency)]
+            with PeakRss() as rss:
+                started = time.monotonic()
+                rc = run.main(argv)
+                elapsed = time.monotonic() - started
+
+            snap = metrics.snapshot()
+            for stage in snap["stages"].values():
+                stage["per_s"] = stage["calls"] / elapsed
+            result = {
+                "started": datetime.now().isoformat(timespec="seconds"),
+                "args": vars(args),
+                "rc": rc,
+                "elapsed": elapsed,
+                **database_results(dsn),
+                "stages": snap["stages"],
+                "counters": snap["counters"],
+                "peak_rss_mb": rss.peak / 2 ** 20,
+                "servers": {"jpm": dict(jpm.stats), "gs": dict(gs.stats), "llm": dict(llm.stats)},
+            }
+            result["throughput"] = {
+                "emails_per_s": result["counts"]["emails"] / elapsed,
+                "reports_per_s": result["counts"]["vectors"] / elapsed,
+            }
+            return result
+    finally:
+        if db:
+            db.stop()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _dsn_dict(dsn: str) -> dict:
+    from psycopg.conninfo import conninfo_to_dict
+
+    return conninfo_to_dict(dsn)
+
+
+# ─── REPORT ──────────────────────────────────────────────────────────────────
+def report(result: dict, baseline: dict = None) -> None:
+    c, e2e = result["counts"], result["end_to_end"]
+    print(f"\n─── bench_pipeline: {result['args']['emails']} emails in {result['elapsed']:.1f} s (rc {result['rc']}) ───")
+    print(f"  emails {c['emails']}  reports {c['reports']}  searchable {c['vectors']}  tagged {c['tags']}")
+    print(f"  throughput   {result['throughput']['emails_per_s']:.2f} emails/s, "
+          f"{result['throughput']['reports_per_s']:.2f} reports/s")
+    if e2e["n"]:
+        print(f"  end to end   p50 {e2e['p50']:.1f} s  p99 {e2e['p99']:.1f} s  max {e2e['max']:.1f} s  "
+              f"(first report searchable after {result['first_searchable']:.1f} s)")
+    print(f"  jobs         download {result['jobs']['download_jobs']}  ingest {result['jobs']['ingest_jobs']}")
+    print(f"  peak RSS     {result['peak_rss_mb']:.0f} MB")
+    print(f"\n  {'stage':14} {'calls':>6} {'per s':>7} {'p50 s':>8} {'p99 s':>8} {'errors':>6}"
+          + ("   p50 / p99 vs baseline" if baseline else ""))
+    for name, st in result["stages"].items():
+        line = (f"  {name:14} {st['calls']:6d} {st['per_s']:7.2f} {st['p50']:8.3f} "
+                f"{st['p99']:8.3f} {st['errors']:6.0f}")
+        old = (baseline or {}).get("stages", {}).get(name)
+        if old:
+            line += f"   {_change(st['p50'], old['p50'])} / {_change(st['p99'], old['p99'])}"
+        print(line)
+    if baseline:
+        print(f"\n  vs baseline ({baseline.get('started', '?')}): elapsed "
+              f"{_change(result['elapsed'], baseline['elapsed'])}, reports/s "
+              f"{_change(result['throughput']['reports_per_s'], baseline['throughput']['reports_per_s'])}, "
+              f"peak RSS {_change(result['peak_rss_mb'], baseline['peak_rss_mb'])}")
+
+
+def _change(new: float, old: float) -> str:
+    return f"{(new - old) / old:+.0%}" if old else "n/a"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--emails", type=int, default=100, help="research alerts in the mailbox")
+    parser.add_argument("--noise", type=int, default=10, help="meeting invites the scraper should drop")
+    parser.add_argument("--pages", type=int, default=4, help="pages per PDF")
+    parser.add_argument("--size-kb", type=int, default=256, help="bytes per PDF")
+    parser.add_argument("--latency", type=float, default=0.2, help="portal latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.3, help="extra random portal latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="share of portal requests answered 503")
+    parser.add_argument("--period", type=float, default=6.0, help="seconds per simulated API minute")
+    parser.add_argument("--rpm", type=float, default=50)
+    parser.add_argument("--itpm", type=float, default=30_000)
+    parser.add_argument("--otpm", type=float, default=8_000)
+    parser.add_argument("--embed-rpm", type=float, default=300)
+    parser.add_argument("--embed-tpm", type=float, default=1_000_000)
+    parser.add_argument("--api-latency", type=float, default=0.5, help="stub API latency (s)")
+    parser.add_argument("--workers", type=int, default=sysconfig.DOWNLOAD_WORKERS, help="download workers")
+    parser.add_argument("--concurrency", type=int, default=sysconfig.SUMMARY_CONCURRENCY, help="reports summarised at once")
+    parser.add_argument("--dsn", help="use this (scratch!) database instead of starting one")
+    parser.add_argument("--out", help="JSON results file (default bench_pipeline-<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    result = bench(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report(result, baseline)
+    out = args.out or f"bench_pipeline-{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, default=str)
+    print(f"\nResults saved to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Page rendering for the summariser: the old whole-document convert_from_path
+(200 dpi, every page as a PIL image, PNG + base64 in memory) vs the windowed
+renderer in page_rendering, on synthetic multi-page PDFs.
+
+Each mode runs in its own interpreter so peak RSS is measured cleanly, for
+the parent and for the largest child (poppler / pool workers). Needs
+poppler on PATH (or POPPLER_PATH).
+
+    cd src && python -m benchmarks.bench_rendering --docs 4 --pages 150
+"""
+import argparse
+import base64
+import io
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from benchmarks.synthetic import make_pdf
+
+
+def legacy(pdf_path: str) -> list:
+    from pdf2image import convert_from_path
+
+    import configuration.system_config as sysconfig
+
+    encoded = []
+    for img in convert_from_path(pdf_path, poppler_path=sysconfig.POPPLER_PATH or None):
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        encoded.append(base64.b64encode(buf.getvalue()).decode("utf-8"))
+    return encoded
+
+
+def windowed(pdf_path: str) -> list:
+    from ai_summary import page_rendering
+
+    return [img.data for img in page_rendering.render_pages(pdf_path)]
+
+
+def child(mode: str, paths: list, concurrency: int) -> None:
+    fn = {"legacy": legacy, "windowed": windowed}[mode]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        images = [imgs for imgs in pool.map(fn, paths)]
+    secs = time.perf_counter() - t0
+    if mode == "windowed":
+        from ai_summary import page_rendering
+
+        page_rendering.shutdown_pdf_pool()
+    print(json.dumps({
+        "secs": secs,
+        "pages": sum(len(i) for i in images),
+        "payload_mb": sum(len(b) for i in images for b in i) / 1e6,
+        "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "child_peak_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--docs", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=150)
+    parser.add_argument("--concurrency", type=int, default=2, help="documents rendered at once")
+    parser.add_argument("--child", choices=["legacy", "windowed"], help=argparse.SUPPRESS)
+    parser.add_argument("paths", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.paths, args.concurrency)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.docs):
+            path = Path(tmp) / f"pack-{i}.pdf"
+            path.write_bytes(make_pdf(pages=args.pages, seed=i))
+            paths.append(str(path))
+
+        results = {}
+        for mode in ("legacy", "windowed"):
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_rendering", "--child", mode,
+                 "--concurrency", str(args.concurrency), *paths],
+                capture_output=True, text=True, check=True,
+            )
+            results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    for mode, r in results.items():
+        print(f"  {mode:8}: {r['secs']:7.2f} s  {r['pages']:5} pages  {r['payload_mb']:7.1f} MB payload  "
+              f"peak RSS {r['peak_mb']:7.0f} MB (largest child {r['child_peak_mb']:.0f} MB)")
+    print(f"  speed-up: {results['legacy']['secs'] / results['windowed']['secs']:5.1f}x  "
+          f"peak memory: {results['legacy']['peak_mb'] / results['windowed']['peak_mb']:5.1f}x lower", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Search latency: top-k cosine over the memory-mapped float32 index vs the
+row-by-row scan the DOUBLE PRECISION[] column allows (fetch each embedding
+as a Python list and score it), on random unit vectors with random
+received dates and banks.
+
+The row-by-row scan is timed on --scan-rows rows and scaled up; it is only
+the scoring, so it flatters the old way (no Postgres round trips counted).
+
+    cd src && python -m benchmarks.bench_search --reports 200000 --dim 1536
+"""
+import argparse
+import datetime as dt
+import math
+import statistics
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from search.vector_index import VectorIndex
+
+BANKS = ["GS", "JPM", "MS", "Citi", "UBS", "Barclays", "BofA", "DB", "Nomura", "HSBC"]
+
+
+def build(folder: str, n: int, dim: int, chunk: int = 20_000) -> VectorIndex:
+    rng = np.random.default_rng(0)
+    index = VectorIndex(folder, "bench")
+    start = dt.datetime(2023, 1, 1, tzinfo=dt.timezone.utc)
+    for lo in range(0, n, chunk):
+        m = min(chunk, n - lo)
+        index.append(
+            [uuid.UUID(int=i + 1) for i in range(lo, lo + m)],
+            rng.standard_normal((m, dim), dtype=np.float32),
+            [start + dt.timedelta(minutes=int(x)) for x in rng.integers(0, 3 * 365 * 1440, m)],
+            [BANKS[b] for b in rng.integers(0, len(BANKS), m)],
+        )
+    return index
+
+
+def timed(fn, repeat: int) -> list:
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def row_scan(rows: list, q: list, k: int) -> list:
+    qn = math.sqrt(sum(x * x for x in q))
+    scored = []
+    for rid, emb in rows:
+        dot = sum(a * b for a, b in zip(emb, q))
+        scored.append((dot / (qn * math.sqrt(sum(a * a for a in emb))), rid))
+    return sorted(scored, reverse=True)[:k]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reports", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--scan-rows", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        build(tmp, args.reports, args.dim)
+        print(f"  built {args.reports:,} x {args.dim} index in {time.perf_counter() - t0:.1f} s")
+
+        index = VectorIndex(tmp, "bench")     # reopen: everything below reads through the memmap
+        rng = np.random.default_rng(1)
+        queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        index.search(queries[0], args.k)      # first touch pages the file in
+        it = iter(range(10**9))
+
+        cases = {
+            "all reports": {},
+            "last 90 days": {"since": "2025-10-01"},
+            "one bank": {"bank": "JPM"},
+            "bank + 90 days": {"bank": "JPM", "since": "2025-10-01"},
+        }
+        for name, filters in cases.items():
+            ms = timed(lambda: index.search(queries[next(it) % args.queries], args.k, **filters), args.queries)
+            print(f"  {name:15}: p50 {statistics.median(ms):7.2f} ms   max {max(ms):7.2f} ms")
+
+        sample = [(uuid.UUID(bytes=bytes(index.ids[i])), index.vectors[i].tolist()) for i in range(args.scan_rows)]
+        q = queries[0].tolist()
+        ms = timed(lambda: row_scan(sample, q, args.k), 3)
+        scan_ms = statistics.median(ms) * args.reports / args.scan_rows
+        np_ms = statistics.median(timed(lambda: index.search(queries[0], args.k), args.queries))
+        print(f"  row-by-row scan (scoring only, scaled from {args.scan_rows:,} rows): {scan_ms:,.0f} ms")
+        print(f"  speed-up: {scan_ms / np_ms:,.0f}x", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Summarisation throughput: the old fixed pause after every report vs the
+rate-limited concurrent scheduler, against a local API stub that enforces
+RPM / input TPM / output TPM limits.
+
+A "minute" lasts --period seconds on both sides so a run takes seconds, not
+hours; rates are reported per simulated minute. PDF parsing and Postgres
+are left out; each report is synthetic text plus page images.
+
+    cd src && python -m benchmarks.bench_summarize --reports 40 --period 6
+"""
+import argparse
+import asyncio
+import time
+
+import anthropic
+import voyageai
+
+import ai_summary.summarization_vectorization as sv
+from ai_summary.rate_limiting import RateLimiter
+from benchmarks.llm_server import LlmServer
+from benchmarks.synthetic import page_images_b64, report_text
+
+
+def make_apis(srv: LlmServer, args, limited: bool) -> sv.Apis:
+    limits = dict(requests=args.rpm, input=args.itpm, output=args.otpm) if limited else {}
+    return sv.Apis(
+        claude=anthropic.AsyncAnthropic(api_key="stub", base_url=srv.base_url, max_retries=0),
+        voyage=voyageai.AsyncClient(api_key="stub", base_url=srv.voyage_url),
+        claude_limits=RateLimiter("claude", args.period, **limits),
+        voyage_limits=RateLimiter("voyage", args.period),
+    )
+
+
+async def one(apis: sv.Apis, i: int, pages: int) -> None:
+    summary = await sv.query_claude(apis, report_text(seed=i), page_images_b64(pages), sv.SUMMARY_PROMPT)
+    await sv.get_embedding(apis, summary)
+
+
+async def fixed_pause(apis: sv.Apis, n: int, pages: int, pause: float) -> None:
+    for i in range(n):
+        await one(apis, i, pages)
+        await asyncio.sleep(pause)
+
+
+async def scheduled(apis: sv.Apis, n: int, pages: int, concurrency: int) -> None:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def run(i):
+        async with sem:
+            await one(apis, i, pages)
+
+    await asyncio.gather(*(run(i) for i in range(n)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reports", type=int, default=40)
+    parser.add_argument("--pause-reports", type=int, default=4, help="reports for the slow fixed-pause run")
+    parser.add_argument("--pages", type=int, default=2, help="page images per report")
+    parser.add_argument("--period", type=float, default=6.0, help="seconds per simulated minute")
+    parser.add_argument("--rpm", type=float, default=50)
+    parser.add_argument("--itpm", type=float, default=30_000)
+    parser.add_argument("--otpm", type=float, default=8_000)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("fixed pause", "scheduled"):
+        with LlmServer(rpm=args.rpm, input_tpm=args.itpm, output_tpm=args.otpm,
+                       period=args.period, latency=args.latency) as srv:
+            apis = make_apis(srv, args, limited=(mode == "scheduled"))
+            t0 = time.perf_counter()
+            if mode == "fixed pause":
+                n = args.pause_reports
+                asyncio.run(fixed_pause(apis, n, args.pages, args.period))
+            else:
+                n = args.reports
+                asyncio.run(scheduled(apis, n, args.pages, args.concurrency))
+            secs = time.perf_counter() - t0
+            results[mode] = (n, secs, dict(srv.stats), apis.claude_limits.summary())
+
+    for mode, (n, secs, stats, summary) in results.items():
+        minutes = secs / args.period
+        print(f"  {mode:11}: {n} reports in {minutes:5.1f} min  {n / minutes:5.1f} reports/min  "
+              f"in {stats['input_tokens'] / minutes:7,.0f}/{args.itpm:,.0f} TPM  "
+              f"out {stats['output_tokens'] / minutes:6,.0f}/{args.otpm:,.0f} TPM  "
+              f"{stats['throttled']} x 429")
+        print(f"               {summary}")
+    fixed = results["fixed pause"][0] / results["fixed pause"][1]
+    sched = results["scheduled"][0] / results["scheduled"][1]
+    print(f"  speed-up   : {sched / fixed:5.1f}x", flush=True)
+
+
+if __name__ == "__main__":
+    main()
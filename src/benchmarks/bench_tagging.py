@@ -0,0 +1,78 @@
+"""
+Bank tagger / noise filter benchmark.
+
+Times the old per-keyword regex loop against the precompiled matcher in
+helpers.database_helpers over synthetic email bodies, and checks that both
+give the same verdicts.
+
+    cd src && python -m benchmarks.bench_tagging --n 100000
+"""
+import argparse
+import random
+import re
+import time
+
+import helpers.database_helpers as database_helpers
+
+FILLER = (
+    "rates curve duration swap spread auction supply front end belly long bond "
+    "inflation breakevens payrolls cpi fomc ecb boj rba guidance positioning "
+    "flows carry roll steepener flattener receivers payers vol skew"
+).split()
+
+
+def legacy_detect_bank(text: str) -> str:
+    txt = text.lower()
+    for bank, kws in database_helpers.bank_keywords.items():
+        for kw in kws:
+            if re.search(rf"\b{re.escape(kw)}\b", txt):
+                return bank
+    return database_helpers.default_bank
+
+
+def legacy_is_unwanted(text: str) -> bool:
+    return any(kw in text.lower() for kw in database_helpers.unwanted_keywords)
+
+
+def synthetic_emails(n: int, words: int = 400, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    bank_kws = [kw for kws in database_helpers.bank_keywords.values() for kw in kws]
+    noise_kws = database_helpers.unwanted_keywords
+    emails = []
+    for _ in range(n):
+        body = [rng.choice(FILLER) for _ in range(words)]
+        if rng.random() < 0.8:
+            body.insert(rng.randrange(len(body)), rng.choice(bank_kws))
+        if rng.random() < 0.1:
+            body.insert(rng.randrange(len(body)), rng.choice(noise_kws))
+        subject = " ".join(rng.choice(FILLER) for _ in range(6)).title()
+        emails.append(f"{subject}\n{' '.join(body)}")
+    return emails
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--n", type=int, default=100_000, help="number of synthetic emails")
+    parser.add_argument("--words", type=int, default=400, help="words per body")
+    args = parser.parse_args()
+
+    print(f"Generating {args.n} synthetic emails ({args.words} words each)…", flush=True)
+    emails = synthetic_emails(args.n, args.words)
+
+    t0 = time.perf_counter()
+    legacy = [(legacy_detect_bank(e), legacy_is_unwanted(e)) for e in emails]
+    t_legacy = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    compiled = database_helpers.classify_emails(emails)
+    t_compiled = time.perf_counter() - t0
+
+    mismatches = sum(1 for (b, u), c in zip(legacy, compiled) if (b, u) != (c.bank, c.unwanted))
+    print(f"  legacy loop : {t_legacy:8.2f} s  ({args.n / t_legacy:10.0f} emails/s)")
+    print(f"  compiled    : {t_compiled:8.2f} s  ({args.n / t_compiled:10.0f} emails/s)")
+    print(f"  speed-up    : {t_legacy / t_compiled:8.1f}x")
+    print(f"  mismatches  : {mismatches}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Local stand-in for the Anthropic Messages API (plus Message Batches) and the
+Voyage embeddings API, with rate limits enforced the way the real services
+do it.
+
+    with LlmServer(rpm=50, input_tpm=30_000, output_tpm=8_000, period=6) as srv:
+        client = anthropic.AsyncAnthropic(api_key="x", base_url=srv.base_url)
+        vo = voyageai.AsyncClient(api_key="x", base_url=srv.voyage_url)
+
+Limits are token buckets refilled over *period* seconds (60 for real-time,
+less to run a "minute" faster). Output tokens are charged at max_tokens when
+a request starts and refunded down to what was generated when it ends.
+Requests the buckets can't cover get a 429 with retry-after and the
+anthropic-ratelimit-* headers. Input tokens are counted at 4 chars/token
+and width*height/750 per image, so the client's estimates run a little high,
+as they do against the real tokenizer.
+
+Message Batches are accepted whole and end *batch_latency* seconds after
+submission; a *batch_error_rate* share of their requests come back errored.
+An embeddings call containing *reject_marker* in any input gets a 400.
+A request that forces a tool call (tool_choice type "tool") gets a tool_use
+block with a made-up summary and tags drawn from TAGS.
+"""
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ai_summary.rate_limiting import TokenBucket, estimate_image_tokens, image_size
+
+
+def count_input_tokens(messages) -> int:
+    total = 0
+    for m in messages:
+        content = m["content"] if isinstance(m["content"], list) else [{"type": "text", "text": m["content"]}]
+        for block in content:
+            if block.get("type") == "text":
+                total += math.ceil(len(block["text"]) / 4)
+            elif block.get("type") == "image":
+                size = image_size(block["source"]["data"]) or (1568, 1568)
+                total += estimate_image_tokens(*size)
+    return total
+
+
+TAGS = {
+    "country": ["Japan", "United States", "Germany", "United Kingdom", "China", "Brazil"],
+    "region": ["Asia", "North America", "Europe", "Latin America"],
+    "topic": ["monetary policy", "yield curve", "credit", "fx", "inflation swaps"],
+    "impact": ["hawkish", "dovish", "risk-off", "curve steepening"],
+    "macro": ["inflation", "growth", "employment"],
+}
+
+
+def fake_tags(rnd: random.Random) -> dict:
+    return {facet: rnd.sample(values, rnd.randint(1, 2)) for facet, values in TAGS.items()}
+
+
+def fake_embedding(text: str, dim: int) -> list:
+    rnd = random.Random(hashlib.sha1(text.encode()).digest())
+    return [rnd.uniform(-1, 1) for _ in range(dim)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):  # keep benchmark output clean
+        pass
+
+    def _json(self, status: int, payload, headers=None) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, str(v))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        srv = self.server.owner
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        route = self.path.split("?")[0].rstrip("/")
+        handler = srv.routes.get(route)
+        if handler is None:
+            self._json(404, {"type": "error", "error": {"type": "not_found_error", "message": route}})
+            return
+        handler(self, request)
+
+    def do_GET(self):
+        srv = self.server.owner
+        route = self.path.split("?")[0].rstrip("/")
+        for prefix, handler in srv.get_routes.items():
+            if route.startswith(prefix):
+                handler(self, route[len(prefix):].strip("/"))
+                return
+        self._json(404, {"type": "error", "error": {"type": "not_found_error", "message": route}})
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    owner: "LlmServer"
+
+
+class LlmServer:
+    def __init__(
+        self,
+        rpm: float = 50,
+        input_tpm: float = 30_000,
+        output_tpm: float = 8_000,
+        embed_rpm: float = 300,
+        embed_tpm: float = 1_000_000,
+        period: float = 60.0,
+        latency: float = 0.5,
+        output_tokens: int = 400,
+        batch_latency: float = 1.0,
+        batch_error_rate: float = 0.0,
+        reject_marker: str = "",
+        dim: int = 1536,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.period = period
+        self.latency = latency
+        self.output_tokens = output_tokens
+        self.batch_latency = batch_latency
+        self.batch_error_rate = batch_error_rate
+        self.batches = {}
+        self.reject_marker = reject_marker
+        self.dim = dim
+        self.limits = {
+            "requests": TokenBucket(rpm, period),
+            "input": TokenBucket(input_tpm, period),
+            "output": TokenBucket(output_tpm, period),
+        }
+        self.embed_limits = {"requests": TokenBucket(embed_rpm, period), "input": TokenBucket(embed_tpm, period)}
+        self.stats = {"messages": 0, "embed_calls": 0, "embedded": 0, "throttled": 0,
+                      "input_tokens": 0, "output_tokens": 0, "batches": 0, "batched": 0}
+        self.routes = {
+            "/v1/messages": self._messages,
+            "/v1/messages/batches": self._create_batch,
+            "/v1/embeddings": self._embeddings,
+        }
+        self.get_routes = {"/v1/messages/batches": self._get_batch}
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.owner = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def voyage_url(self) -> str:
+        return self.base_url + "/v1"
+
+    # ─── limits ──────────────────────────────────────────────────────────────
+    def _admit(self, buckets, costs) -> float:
+        """Charge *costs* if every bucket covers them; else seconds to wait."""
+        with self._lock:
+            wait = max(b.delay(costs[k]) for k, b in buckets.items())
+            if wait > 0:
+                self.stats["throttled"] += 1
+                return wait
+            for k, b in buckets.items():
+                b.take(costs[k])
+            return 0.0
+
+    def _headers(self) -> dict:
+        with self._lock:
+            out = {}
+            for key, name in (("requests", "requests"), ("input", "input-tokens"), ("output", "output-tokens")):
+                b = self.limits[key]
+                b._refill()
+                out[f"anthropic-ratelimit-{name}-limit"] = int(b.capacity)
+                out[f"anthropic-ratelimit-{name}-remaining"] = max(0, int(b.level))
+            return out
+
+    def _throttle(self, h: _Handler, wait: float) -> None:
+        headers = self._headers()
+        headers["retry-after"] = math.ceil(wait)
+        h._json(429, {"type": "error", "error": {"type": "rate_limit_error", "message": "rate limited"}}, headers)
+
+    # ─── endpoints ───────────────────────────────────────────────────────────
+    def complete(self, request: dict) -> dict:
+        """Message body for one request (also used by the batch endpoints)."""
+        n_in = count_input_tokens(request["messages"])
+        n_out = min(request["max_tokens"], self.output_tokens)
+        with self._lock:
+            self.stats["messages"] += 1
+            self.stats["input_tokens"] += n_in
+            self.stats["output_tokens"] += n_out
+        text = " ".join(["summary"] * n_out)
+        content = [{"type": "text", "text": text}]
+        stop_reason = "end_turn"
+        choice = request.get("tool_choice") or {}
+        if choice.get("type") == "tool":
+            content = [{"type": "tool_use", "id": "toolu_" + hashlib.sha1(text.encode()).hexdigest()[:24],
+                        "name": choice["name"], "input": {"summary": text, "tags": fake_tags(random.Random())}}]
+            stop_reason = "tool_use"
+        return {
+            "id": "msg_" + hashlib.sha1(f"{time.time()}{random.random()}".encode()).hexdigest()[:24],
+            "type": "message",
+            "role": "assistant",
+            "model": request["model"],
+            "content": content,
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": {"input_tokens": n_in, "output_tokens": n_out},
+        }
+
+    def _messages(self, h: _Handler, request: dict) -> None:
+        costs = {"requests": 1, "input": count_input_tokens(request["messages"]), "output": request["max_tokens"]}
+        wait = self._admit(self.limits, costs)
+        if wait:
+            self._throttle(h, wait)
+            return
+        time.sleep(self.latency)
+        body = self.complete(request)
+        with self._lock:
+            self.limits["output"].give(request["max_tokens"] - body["usage"]["output_tokens"])
+        h._json(200, body, self._headers())
+
+    def _embeddings(self, h: _Handler, request: dict) -> None:
+        texts = request["input"] if isinstance(request["input"], list) else [request["input"]]
+        if any(self.reject_marker and self.reject_marker in t for t in texts):
+            h._json(400, {"detail": "input rejected by stub"})
+            return
+        tokens = sum(math.ceil(len(t) / 4) for t in texts)
+        wait = self._admit(self.embed_limits, {"requests": 1, "input": tokens})
+        if wait:
+            h._json(429, {"detail": "rate limited"}, {"retry-after": math.ceil(wait)})
+            return
+        time.sleep(self.latency / 5)
+        with self._lock:
+            self.stats["embed_calls"] += 1
+            self.stats["embedded"] += len(texts)
+        h._json(200, {
+            "object": "list",
+            "data": [{"object": "embedding", "embedding": fake_embedding(t, self.dim), "index": i}
+                     for i, t in enumerate(texts)],
+            "model": request.get("model"),
+            "usage": {"total_tokens": tokens},
+        })
+
+    # ─── message batches ─────────────────────────────────────────────────────
+    def _batch_object(self, batch_id: str) -> dict:
+        b = self.batches[batch_id]
+        ended = time.time() >= b["ends_at"]
+        n = len(b["requests"])
+        errored = sum(1 for r in b["results"] if r["result"]["type"] == "errored") if ended else 0
+        stamp = lambda t: time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else n,
+                "succeeded": n - errored if ended else 0,
+                "errored": errored,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": stamp(b["created_at"]),
+            "expires_at": stamp(b["created_at"] + 86400),
+            "ended_at": stamp(b["ends_at"]) if ended else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": f"{self.base_url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def _create_batch(self, h: _Handler, request: dict) -> None:
+        batch_id = "msgbatch_" + hashlib.sha1(f"{time.time()}{random.random()}".encode()).hexdigest()[:24]
+        results = []
+        for r in request["requests"]:
+            if random.random() < self.batch_error_rate:
+                result = {"type": "errored", "error": {"type": "error", "error": {
+                    "type": "overloaded_error", "message": "stub batch error"}}}
+            else:
+                result = {"type": "succeeded", "message": self.complete(r["params"])}
+            results.append({"custom_id": r["custom_id"], "result": result})
+        now = time.time()
+        with self._lock:
+            self.batches[batch_id] = {"requests": request["requests"], "results": results,
+                                      "created_at": now, "ends_at": now + self.batch_latency}
+            self.stats["batches"] += 1
+            self.stats["batched"] += len(results)
+        h._json(200, self._batch_object(batch_id))
+
+    def _get_batch(self, h: _Handler, rest: str) -> None:
+        batch_id, _, tail = rest.partition("/")
+        if batch_id not in self.batches:
+            h._json(404, {"type": "error", "error": {"type": "not_found_error", "message": batch_id}})
+        elif tail == "results":
+            body = "\n".join(json.dumps(r) for r in self.batches[batch_id]["results"]).encode()
+            h.send_response(200)
+            h.send_header("Content-Type", "application/binary")
+            h.send_header("Content-Length", str(len(body)))
+            h.end_headers()
+            h.wfile.write(body)
+        else:
+            h._json(200, self._batch_object(batch_id))
+
+    # ─── lifecycle ───────────────────────────────────────────────────────────
+    def start(self) -> "LlmServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "LlmServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,157 @@
+"""
+Local stand-in for a bank research portal: serves synthetic PDFs over HTTP
+with injectable latency and errors.
+
+    with PdfServer(latency=0.5, error_rate=0.1) as srv:
+        url = srv.url("note-1.pdf")
+
+Any request can override the server defaults with query parameters:
+``latency`` (seconds), ``size_kb``, ``pages``, ``status`` (force a reply
+code) and ``cut_kb`` (drop the connection after that much of the body, to
+simulate a flaky link). Every path ending in .pdf exists; its bytes depend
+only on the name. ETag / If-None-Match and single byte ranges are honoured.
+"""
+import hashlib
+import random
+import threading
+import time
+import zlib
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.synthetic import make_pdf
+
+
+@lru_cache(maxsize=256)
+def _pdf_bytes(name: str, pages: int, size_kb: int) -> bytes:
+    body = make_pdf(pages=pages, seed=zlib.crc32(name.encode()))
+    pad = max(0, size_kb * 1024 - len(body))
+    return make_pdf(pages=pages, pad_bytes=pad, seed=zlib.crc32(name.encode())) if pad else body
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):  # keep benchmark output clean
+        pass
+
+    def do_GET(self):
+        srv = self.server.owner
+        url = urlparse(self.path)
+        qs = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        srv._count("requests")
+
+        latency = float(qs.get("latency", srv.latency))
+        if srv.jitter:
+            latency += random.uniform(0, srv.jitter)
+        time.sleep(latency)
+
+        status = int(qs.get("status", 0))
+        if not status and srv.error_rate and random.random() < srv.error_rate:
+            status = 503
+        if not url.path.lower().endswith(".pdf"):
+            status = status or 404
+        if status and status != 200:
+            srv._count("errors")
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            if status in (429, 503):
+                self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+
+        body = _pdf_bytes(url.path, int(qs.get("pages", srv.pages)), int(qs.get("size_kb", srv.size_kb)))
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            srv._count("not_modified")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start = 0
+        rng = self.headers.get("Range", "")
+        if rng.startswith("bytes=") and self.headers.get("If-Range", etag) == etag:
+            start = int(rng[6:].split("-")[0] or 0)
+        if start >= len(body) > 0:
+            srv._count("errors")
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(body)}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        part = body[start:]
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("ETag", etag)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(len(part)))
+        if start:
+            srv._count("ranges")
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        self.end_headers()
+
+        cut = qs.get("cut_kb")
+        if cut is not None and not start:
+            part = part[:int(cut) * 1024]
+            self.close_connection = True
+        self.wfile.write(part)
+        srv._count("bytes", len(part))
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    owner: "PdfServer"
+
+
+class PdfServer:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        size_kb: int = 256,
+        pages: int = 4,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.size_kb = size_kb
+        self.pages = pages
+        self.stats = {"requests": 0, "errors": 0, "bytes": 0, "ranges": 0, "not_modified": 0}
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.owner = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, name: str, **params) -> str:
+        query = "&".join(f"{k}={v}" for k, v in params.items())
+        return f"{self.base_url}/{name}" + (f"?{query}" if query else "")
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    def start(self) -> "PdfServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "PdfServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,96 @@
+"""
+Throwaway Postgres for the benchmarks: a fresh cluster in a temp folder,
+gone again when the run ends, so nothing is measured against (or left
+behind in) a real database.
+
+    with ScratchPostgres() as dsn:
+        configure(dsn)           # point system_config at it
+        ...
+
+The pgserver package (pip install pgserver) is used when it's installed -
+it bundles Postgres and pgvector. Otherwise initdb / pg_ctl are run from
+POSTGRES_BIN or the PATH, and that server needs the pgvector extension
+installed for the report_vectors tables.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import configuration.system_config as sysconfig
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _binary(name: str) -> str:
+    folder = os.environ.get("POSTGRES_BIN")
+    path = shutil.which(name, path=folder) if folder else shutil.which(name)
+    if not path:
+        raise RuntimeError(
+            f"{name} not found: pip install pgserver, or put the Postgres binaries on PATH / POSTGRES_BIN"
+        )
+    return path
+
+
+class ScratchPostgres:
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or tempfile.mkdtemp(prefix="bench-pg-"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.dsn: Optional[dict] = None
+        self._pgserver = None
+
+    def start(self) -> dict:
+        try:
+            import pgserver
+        except ImportError:
+            pgserver = None
+        if pgserver is not None:
+            from psycopg.conninfo import conninfo_to_dict
+
+            self._pgserver = pgserver.get_server(self.root / "data", cleanup_mode="delete")
+            self.dsn = conninfo_to_dict(self._pgserver.get_uri())
+            self.dsn.setdefault("password", "")
+        else:
+            data, port = self.root / "data", _free_port()
+            subprocess.run([_binary("initdb"), "-D", str(data), "-U", "postgres", "-A", "trust", "-E", "UTF8"],
+                           check=True, capture_output=True)
+            subprocess.run([_binary("pg_ctl"), "-D", str(data), "-l", str(self.root / "postgres.log"), "-w",
+                            "-o", f"-p {port} -c listen_addresses=127.0.0.1 -k \"{self.root}\"", "start"],
+                           check=True, capture_output=True)
+            self.dsn = {"host": "127.0.0.1", "port": port, "dbname": "postgres", "user": "postgres", "password": ""}
+        print(f"Scratch Postgres at {self.root}", flush=True)
+        return self.dsn
+
+    def stop(self) -> None:
+        if self._pgserver is not None:
+            self._pgserver.cleanup()
+            self._pgserver = None
+        elif self.dsn is not None:
+            subprocess.run([_binary("pg_ctl"), "-D", str(self.root / "data"), "-m", "immediate", "-w", "stop"],
+                           capture_output=True)
+        self.dsn = None
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self) -> dict:
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def configure(dsn: dict) -> None:
+    """Point system_config at *dsn*: DSN is updated in place, since modules hold on to that dict."""
+    sysconfig.DSN.clear()
+    sysconfig.DSN.update(dsn)
+    sysconfig.DB_HOST = dsn.get("host", "localhost")
+    sysconfig.DB_PORT = int(dsn.get("port") or 5432)
+    sysconfig.DB_NAME = dsn.get("dbname", "postgres")
+    sysconfig.DB_USERNAME = dsn.get("user", "postgres")
+    sysconfig.DB_PASSWORD = dsn.get("password", "")
@@ -0,0 +1,126 @@
+"""
+Synthetic inputs for the benchmarks: well-formed multi-page PDFs, page
+images, report text, bank-style email HTML pointing at the PDFs and whole
+RFC 822 messages around it.
+"""
+import base64
+import html
+import random
+from datetime import datetime
+from email.message import EmailMessage
+from email.utils import format_datetime, make_msgid
+import struct
+import zlib
+
+LOREM = (
+    "duration supply front end belly curve steepener flattener swap spread "
+    "breakevens payrolls inflation guidance auction tails carry roll vol skew "
+    "receivers payers positioning flows policy rate terminal cuts hikes"
+).split()
+
+
+def make_pdf(pages: int = 1, lines_per_page: int = 40, pad_bytes: int = 0, seed: int = 0) -> bytes:
+    """
+    A valid PDF with *pages* pages of Helvetica text. *pad_bytes* of
+    incompressible junk go in an unreferenced stream object, to reach a
+    target file size without changing what renders.
+    """
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for p in range(pages):
+        text = [f"BT /F1 18 Tf 72 760 Td (Synthetic research note - page {p + 1}) Tj ET"]
+        for i in range(lines_per_page):
+            words = " ".join(rng.choice(LOREM) for _ in range(12))
+            text.append(f"BT /F1 10 Tf 72 {730 - i * 16} Td ({words}) Tj ET")
+        stream = "\n".join(text).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), pages)
+    if pad_bytes:
+        junk = rng.randbytes(pad_bytes)
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(junk), junk))
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (num, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def jpm_email_html(pdf_url: str, subject: str) -> str:
+    """Saved-email HTML shaped like a J.P. Morgan research alert."""
+    return (
+        f"<html><head><title>{html.escape(subject)}</title></head><body>"
+        f"<p>{html.escape(subject)}</p>"
+        f"<p class=\"originaldocumentlink\"><a href=\"{html.escape(pdf_url)}\">Read the full report</a></p>"
+        "</body></html>"
+    )
+
+
+def gs_email_html(pdf_url: str, subject: str) -> str:
+    """Saved-email HTML shaped like a Goldman Sachs research alert."""
+    return (
+        f"<html><head><title>{html.escape(subject)}</title></head><body>"
+        f"<h2>{html.escape(subject)}</h2><a href=\"https://gs.example/unsubscribe\">unsubscribe</a>"
+        f"<a href=\"{html.escape(pdf_url)}\">Download PDF</a></body></html>"
+    )
+
+
+def make_email(subject: str, markup: str, received: datetime, sender: str = "research@bank.example") -> bytes:
+    """A multipart/alternative message (plain text and *markup*), as a mail archive would hold it."""
+    msg = EmailMessage()
+    msg["From"] = sender
+    msg["To"] = "desk@example.com"
+    msg["Subject"] = subject
+    msg["Date"] = format_datetime(received.astimezone())
+    msg["Message-ID"] = make_msgid(domain="bench.example")
+    msg.set_content(f"{subject}\n\nThe full report is linked in the HTML version of this email.")
+    msg.add_alternative(markup, subtype="html")
+    return msg.as_bytes()
+
+
+def report_text(chars: int = 12_000, seed: int = 0) -> str:
+    """Research-note-ish prose of about *chars* characters."""
+    rng = random.Random(seed)
+    words = []
+    while sum(len(w) + 1 for w in words) < chars:
+        words.append(rng.choice(LOREM))
+    return " ".join(words)[:chars]
+
+
+def make_png(width: int, height: int) -> bytes:
+    """A blank greyscale PNG of the given size (valid, and tiny once deflated)."""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    rows = b"".join(b"\x00" + b"\xff" * width for _ in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows, 9))
+        + chunk(b"IEND", b"")
+    )
+
+
+def page_images_b64(pages: int, width: int = 850, height: int = 1100) -> list:
+    """Base64 PNG PageImages shaped like rendered letter-size pages."""
+    from ai_summary.page_rendering import PageImage
+
+    png = base64.b64encode(make_png(width, height)).decode()
+    return [PageImage(p + 1, "image/png", png) for p in range(pages)]
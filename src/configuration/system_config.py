@@ -20,6 +20,152 @@ DSN = {
     "password": DB_PASSWORD,
 }
 
+# email_scraper: default lookback window and per-run message cap
+DB_LAG_DAYS   = 7
+DB_MAX_EMAILS = 5000
+
+# Mail source for email_scraper: "outlook", or a local archive at MAILBOX_PATH
+# ("maildir", "mbox", "eml" for a directory of .eml files, "local" to detect)
+MAIL_SOURCE        = "outlook"
+MAILBOX_PATH       = None
+MAIL_PARSE_WORKERS = None   # parser processes for local archives; None = all cores
+
+# emails_final bulk writer: flush after this many rows, raw bytes or seconds
+EMAIL_BATCH_ROWS    = 500
+EMAIL_BATCH_BYTES   = 64 * 1024 * 1024
+EMAIL_BATCH_SECONDS = 5.0
+
+# PDF downloader concurrency: worker threads overall, in flight per bank and
+# per remote host; transient HTTP failures retried with jittered backoff
+DOWNLOAD_WORKERS      = 8
+DOWNLOAD_PER_BANK     = 4
+DOWNLOAD_PER_HOST     = 4
+DOWNLOAD_RETRIES      = 4
+DOWNLOAD_BACKOFF_BASE = 1.0
+DOWNLOAD_BACKOFF_CAP  = 30.0
+HTTP_TIMEOUT          = (10, 60)   # (connect, read) seconds
+DOWNLOAD_CHUNK_SIZE   = 1024 * 1024
+# ETag/Last-Modified, checksums and resumable partials, keyed by URL
+DOWNLOAD_STATE_FOLDER = os.path.join(DOWNLOAD_FOLDER, ".state")
+
+# GS handler: long-lived headless Chrome drivers, recycled after N downloads
+GS_DRIVER_POOL_SIZE = 2
+GS_DRIVER_MAX_USES  = 50
+
+# download_jobs / ingest_jobs work queues: jobs claimed per round trip, how
+# long a claim is held before another worker may take it over, and retries
+# (failed jobs wait JOB_RETRY_DELAY * 2^(attempt-1) seconds before the next)
+DOWNLOAD_CLAIM_BATCH   = 32
+DOWNLOAD_LEASE_SECONDS = 1800
+INGEST_CLAIM_BATCH     = 4
+INGEST_LEASE_SECONDS   = 900
+JOB_MAX_ATTEMPTS       = 3
+JOB_RETRY_DELAY        = 300.0
+
+# run/run.py: stages hand emails/reports to the next through in-memory queues
+# of at most PIPELINE_QUEUE_SIZE items (a full queue holds the stage feeding
+# it); with --watch the scraper re-polls every PIPELINE_WATCH_SECONDS
+PIPELINE_QUEUE_SIZE    = 256
+PIPELINE_WATCH_SECONDS = 60
+
+# Summarisation/embedding API limits, per minute – set these to the org's tier.
+# Calls are paced by token buckets against these; 429s back everyone off.
+ANTHROPIC_BASE_URL  = None      # None = api.anthropic.com; point at a stub for offline runs
+CLAUDE_RPM          = 50
+CLAUDE_INPUT_TPM    = 30_000
+CLAUDE_OUTPUT_TPM   = 8_000
+VOYAGE_BASE_URL     = None
+VOYAGE_RPM          = 300
+VOYAGE_TPM          = 1_000_000
+SUMMARY_CONCURRENCY = 8         # reports in flight at once
+API_MAX_ATTEMPTS    = 6
+API_BACKOFF_BASE    = 2.0
+API_BACKOFF_CAP     = 60.0
+
+# Page images sent with each summary request: the first RENDER_MAX_PAGES
+# pages, long edge RENDER_MAX_EDGE px (RENDER_DPI if None), as jpeg/png/webp,
+# rendered RENDER_WINDOW pages at a time
+RENDER_MAX_PAGES = 30
+RENDER_MAX_EDGE  = 1568
+RENDER_DPI       = 150
+RENDER_FORMAT    = "jpeg"
+RENDER_QUALITY   = 80
+RENDER_WINDOW    = 4
+
+# Text layer: extracted EXTRACT_WINDOW pages per task and kept per page in
+# report_pages (keyed by content hash) so it's only ever parsed once.
+# Rendering and extraction share one pool of PDF_WORKERS processes.
+EXTRACT_WINDOW   = 16
+PDF_WORKERS      = None     # None = all cores
+
+# Chunks of at most CHUNK_TOKENS (estimated) tokens are stored and embedded
+# per report. Reports whose text is longer than the single-request budget
+# are summarised map-reduce: groups of chunks up to SUMMARY_MAP_TOKENS are
+# condensed concurrently (SUMMARY_MAP_MAX_TOKENS out each), then combined.
+CHUNK_TOKENS           = 800
+SUMMARY_MAP_TOKENS     = 12_000
+SUMMARY_MAP_MAX_TOKENS = 800
+
+# Voyage embeddings: texts are sent in batches of up to EMBED_BATCH_SIZE
+# inputs / EMBED_BATCH_TOKENS (estimated) tokens; concurrent callers wait at
+# most EMBED_MAX_WAIT seconds for a batch to fill
+EMBED_MODEL        = "voyage-large-2"
+EMBED_DIM          = 1536       # dimension of EMBED_MODEL; pgvector columns are typed to it
+EMBED_BATCH_SIZE   = 128
+EMBED_BATCH_TOKENS = 100_000
+EMBED_MAX_WAIT     = 0.5
+
+# summary_cache / embedding_cache: API results keyed by content, reused across
+# runs. Entries unused for CACHE_MAX_AGE_DAYS are dropped, and each table is
+# trimmed to its CACHE_MAX_ROWS most recently used.
+API_CACHE          = True
+CACHE_MAX_AGE_DAYS = 180
+CACHE_MAX_ROWS     = 500_000
+
+# ingest_and_vectorize_reports(mode="batch"): Message Batches submissions.
+# The API allows 100k requests / 256 MB per batch and up to 24 h to finish.
+BATCH_MAX_REQUESTS  = 10_000
+BATCH_MAX_BYTES     = 200 * 1024 * 1024
+BATCH_CLAIM         = 200        # reports claimed from ingest_jobs per round trip
+BATCH_LEASE_SECONDS = 26 * 3600  # claims outlive the batch's 24 h window
+BATCH_POLL_SECONDS  = 60
+
+# pgvector storage for report_vectors / report_chunks embeddings: "vector"
+# (4 bytes/dim) or "halfvec" (2 bytes/dim, pgvector >= 0.7), with an HNSW
+# cosine index. search.pgvector_store migrates DOUBLE PRECISION[] columns
+# VECTOR_MIGRATE_BATCH rows at a time.
+VECTOR_TYPE          = "vector"
+HNSW_M               = 16
+HNSW_EF_CONSTRUCTION = 64
+HNSW_EF_SEARCH       = 100
+VECTOR_MIGRATE_BATCH = 2000
+
+# search.hybrid_search: full-text (GIN over report_vectors.summary and
+# report_pages.text, FTS_CONFIG text search configuration) fused with vector
+# kNN by reciprocal rank fusion, 1 / (RRF_K + rank) per leg over the top
+# HYBRID_CANDIDATES of each. A summary match counts SUMMARY_RANK_WEIGHT
+# times a match in the report text.
+FTS_CONFIG          = "english"
+HYBRID_CANDIDATES   = 100
+RRF_K               = 60
+SUMMARY_RANK_WEIGHT = 2.0
+
+# search.vector_index: float32 embedding matrix memory-mapped from
+# SEARCH_INDEX_FOLDER, topped up from report_vectors before each query.
+# Rows that landed up to SEARCH_REFRESH_SLACK seconds before the last one
+# seen are re-read, in case they committed late.
+SEARCH_INDEX_FOLDER  = os.path.join(DOWNLOAD_FOLDER, ".search")
+SEARCH_REFRESH_SLACK = 300
+
+# helpers.metrics: per-stage timings and counters. METRICS_JSON_LOG gets a
+# JSON line per stage span ("-" = stderr), METRICS_TEXTFILE the Prometheus
+# text format (node_exporter textfile collector), rewritten every
+# METRICS_FLUSH_SECONDS while run.py runs, and METRICS_PORT serves /metrics.
+METRICS_JSON_LOG      = None
+METRICS_TEXTFILE      = None
+METRICS_PORT          = None
+METRICS_FLUSH_SECONDS = 15
+
 # API keys
 API_KEY     = "YOUR_API_KEY"
 VOYAGE_KEY  = "YOUR_VOYAGE_KEY"
@@ -1,24 +1,201 @@
 # File: downloaders/gs_downloader.py
+from contextlib import contextmanager
 from pathlib import Path
+import atexit
 import os
+import shutil
+import tempfile
+import threading
+import requests
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 
 import time
 
+import configuration.system_config as system_config
+from helpers import metrics
+from helpers.downloader_helpers import PDF_HREF, NotAPdfError, download_pdf_with_requests, find_link_static
 
-def wait_for_new_pdf(folder: Path, before: set[str], timeout: int = 60) -> Path:
+try:  # filesystem events wake the wait immediately; fast polling otherwise
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+PARTIAL_SUFFIXES = (".crdownload", ".tmp", ".part")
+
+
+# ─── DRIVER POOL ─────────────────────────────────────────────────────────────
+class PooledDriver:
+    """A headless Chrome that downloads into its own private directory."""
+
+    def __init__(self, download_dir: Path):
+        self.download_dir = download_dir
+        self.uses = 0
+        options = Options()
+        options.add_argument("--headless=new")
+        options.add_experimental_option(
+            "prefs", {
+                "download.default_directory": str(download_dir),
+                "download.prompt_for_download": False,
+                "plugins.always_open_pdf_externally": True,
+            }
+        )
+        self.driver = webdriver.Chrome(options=options)
+
+    def healthy(self) -> bool:
+        try:
+            return self.driver.execute_script("return 1") == 1
+        except WebDriverException:
+            return False
+
+    def quit(self) -> None:
+        try:
+            self.driver.quit()
+        except WebDriverException:
+            pass
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+
+
+class ChromeDriverPool:
+    """
+    Up to *size* long-lived drivers shared by the GS handler. A driver is
+    health-checked before each checkout and recycled after *max_uses*
+    downloads, so a leaking or crashed Chrome never lives long.
+    """
+
+    def __init__(self, size: int, max_uses: int):
+        self.size = size
+        self.max_uses = max_uses
+        self._root = Path(tempfile.mkdtemp(prefix="gs_chrome_"))
+        self._idle: list[PooledDriver] = []
+        # guards _idle and _live; notified whenever a driver goes back idle
+        # or a slot frees up, so a waiting checkout can take it
+        self._slots = threading.Condition()
+        self._live = 0
+
+    def _checkout(self) -> PooledDriver:
+        while True:
+            with self._slots:
+                while not self._idle and self._live >= self.size:
+                    self._slots.wait()
+                if self._idle:
+                    pooled = self._idle.pop()
+                else:
+                    self._live += 1
+                    pooled = None
+            if pooled is None:
+                try:
+                    return PooledDriver(Path(tempfile.mkdtemp(dir=self._root)))
+                except Exception:
+                    self._release_slot()
+                    raise
+            if pooled.healthy():
+                return pooled
+            self._retire(pooled)
+
+    def _release_slot(self) -> None:
+        with self._slots:
+            self._live -= 1
+            self._slots.notify()
+
+    def _retire(self, pooled: PooledDriver) -> None:
+        pooled.quit()
+        self._release_slot()
+
+    def _return(self, pooled: PooledDriver) -> None:
+        with self._slots:
+            self._idle.append(pooled)
+            self._slots.notify()
+
+    @contextmanager
+    def driver(self):
+        pooled = self._checkout()
+        try:
+            # anything a previous, timed-out download left behind
+            for name in os.listdir(pooled.download_dir):
+                (pooled.download_dir / name).unlink(missing_ok=True)
+            yield pooled
+        finally:
+            pooled.uses += 1
+            if pooled.uses >= self.max_uses:
+                self._retire(pooled)
+            else:
+                self._return(pooled)
+
+    def close(self) -> None:
+        with self._slots:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._retire(pooled)
+        shutil.rmtree(self._root, ignore_errors=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_driver_pool() -> ChromeDriverPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ChromeDriverPool(system_config.GS_DRIVER_POOL_SIZE, system_config.GS_DRIVER_MAX_USES)
+        return _pool
+
+
+@atexit.register
+def shutdown_driver_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+# ─── DOWNLOAD DETECTION ──────────────────────────────────────────────────────
+def _finished_pdfs(folder: Path) -> set[str]:
+    names = os.listdir(folder)
+    partial = {n.rsplit(".", 1)[0] for n in names if n.lower().endswith(PARTIAL_SUFFIXES)}
+    return {n for n in names if n.lower().endswith(".pdf") and n not in partial}
+
+
+def wait_for_new_pdf(folder: Path, before: set[str], timeout: int = 60, poll: float = 0.25) -> Path:
     """
-    Poll *folder* until a new .pdf appears that wasn't in *before*.
+    Wait until a complete new .pdf appears in *folder* that wasn't in
+    *before*. Chrome's .crdownload partials are ignored, and a file only
+    counts once its size has stopped changing between two looks. With
+    watchdog installed, filesystem events end each wait as soon as anything
+    in *folder* changes; otherwise it is a short poll.
     """
-    deadline = time.time() + timeout
-    while time.time() < deadline:
-        now = {f for f in os.listdir(folder) if f.lower().endswith(".pdf")}
-        new = now - before
-        if new:
-            return folder / new.pop()
-        time.sleep(15)
+    changed = threading.Event()
+    observer = None
+    if Observer is not None:
+        handler = FileSystemEventHandler()
+        handler.on_any_event = lambda event: changed.set()
+        observer = Observer()
+        observer.schedule(handler, str(folder), recursive=False)
+        observer.start()
+
+    sizes: dict[str, int] = {}
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            for name in _finished_pdfs(folder) - before:
+                try:
+                    size = (folder / name).stat().st_size
+                except FileNotFoundError:
+                    continue
+                if size and sizes.get(name) == size:
+                    return folder / name
+                sizes[name] = size
+            changed.wait(poll)
+            changed.clear()
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
     raise TimeoutError("No new PDF detected in %s within %s s" % (folder, timeout))
 
 
@@ -29,42 +206,42 @@ def download_via_click(
     timeout: int = 60,
 ) -> Path:
     """
-    Opens the given HTML file in headless Chrome, clicks the element
-    matching the provided XPath, waits for a new PDF download, and
+    Opens the given HTML file in a pooled headless Chrome, clicks the element
+    matching the provided XPath, waits for the PDF to land in that driver's
+    private download directory, moves it into *download_folder* and
     returns its Path.
     """
     # Ensure download directory exists
     download_folder.mkdir(parents=True, exist_ok=True)
-    # Record existing PDFs
-    before = {f for f in os.listdir(download_folder) if f.lower().endswith('.pdf')}
-
-    # Configure headless Chrome
-    options = Options()
-    options.headless = True
-    options.add_experimental_option(
-        "prefs", {
-            "download.default_directory": str(download_folder),
-            "plugins.always_open_pdf_externally": True,
-        }
-    )
-
-    driver = webdriver.Chrome(options=options)
-    try:
-        # Load the local HTML email
-        driver.get(html_path.as_uri())
-        # Click the PDF link via XPath
-        driver.find_element(By.XPATH, xpath).click()
+
+    with get_driver_pool().driver() as pooled:
+        # Record existing PDFs (none: the pool hands out an emptied folder)
+        before = _finished_pdfs(pooled.download_dir)
+        with metrics.timer("link", via="chrome"):
+            # Load the local HTML email
+            pooled.driver.get(html_path.as_uri())
+            # Click the PDF link via XPath
+            pooled.driver.find_element(By.XPATH, xpath).click()
         # Wait for the PDF to appear
-        return wait_for_new_pdf(download_folder, before, timeout)
-    finally:
-        driver.quit()
+        pdf = wait_for_new_pdf(pooled.download_dir, before, timeout)
+        # moved out before the driver goes back: the next checkout empties its folder
+        return Path(shutil.move(str(pdf), str(download_folder / pdf.name)))
 
 
 def dl_gs(html: Path, folder: Path) -> Path:
     """
     Downloader wrapper for Goldman Sachs research PDFs:
-    looks for any <a> whose href contains "pdf" (case-insensitive) and clicks it.
+    looks for any <a> whose href contains "pdf" (case-insensitive) and
+    fetches it over plain HTTP. Chrome is only started (to click the link)
+    when the static parse finds nothing or the fetch doesn't yield a PDF.
     """
+    pdf_url = find_link_static(str(html), PDF_HREF)
+    if pdf_url:
+        try:
+            return Path(download_pdf_with_requests(pdf_url, str(folder)))
+        except (requests.RequestException, NotAPdfError):
+            pass  # portal login page, dead link or similar
+
     # Use XPath that matches links ending in .pdf
     xpath = "//a[contains(translate(@href, 'PDF', 'pdf'), 'pdf')]"
     return download_via_click(html, folder, xpath)
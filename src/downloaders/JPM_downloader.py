@@ -1,8 +1,6 @@
 # File: downloaders/jpm_downloader.py
 import os
 from pathlib import Path
-import requests
-from urllib.parse import urlparse, parse_qs, unquote_plus
 
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -10,8 +8,28 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+from helpers import metrics
+from helpers.downloader_helpers import (
+    JPM_ORIGINAL_DOCUMENT,
+    download_pdf_with_requests,
+    find_link_static,
+    unwrap_safelinks,
+)
+
 
 def find_jpmorgan_link(html_path: str) -> str:
+    """
+    Read the <p class="originaldocumentlink"> link straight from the saved
+    HTML; only if that finds nothing, fall back to rendering it in Chrome.
+    """
+    href = find_link_static(html_path, JPM_ORIGINAL_DOCUMENT)
+    if href:
+        return href
+    with metrics.timer("link", via="chrome"):
+        return find_jpmorgan_link_chrome(html_path)
+
+
+def find_jpmorgan_link_chrome(html_path: str) -> str:
     """
     1. Load the local HTML file in headless Chrome.
     2. Locate the <p class="originaldocumentlink"> element.
@@ -32,25 +50,7 @@ def find_jpmorgan_link(html_path: str) -> str:
     finally:
         driver.quit()
 
-    parsed = urlparse(href)
-    qs = parse_qs(parsed.query)
-    return unquote_plus(qs.get("url", [href])[0])
-
-
-def download_pdf_with_requests(pdf_url: str, download_folder: str) -> str:
-    """
-    Download the given PDF URL over HTTP.
-    Returns the local file path.
-    """
-    os.makedirs(download_folder, exist_ok=True)
-    resp = requests.get(pdf_url, stream=True)
-    resp.raise_for_status()
-    filename = os.path.basename(urlparse(pdf_url).path) or "document.pdf"
-    out_path = os.path.join(download_folder, filename)
-    with open(out_path, "wb") as f:
-        for chunk in resp.iter_content(1024):
-            f.write(chunk)
-    return out_path
+    return unwrap_safelinks(href)
 
 
 def dl_jpm(html: Path, folder: Path) -> Path:
@@ -144,29 +144,216 @@
 #     print(f"Done: {saved} saved, {deleted} deleted.", flush=True)
 
 
+import logging
 import os
-import shutil
-import sys
+import threading
+import time
 from pathlib import Path
 from datetime import datetime, timedelta
+from typing import Callable
 
-import win32com.client
 import psycopg
 
 import configuration.system_config as sys_config
 import helpers.database_helpers as database_helpers
+import helpers.metrics as metrics
+import downloaders.message_sources as message_sources
 
 TEST_MODE       = False
 download_folder = sys_config.DOWNLOAD_FOLDER
 msg_folder      = sys_config.MSG_FOLDER
 MAX_EMAILS      = sys_config.DB_MAX_EMAILS
 
-def email_scraper(lookback_days=None):
-    print("▶︎  email_scraper() invoked", flush=True)
-
+log = logging.getLogger(__name__)
+
+# ─── BULK WRITER ─────────────────────────────────────────────────────────────
+EMAIL_COLUMNS = (
+    "entry_id", "received_ts", "bank_tag", "subject",
+    "body_snip", "file_path", "html_path", "raw_msg",
+)
+EMAIL_TYPES = ("text", "timestamp", "varchar", "text", "text", "text", "text", "bytea")
+
+
+class EmailBatchWriter:
+    """
+    Buffers emails_final rows and writes them with one binary COPY per batch.
+
+    A batch is flushed once it holds *max_rows* rows or *max_bytes* of raw
+    message, or when its oldest row has waited *max_wait* seconds. Rows are
+    copied into a temp staging table and moved across with
+    ``INSERT ... ON CONFLICT DO NOTHING RETURNING``, so entry_ids that are
+    already in the table land in ``duplicates`` rather than failing the batch.
+    If the COPY itself fails the batch is replayed row by row, so only the
+    offending rows end up in ``failed``. *on_written*, if given, is called
+    with the (entry_id, bank_tag) of every newly written row after each
+    flush, so a downstream stage can start on them straight away.
+    """
+
+    def __init__(
+        self,
+        conn: psycopg.Connection,
+        table: str = "emails_final",
+        max_rows: int = sys_config.EMAIL_BATCH_ROWS,
+        max_bytes: int = sys_config.EMAIL_BATCH_BYTES,
+        max_wait: float = sys_config.EMAIL_BATCH_SECONDS,
+        on_written: Callable[[list[tuple[str, str]]], None] | None = None,
+    ):
+        self.conn = conn
+        self.on_written = on_written
+        self.table = table
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_wait = max_wait
+        self.written: list[str] = []
+        self.duplicates: list[str] = []
+        self.failed: list[tuple[str, str]] = []
+        self._rows: list[tuple] = []
+        self._bytes = 0
+        self._since = 0.0
+
+        cols = ", ".join(EMAIL_COLUMNS)
+        stage = f"_{table}_stage"
+        self._stage_sql = (
+            f"CREATE TEMP TABLE IF NOT EXISTS {stage} "
+            f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        )
+        self._copy_sql = f"COPY {stage} ({cols}) FROM STDIN (FORMAT BINARY)"
+        self._merge_sql = (
+            f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {stage} "
+            f"ON CONFLICT (entry_id) DO NOTHING RETURNING entry_id"
+        )
+        self._insert_sql = (
+            f"INSERT INTO {table} ({cols}) "
+            f"VALUES ({', '.join(['%s'] * len(EMAIL_COLUMNS))}) "
+            f"ON CONFLICT (entry_id) DO NOTHING RETURNING entry_id"
+        )
+
+    def __enter__(self) -> "EmailBatchWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.flush()
+
+    def add(self, row: tuple) -> None:
+        """Queue one row, laid out as EMAIL_COLUMNS."""
+        if not self._rows:
+            self._since = time.monotonic()
+        self._rows.append(row)
+        self._bytes += len(row[-1])
+        if len(self._rows) >= self.max_rows or self._bytes >= self.max_bytes:
+            self.flush()
+        else:
+            self.maybe_flush()
+
+    def maybe_flush(self) -> None:
+        """Flush if the oldest buffered row has waited longer than max_wait."""
+        if self._rows and time.monotonic() - self._since >= self.max_wait:
+            self.flush()
+
+    def flush(self) -> None:
+        rows, self._rows, self._bytes = self._rows, [], 0
+        if not rows:
+            return
+        try:
+            with metrics.timer("db_insert", table=self.table), self.conn.transaction(), self.conn.cursor() as cur:
+                cur.execute(self._stage_sql)
+                with cur.copy(self._copy_sql) as copy:
+                    copy.set_types(EMAIL_TYPES)
+                    for row in rows:
+                        copy.write_row(row)
+                cur.execute(self._merge_sql)
+                inserted = {r[0] for r in cur.fetchall()}
+            self._tally(rows, inserted)
+            metrics.count("rows", len(inserted), stage="db_insert")
+            log.debug("copied %d emails into %s (%d already there)", len(inserted), self.table, len(rows) - len(inserted))
+        except psycopg.Error as e:
+            log.warning("COPY of %d emails failed (%s); retrying row by row", len(rows), e)
+            self._insert_each(rows)
+
+    def _insert_each(self, rows: list[tuple]) -> None:
+        for row in rows:
+            try:
+                with self.conn.transaction(), self.conn.cursor() as cur:
+                    cur.execute(self._insert_sql, row)
+                    inserted = {r[0] for r in cur.fetchall()}
+                self._tally([row], inserted)
+            except psycopg.Error as e:
+                self.failed.append((row[0], str(e)))
+                log.warning("insert failed for %s: %s", row[0], e)
+
+    def _tally(self, rows: list[tuple], inserted: set[str]) -> None:
+        new = []
+        for row in rows:
+            entry_id = row[0]
+            if entry_id in inserted:
+                self.written.append(entry_id)
+                new.append((entry_id, row[2]))
+                # a second copy of the same message within the batch is a duplicate
+                inserted.discard(entry_id)
+            else:
+                self.duplicates.append(entry_id)
+        if new and self.on_written:
+            self.on_written(new)
+
+
+# ─── SCHEMA ──────────────────────────────────────────────────────────────────
+DDL = """
+CREATE TABLE IF NOT EXISTS emails_final (
+  entry_id    TEXT PRIMARY KEY,
+  received_ts TIMESTAMP NOT NULL,
+  bank_tag    VARCHAR(20) NOT NULL,
+  subject     TEXT NOT NULL,
+  body_snip   TEXT,
+  file_path   TEXT NOT NULL,
+  html_path   TEXT,
+  raw_msg     BYTEA NOT NULL,
+  imported_at TIMESTAMPTZ DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_emails_tag_date
+  ON emails_final(bank_tag, received_ts DESC);
+CREATE INDEX IF NOT EXISTS idx_emails_received
+  ON emails_final(received_ts);
+"""
+
+
+def ensure_schema(cur) -> None:
+    cur.execute(DDL)
+
+
+# ─── PERSISTENCE ─────────────────────────────────────────────────────────────
+def persist_message(msg: message_sources.SourceMessage, html_path: str, eml_path: str) -> bytes:
+    """
+    Write the raw message and its HTML rendition, each exactly once.
+
+    Both renditions are built in memory first, so nothing is saved to a temp
+    path and moved onto the share or read back off it; the returned bytes go
+    straight to the batch writer.
+    """
+    with metrics.timer("saveas"):
+        raw = msg.raw_bytes()
+        markup = msg.html()
+        with open(eml_path, "wb") as f:
+            f.write(raw)
+        with open(html_path, "w", encoding="utf-8", errors="replace") as f:
+            f.write(markup)
+    metrics.count("bytes", len(raw), stage="saveas")
+    return raw
+
+
+def email_scraper(
+    lookback_days=None,
+    source: message_sources.MessageSource | None = None,
+    on_written: Callable[[list[tuple[str, str]]], None] | None = None,
+    stop: threading.Event | None = None,
+):
+    """
+    Import new messages into emails_final. *on_written* gets each flushed
+    batch's (entry_id, bank_tag) pairs (see EmailBatchWriter); setting
+    *stop* ends the run after the current message, flushing what's buffered.
+    """
     # 1) Determine the fallback lookback window
     fallback_dt = datetime.now() - timedelta(days=lookback_days or sys_config.DB_LAG_DAYS)
-    print(f"DEBUG: fallback lookback_dt = {fallback_dt}", flush=True)
+    log.debug("fallback lookback_dt = %s", fallback_dt)
 
     database_helpers.ensure_folders()
 
@@ -178,127 +365,106 @@ def email_scraper(lookback_days=None):
         "password": sys_config.DB_PASSWORD,
     }
 
-    # 2) Create table, fetch last imported timestamp AND existing IDs
+    # 2) Create table & fetch last imported timestamp
     with psycopg.connect(**conn_params, autocommit=True) as conn, conn.cursor() as cur:
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS emails_final (
-          entry_id    TEXT PRIMARY KEY,
-          received_ts TIMESTAMP NOT NULL,
-          bank_tag    VARCHAR(20) NOT NULL,
-          subject     TEXT NOT NULL,
-          body_snip   TEXT,
-          file_path   TEXT NOT NULL,
-          html_path   TEXT,
-          raw_msg     BYTEA NOT NULL,
-          imported_at TIMESTAMPTZ DEFAULT now()
-        );
-        CREATE INDEX IF NOT EXISTS idx_emails_tag_date
-          ON emails_final(bank_tag, received_ts DESC);
-        """)
+        ensure_schema(cur)
         cur.execute("SELECT MAX(received_ts) FROM emails_final;")
         last_ts = cur.fetchone()[0]
-        print(f"DEBUG: last_ts from DB = {last_ts}", flush=True)
+        log.debug("last_ts from DB = %s", last_ts)
 
-        # grab every entry_id so we can report/skips duplicates
-        cur.execute("SELECT entry_id FROM emails_final;")
-        existing_ids = {row[0] for row in cur.fetchall()}
+    # 2b) Prepare the message source (Outlook unless configured otherwise)
+    source = source or message_sources.from_config()
 
-    # 3) Decide cutoff: explicit lookback overrides last_ts
-    if lookback_days is not None:
+    # 3) Decide cutoff: explicit lookback overrides last_ts. A source that
+    # isn't newest first (a local archive) keeps the lookback window, since
+    # last_ts says nothing about older messages a cut-short run never reached
+    if lookback_days is not None or not source.ordered:
         cutoff_dt = fallback_dt
-        print("DEBUG: explicit lookback → using fallback cutoff:", cutoff_dt, flush=True)
+        log.debug("%s → using fallback cutoff: %s",
+                  "explicit lookback" if lookback_days is not None else "unordered source", cutoff_dt)
     else:
         if last_ts and last_ts > fallback_dt:
             cutoff_dt = last_ts
-            print("DEBUG: using last_ts as cutoff:", cutoff_dt, flush=True)
+            log.debug("using last_ts as cutoff: %s", cutoff_dt)
         else:
             cutoff_dt = fallback_dt
-            print("DEBUG: using fallback cutoff (no recent run):", cutoff_dt, flush=True)
-
-    # 4) Prepare Outlook
-    outlook = win32com.client.Dispatch("Outlook.Application").GetNamespace("MAPI")
-    inbox   = outlook.GetDefaultFolder(6)
-    items   = inbox.Items
-    items.Sort("[ReceivedTime]", True)
+            log.debug("using fallback cutoff (no recent run): %s", cutoff_dt)
 
-    # 5) Loop, track our buckets
-    saved, deleted, skipped = [], [], []
+    # 3b) Known IDs inside the window only: the loop below never looks at
+    # anything older than cutoff_dt, and the writer's ON CONFLICT catches
+    # whatever slips through, so memory tracks the window, not the table
     with psycopg.connect(**conn_params, autocommit=True) as conn, conn.cursor() as cur:
-        msg   = items.GetFirst()
-        count = 0
-        while msg and count < MAX_EMAILS:
-            entry_id = msg.EntryID
-            rcvd = msg.ReceivedTime.replace(tzinfo=None)
-
-            # stop once we hit or pass the cutoff
-            if rcvd <= cutoff_dt:
+        cur.execute("SELECT entry_id FROM emails_final WHERE received_ts > %s;", (cutoff_dt,))
+        existing_ids = {row[0] for row in cur.fetchall()}
+    log.debug("%d already-imported IDs in window", len(existing_ids))
+
+    metrics.event("scrape_window", source=source.name, cutoff=cutoff_dt, known=len(existing_ids))
+
+    # 4) Loop, track our buckets
+    deleted, skipped = [], []
+    with psycopg.connect(**conn_params, autocommit=True) as conn, EmailBatchWriter(conn, on_written=on_written) as writer:
+        for count, msg in enumerate(source.messages(cutoff_dt)):
+            # the cap only makes sense newest first; unordered, it would be an arbitrary slice
+            if (source.ordered and count >= MAX_EMAILS) or (stop is not None and stop.is_set()):
                 break
+            writer.maybe_flush()
+            entry_id = msg.entry_id
+            rcvd = msg.received
 
             # skip if already in DB
             if entry_id in existing_ids:
                 skipped.append(entry_id)
-                print(f"SKIP (already imported): {entry_id}", flush=True)
-                msg = items.GetNext()
-                count += 1
+                log.debug("skip (already imported): %s", entry_id)
                 continue
 
-            subj     = msg.Subject or "NoSubject"
-            body     = msg.Body or ""
+            subj     = msg.subject or "NoSubject"
+            body     = msg.body or ""
             combined = f"{subj}\n{body}"
 
+            metrics.count("emails", stage="scrape")
             try:
-                if database_helpers.is_unwanted(combined):
-                    msg.Delete()
+                with metrics.timer("tag"):
+                    tags = database_helpers.classify_email(combined)
+                if tags.unwanted:
+                    msg.delete()
                     deleted.append(entry_id)
-                    print(f"Deleted unwanted: {subj}", flush=True)
+                    log.debug("deleted unwanted: %s", subj)
                 else:
-                    bank    = database_helpers.detect_bank_from_text(combined)
+                    bank    = tags.bank
                     ts_str  = rcvd.strftime("%Y-%m-%d_%H-%M-%S")
                     base_fn = f"{ts_str} - {database_helpers.clean_filename(subj)}"
                     folder  = os.path.join(msg_folder, bank)
                     os.makedirs(folder, exist_ok=True)
 
                     html_path = os.path.join(folder, base_fn + ".html")
-                    msg.SaveAs(html_path, 5)
-
-                    tmp_eml  = os.path.join("C:\\Temp", base_fn + ".eml")
-                    os.makedirs(os.path.dirname(tmp_eml), exist_ok=True)
-                    msg.SaveAs(tmp_eml)
-                    eml_path = os.path.join(folder, base_fn + ".eml")
-                    shutil.move(tmp_eml, eml_path)
-
-                    raw_bytes = open(eml_path, "rb").read()
-
-                    cur.execute(
-                        """
-                        INSERT INTO emails_final
-                          (entry_id, received_ts, bank_tag, subject,
-                           body_snip, file_path, html_path, raw_msg)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                        """,
-                        (
-                            entry_id,
-                            rcvd,
-                            bank,
-                            subj,
-                            body[:2000],
-                            eml_path,
-                            html_path,
-                            psycopg.Binary(raw_bytes),
-                        )
-                    )
-                    saved.append(entry_id)
-                    print(f"Saved: {base_fn}.html → {bank}", flush=True)
+                    eml_path  = os.path.join(folder, base_fn + ".eml")
+                    raw_bytes = persist_message(msg, html_path, eml_path)
+
+                    writer.add((
+                        entry_id,
+                        rcvd,
+                        bank,
+                        subj,
+                        body[:2000],
+                        eml_path,
+                        html_path,
+                        raw_bytes,
+                    ))
+                    log.debug("saved: %s.html → %s", base_fn, bank)
 
             except Exception as e:
-                print(f"Error on email #{count} ({entry_id}): {e}", file=sys.stderr, flush=True)
-
-            count += 1
-            msg = items.GetNext()
+                log.warning("error on email #%d (%s): %s", count, entry_id, e)
 
-    # 6) Final summary
+    # 5) Final summary
+    saved = writer.written
+    skipped += writer.duplicates
     print("─── Run complete ───")
-    print(f"  Saved   : {len(saved)} emails → {saved}")
-    print(f"  Deleted : {len(deleted)} emails → {deleted}")
-    print(f"  Skipped : {len(skipped)} emails → {skipped}")
+    print(f"  Saved   : {len(saved)} emails")
+    print(f"  Failed  : {len(writer.failed)} emails")
+    print(f"  Deleted : {len(deleted)} emails")
+    print(f"  Skipped : {len(skipped)} emails")
     print("────────────────────", flush=True)
+    log.debug("saved: %s", saved)
+    log.debug("failed: %s", [eid for eid, _ in writer.failed])
+    log.debug("deleted: %s", deleted)
+    log.debug("skipped: %s", skipped)
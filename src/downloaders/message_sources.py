@@ -0,0 +1,336 @@
+# File: downloaders/message_sources.py
+"""
+Message sources for email_scraper.
+
+A source yields messages newer than a cutoff; each message exposes the
+fields the scraper tags and files (entry_id, received, subject, body), the
+in-memory renditions it persists (``raw_bytes()`` and ``html()``) and
+``delete()``. Two backends:
+
+* OutlookSource      – the Outlook inbox over COM (Windows only).
+* LocalMailboxSource – a Maildir, an mbox file or a directory of .eml files.
+  Messages are streamed off disk and MIME/HTML parsing runs in a process
+  pool, so historical backfills can run on Linux workers at disk speed.
+"""
+from __future__ import annotations
+
+import abc
+import hashlib
+import html
+import mailbox
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from email import policy
+from email.parser import BytesParser
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Union
+
+import configuration.system_config as sys_config
+
+
+# ─── INTERFACE ───────────────────────────────────────────────────────────────
+class SourceMessage(abc.ABC):
+    """One message as seen by the scraper."""
+
+    entry_id: str
+    received: datetime  # naive local time, like Outlook's ReceivedTime
+    subject: str
+    body: str
+
+    @abc.abstractmethod
+    def raw_bytes(self) -> bytes:
+        """The full message as stored in emails_final.raw_msg."""
+
+    @abc.abstractmethod
+    def html(self) -> str:
+        """HTML rendition the bank handlers read links from."""
+
+    @abc.abstractmethod
+    def delete(self) -> None:
+        """Remove the message from its source, where the source allows it."""
+
+
+class MessageSource(abc.ABC):
+    """Yields SourceMessages received after *cutoff*."""
+
+    name = "source"
+    # True when messages() yields newest first. Only then is it safe to stop
+    # early and take the newest import as the next run's cutoff
+    ordered = False
+
+    @abc.abstractmethod
+    def messages(self, cutoff: datetime) -> Iterator[SourceMessage]:
+        """Every message received after *cutoff*, in whatever order the backend keeps them."""
+
+
+# ─── OUTLOOK ─────────────────────────────────────────────────────────────────
+class OutlookMessage(SourceMessage):
+    def __init__(self, item):
+        self._item = item
+        self.entry_id = item.EntryID
+        self.received = item.ReceivedTime.replace(tzinfo=None)
+
+    # read lazily: skipped messages never pay for the Subject/Body round trips
+    @property
+    def subject(self) -> str:
+        return self._item.Subject
+
+    @property
+    def body(self) -> str:
+        return self._item.Body
+
+    def raw_bytes(self) -> bytes:
+        # COM can only serialise to a file, so save the .msg once to local
+        # temp (never the network share), slurp it and drop the file
+        fd, tmp = tempfile.mkstemp(suffix=".msg")
+        os.close(fd)
+        try:
+            self._item.SaveAs(tmp, 3)  # olMSG
+            with open(tmp, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(tmp)
+
+    def html(self) -> str:
+        # HTMLBody is already in memory on the COM object; no SaveAs(…, olHTML)
+        return self._item.HTMLBody or text_to_html(self.body or "", self.subject or "")
+
+    def delete(self) -> None:
+        self._item.Delete()
+
+
+class OutlookSource(MessageSource):
+    """The default Outlook inbox, newest first, stopping at the cutoff."""
+
+    name = "outlook"
+    ordered = True
+
+    def __init__(self, folder: int = 6):
+        self.folder = folder
+
+    def messages(self, cutoff: datetime) -> Iterator[SourceMessage]:
+        import win32com.client  # Windows only; keeps this module importable elsewhere
+
+        outlook = win32com.client.Dispatch("Outlook.Application").GetNamespace("MAPI")
+        items = outlook.GetDefaultFolder(self.folder).Items
+        items.Sort("[ReceivedTime]", True)
+
+        item = items.GetFirst()
+        while item:
+            msg = OutlookMessage(item)
+            # sorted newest first, so everything after this is older too
+            if msg.received <= cutoff:
+                break
+            yield msg
+            item = items.GetNext()
+
+
+# ─── LOCAL MAILBOXES ─────────────────────────────────────────────────────────
+class _TextExtractor(HTMLParser):
+    """Collects visible text from an HTML body (script/style dropped)."""
+
+    SKIP = {"script", "style", "head", "title"}
+    BREAKS = {"br", "p", "div", "tr", "li", "h1", "h2", "h3", "h4", "table"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag in self.BREAKS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(markup: str) -> str:
+    parser = _TextExtractor()
+    parser.feed(markup)
+    parser.close()
+    lines = (" ".join(line.split()) for line in "".join(parser.parts).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def text_to_html(text: str, title: str = "") -> str:
+    return (
+        "<html><head><meta charset=\"utf-8\"><title>"
+        f"{html.escape(title)}</title></head><body><pre>{html.escape(text)}</pre></body></html>"
+    )
+
+
+@dataclass
+class LocalMessage(SourceMessage):
+    entry_id: str
+    received: datetime
+    subject: str
+    body: str
+    markup: str
+    raw: bytes
+
+    def raw_bytes(self) -> bytes:
+        return self.raw
+
+    def html(self) -> str:
+        return self.markup
+
+    def delete(self) -> None:
+        # local archives are treated as read-only; unwanted mail is just not imported
+        pass
+
+
+def parse_message(raw: bytes) -> Optional[LocalMessage]:
+    """Parse one RFC 822 message; None if it has no usable Date header."""
+    msg = BytesParser(policy=policy.default).parsebytes(raw)
+    try:
+        received = parsedate_to_datetime(msg["Date"])
+    except (TypeError, ValueError):
+        return None
+    if received.tzinfo is not None:
+        received = received.astimezone().replace(tzinfo=None)
+
+    entry_id = (msg["Message-ID"] or "").strip() or "sha1:" + hashlib.sha1(raw).hexdigest()
+    subject = str(msg["Subject"] or "")
+
+    html_part = msg.get_body(preferencelist=("html",))
+    text_part = msg.get_body(preferencelist=("plain",))
+    markup = _part_text(html_part)
+    body = _part_text(text_part) or (html_to_text(markup) if markup else "")
+    return LocalMessage(
+        entry_id=entry_id,
+        received=received,
+        subject=subject,
+        body=body,
+        markup=markup or text_to_html(body, subject),
+        raw=raw,
+    )
+
+
+def _part_text(part) -> str:
+    if part is None:
+        return ""
+    try:
+        return part.get_content()
+    except (LookupError, UnicodeError):
+        payload = part.get_payload(decode=True) or b""
+        return payload.decode("utf-8", errors="replace")
+
+
+def _parse_batch(items: List[Union[str, bytes]]) -> List[Optional[LocalMessage]]:
+    """Worker entry point: items are file paths or raw message bytes."""
+    out = []
+    for item in items:
+        if isinstance(item, str):
+            with open(item, "rb") as f:
+                item = f.read()
+        try:
+            out.append(parse_message(item))
+        except Exception:
+            out.append(None)
+    return out
+
+
+def _batches(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+class LocalMailboxSource(MessageSource):
+    """
+    Maildir, mbox or .eml directory on disk.
+
+    Raw messages (or, for Maildir and .eml directories, just their paths) are
+    streamed to a process pool in batches of *chunksize*. At most *window*
+    batches are in flight, so memory stays bounded however large the archive
+    is. Messages come back in archive order, not sorted by date, so the
+    cutoff is applied as a filter rather than a stopping point.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        kind: Optional[str] = None,
+        workers: Optional[int] = sys_config.MAIL_PARSE_WORKERS,
+        chunksize: int = 32,
+        window: int = 4,
+    ):
+        self.path = Path(path)
+        self.kind = kind or self._detect_kind(self.path)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.window = window * self.workers
+        self.unparsed = 0
+
+    @staticmethod
+    def _detect_kind(path: Path) -> str:
+        if path.is_file():
+            return "mbox"
+        if (path / "cur").is_dir() and (path / "new").is_dir():
+            return "maildir"
+        return "eml"
+
+    def _raw_items(self) -> Iterator[Union[str, bytes]]:
+        if self.kind == "maildir":
+            for sub in ("new", "cur"):
+                for entry in os.scandir(self.path / sub):
+                    if entry.is_file():
+                        yield entry.path
+        elif self.kind == "mbox":
+            box = mailbox.mbox(self.path, create=False)
+            try:
+                for key in box.iterkeys():
+                    yield box.get_bytes(key)
+            finally:
+                box.close()
+        elif self.kind == "eml":
+            for root, _, files in os.walk(self.path):
+                for fn in sorted(files):
+                    if fn.lower().endswith(".eml"):
+                        yield os.path.join(root, fn)
+        else:
+            raise ValueError(f"unknown mailbox kind: {self.kind!r}")
+
+    def messages(self, cutoff: datetime) -> Iterator[SourceMessage]:
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            batches = _batches(self._raw_items(), self.chunksize)
+            for batch in batches:
+                pending.append(pool.submit(_parse_batch, batch))
+                if len(pending) < self.window:
+                    continue
+                yield from self._take(pending.popleft().result(), cutoff)
+            while pending:
+                yield from self._take(pending.popleft().result(), cutoff)
+
+    def _take(self, parsed: List[Optional[LocalMessage]], cutoff: datetime) -> Iterator[SourceMessage]:
+        for msg in parsed:
+            if msg is None:
+                self.unparsed += 1
+            elif msg.received > cutoff:
+                yield msg
+
+
+def from_config() -> MessageSource:
+    """The source named by system_config.MAIL_SOURCE."""
+    kind = sys_config.MAIL_SOURCE
+    if kind == "outlook":
+        return OutlookSource()
+    return LocalMailboxSource(sys_config.MAILBOX_PATH, kind=None if kind == "local" else kind)
@@ -1,11 +1,19 @@
 from __future__ import annotations
 import os
 import re
+import shutil
+import tempfile
+import threading
 import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
-from typing import Callable, Dict, List, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
 import configuration.system_config as system_config
+from helpers.downloader_helpers import relocate, replace_with_link, sha256_file
+from helpers.job_queue import DOWNLOAD_QUEUE
+from helpers import metrics
 
 import psycopg
 
@@ -18,12 +26,13 @@ logging.getLogger('urllib3').setLevel(logging.CRITICAL)
 
 # ─── Bank-specific downloader imports ────────────────────────────────────────
 from downloaders.JPM_downloader import dl_jpm
-from downloaders.GS_downloader import dl_gs
+from downloaders.GS_downloader import dl_gs, shutdown_driver_pool
 # ... add additional bank downloader imports here
 
 # ─── CONFIGURATION ────────────────────────────────────────────────────────────
 DSN = system_config.DSN
 BASE_DOWNLOAD = Path(system_config.DOWNLOAD_FOLDER)
+log = logging.getLogger(__name__)
 
 # ─── HANDLERS ─────────────────────────────────────────────────────────────────
 # Each handler takes (html_path, out_folder) and returns the Path to the downloaded PDF
@@ -58,60 +67,145 @@ CREATE TABLE IF NOT EXISTS bin (
 );
 ALTER TABLE emails_final
   ADD COLUMN IF NOT EXISTS report_path TEXT;
+-- content dedup: identical PDFs point at the first report with those bytes
+ALTER TABLE reports
+  ADD COLUMN IF NOT EXISTS content_sha256 TEXT,
+  ADD COLUMN IF NOT EXISTS canonical_report_id UUID REFERENCES reports(report_id);
+CREATE INDEX IF NOT EXISTS idx_reports_sha256
+  ON reports(content_sha256);
 """
 
+def connect() -> psycopg.Connection:
+    """Transactional connection; DSN may be a dict or a connection string."""
+    return psycopg.connect(**DSN, autocommit=False) if isinstance(DSN, dict) else psycopg.connect(DSN, autocommit=False)
+
 def ensure_schema(conn: psycopg.Connection) -> None:
     with conn.cursor() as cur:
         cur.execute(DDL)
         conn.commit()
 
-# ─── CUTOFF & FETCH ──────────────────────────────────────────────────────────
-def get_cutoff(cur: psycopg.Cursor, bank_tag: str) -> datetime:
-    cur.execute(
-        """
-        SELECT MAX(e.received_ts)
-          FROM reports r
-          JOIN emails_final e ON r.entry_id = e.entry_id
-         WHERE r.bank_tag = %s
-        """,
-        (bank_tag,)
-    )
-    result = cur.fetchone()[0]
-    return result or datetime(1970, 1, 1)
+# ─── WORK QUEUE ──────────────────────────────────────────────────────────────
+# Every email with a handler and no report yet gets a download_jobs row;
+# workers claim batches with SKIP LOCKED, so several downloaders (on several
+# machines) can drain the queue at once, and binned emails are retried up to
+# JOB_MAX_ATTEMPTS times instead of falling behind a high-water mark.
+ENQUEUE_SQL = """
+SELECT e.entry_id, e.bank_tag
+  FROM emails_final e
+ WHERE e.html_path IS NOT NULL
+   AND e.bank_tag = ANY(%s)
+   AND NOT EXISTS (SELECT 1 FROM reports r WHERE r.entry_id = e.entry_id)
+"""
 
 
-def fetch_unprocessed(
-    cur: psycopg.Cursor,
-    bank_tag: str,
-    cutoff: datetime,
-) -> List[Tuple[str, Path, datetime]]:
+def enqueue_downloads(conn: psycopg.Connection, banks: Iterable[str]) -> int:
+    with conn.cursor() as cur:
+        DOWNLOAD_QUEUE.ensure(cur)
+        added = DOWNLOAD_QUEUE.enqueue_query(cur, ENQUEUE_SQL, ([b for b in banks if b in HANDLERS],))
+        DOWNLOAD_QUEUE.reap(cur)
+    conn.commit()
+    return added
+
+
+def enqueue_emails(conn: psycopg.Connection, emails: Iterable[Tuple[str, str]]) -> int:
+    """Queue (entry_id, bank_tag) pairs handed over by the scraper; banks without a handler are skipped."""
+    jobs = [(entry_id, bank) for entry_id, bank in emails if bank in HANDLERS]
+    if jobs:
+        with conn.cursor() as cur:
+            DOWNLOAD_QUEUE.enqueue(cur, jobs)
+        conn.commit()
+    return len(jobs)
+
+
+def claim_jobs(
+    conn: psycopg.Connection,
+    banks: Iterable[str],
+    limit: int = system_config.DOWNLOAD_CLAIM_BATCH,
+) -> Tuple[int, List[Job]]:
+    """
+    Lease up to *limit* queued emails and look up what fetch_one needs:
+    (jobs claimed, jobs to run). Claimed emails whose row has gone are
+    failed, so the second can be empty while the queue isn't.
+    """
+    with conn.cursor() as cur:
+        claimed = DOWNLOAD_QUEUE.claim(cur, limit, banks=[b for b in banks if b in HANDLERS])
+        conn.commit()
+        if not claimed:
+            return 0, []
+        cur.execute(
+            """
+            SELECT entry_id, bank_tag, html_path, received_ts
+              FROM emails_final
+             WHERE entry_id = ANY(%s)
+               AND html_path IS NOT NULL
+            """,
+            ([entry_id for entry_id, _ in claimed],),
+        )
+        rows = {e: (b, e, Path(h), t) for e, b, h, t in cur.fetchall()}
+        for entry_id, _ in claimed:
+            if entry_id not in rows:
+                DOWNLOAD_QUEUE.fail(cur, entry_id, "email row or html_path missing")
+        conn.commit()
+    return len(claimed), [rows[e] for e, _ in claimed if e in rows]
+
+# ─── RECORDING ────────────────────────────────────────────────────────────────
+def find_canonical(cur: psycopg.Cursor, content_sha256: str) -> Tuple[str, str] | None:
+    """
+    (report_id, report_path) of the first report with these bytes, if any.
+    Takes a transaction-level advisory lock on the hash first, so two
+    downloaders finishing the same PDF at once can't both find nothing and
+    both record themselves as canonical; commit releases it.
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (content_sha256,))
     cur.execute(
         """
-        SELECT entry_id, html_path, received_ts
-          FROM emails_final
-         WHERE bank_tag = %s
-           AND html_path IS NOT NULL
-           AND received_ts > %s
+        SELECT report_id, report_path
+          FROM reports
+         WHERE content_sha256 = %s
+           AND canonical_report_id IS NULL
+         ORDER BY downloaded_at
+         LIMIT 1
         """,
-        (bank_tag, cutoff),
+        (content_sha256,),
     )
-    return [(e, Path(h), t) for e, h, t in cur.fetchall()]
+    return cur.fetchone()
+
+
+def link_to_canonical(canonical_path: str, report_path) -> None:
+    """Swap *report_path* for a hard link to the canonical copy, if both are there and distinct."""
+    if os.path.exists(canonical_path) and not os.path.samefile(canonical_path, report_path):
+        replace_with_link(canonical_path, report_path)
+
 
-# ─── RECORDING ────────────────────────────────────────────────────────────────
 def record_success(
     cur: psycopg.Cursor,
     entry_id: str,
     bank_tag: str,
     report_path: Path,
-) -> None:
-    rid = uuid.uuid4()
+    content_sha256: str | None = None,
+    report_id: uuid.UUID | None = None,
+) -> str | None:
+    """
+    Insert the reports row. If a report with the same content hash already
+    exists, the new row is linked to it and the new file is swapped for a
+    hard link to the canonical copy. Returns the canonical report_id, if any.
+    """
+    rid = report_id or uuid.uuid4()
+    canonical = find_canonical(cur, content_sha256) if content_sha256 else None
+    canonical_id = None
+    if canonical:
+        canonical_id, canonical_path = canonical
+        link_to_canonical(canonical_path, report_path)
     # Insert into reports table
     cur.execute(
         """
-        INSERT INTO reports (report_id, entry_id, bank_tag, report_url, report_path)
-        VALUES (%s, %s, %s, %s, %s)
+        INSERT INTO reports
+          (report_id, entry_id, bank_tag, report_url, report_path,
+           content_sha256, canonical_report_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
         """,
-        (str(rid), entry_id, bank_tag, str(report_path), str(report_path)),
+        (str(rid), entry_id, bank_tag, str(report_path), str(report_path),
+         content_sha256, canonical_id),
     )
     # Update emails_final with the downloaded path
     cur.execute(
@@ -122,6 +216,43 @@ def record_success(
         """,
         (str(report_path), entry_id),
     )
+    return canonical_id
+
+
+def backfill_content_hashes(conn: psycopg.Connection) -> None:
+    """
+    Hash reports downloaded before content_sha256 existed, oldest first,
+    linking each duplicate to its canonical row and file like record_success.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT report_id, report_path
+              FROM reports
+             WHERE content_sha256 IS NULL
+             ORDER BY downloaded_at
+            """
+        )
+        rows = cur.fetchall()
+    hashed = linked = 0
+    for report_id, path in rows:
+        if not os.path.exists(path):
+            log.debug("not hashed, file missing: %s", path)
+            continue
+        digest = sha256_file(path)
+        with conn.cursor() as cur:
+            canonical = find_canonical(cur, digest)
+            if canonical:
+                link_to_canonical(canonical[1], path)
+                linked += 1
+            cur.execute(
+                "UPDATE reports SET content_sha256 = %s, canonical_report_id = %s WHERE report_id = %s",
+                (digest, canonical[0] if canonical else None, report_id),
+            )
+        conn.commit()
+        hashed += 1
+    if hashed:
+        log.info("Hashed %d older reports for dedup (%d duplicates)", hashed, linked)
 
 # ─── RECORD FAILURE ─────────────────────────────────────────────────────────
 def record_failure(
@@ -140,46 +271,149 @@ def record_failure(
         (str(bid), entry_id, bank_tag, str(html_path), str(error)),
     )
 
-# ─── MAIN LOOP ───────────────────────────────────────────────────────────────
-def process_bank(conn: psycopg.Connection, bank_tag: str) -> None:
-    downloader = HANDLERS.get(bank_tag)
-    if downloader is None:
-        return
+# ─── DOWNLOAD ENGINE ─────────────────────────────────────────────────────────
+# (bank_tag, entry_id, html_path, received_ts)
+Job = Tuple[str, str, Path, datetime]
 
-    with conn.cursor() as cur:
-        cutoff = get_cutoff(cur, bank_tag)
-        rows = fetch_unprocessed(cur, bank_tag, cutoff)
-
-    for entry_id, html_path, received_ts in rows:
-        # prepare names
-        subject_raw = html_path.stem.split(" - ", 1)[-1]
-        subject_clean = clean_filename(subject_raw) or "untitled"
-        timestamp = received_ts.strftime("%Y%m%d_%H%M%S")
-        basename = f"{subject_clean}_{bank_tag}_{timestamp}.pdf"
-        out_folder = BASE_DOWNLOAD / f"{received_ts:%Y}/{received_ts:%m}/{received_ts:%d}" / bank_tag
-        out_folder.mkdir(parents=True, exist_ok=True)
-
-        try:
-            temp_pdf = downloader(html_path, out_folder)
-            final_pdf = out_folder / basename
-            temp_pdf.rename(final_pdf)
+
+def target_path(bank_tag: str, html_path: Path, received_ts: datetime) -> Path:
+    subject_raw = html_path.stem.split(" - ", 1)[-1]
+    subject_clean = clean_filename(subject_raw) or "untitled"
+    timestamp = received_ts.strftime("%Y%m%d_%H%M%S")
+    basename = f"{subject_clean}_{bank_tag}_{timestamp}.pdf"
+    out_folder = BASE_DOWNLOAD / f"{received_ts:%Y}/{received_ts:%m}/{received_ts:%d}" / bank_tag
+    return out_folder / basename
+
+
+def fetch_one(job: Job) -> Tuple[Path, str]:
+    """
+    Run the bank handler for one email, move its PDF to the final name and
+    return it with its SHA-256. Each job downloads into a private staging
+    folder, so concurrent jobs whose links share a file name can't trample
+    each other.
+    """
+    bank_tag, entry_id, html_path, received_ts = job
+    final_pdf = target_path(bank_tag, html_path, received_ts)
+    final_pdf.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".dl-", dir=final_pdf.parent))
+    try:
+        with metrics.timer("download", trace={"entry_id": entry_id}, bank=bank_tag):
+            temp_pdf = HANDLERS[bank_tag](html_path, staging)
+        relocate(temp_pdf, final_pdf)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return final_pdf, sha256_file(final_pdf)
+
+
+def download_concurrently(
+    jobs: Iterable[Job],
+    workers: int = system_config.DOWNLOAD_WORKERS,
+    per_bank: int = system_config.DOWNLOAD_PER_BANK,
+    fetch: Callable[[Job], Tuple[Path, str]] = fetch_one,
+) -> Iterator[Tuple[Job, Tuple[Path, str] | None, Exception | None]]:
+    """
+    Run *fetch* over *jobs* on a thread pool and yield (job, result, error) as
+    each one finishes. Jobs are handed out round-robin across banks with at
+    most *per_bank* in flight per bank, so one slow portal can tie up only
+    its own share of the workers. Results come back on the calling thread,
+    which keeps all database writes on a single writer.
+    """
+    queues: Dict[str, deque] = {}
+    for job in jobs:
+        queues.setdefault(job[0], deque()).append(job)
+    in_flight = {bank: 0 for bank in queues}
+    running: Dict[Future, Job] = {}
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf") as pool:
+        def refill() -> None:
+            progress = True
+            while progress and len(running) < workers:
+                progress = False
+                for bank, q in queues.items():
+                    if q and in_flight[bank] < per_bank and len(running) < workers:
+                        job = q.popleft()
+                        running[pool.submit(fetch, job)] = job
+                        in_flight[bank] += 1
+                        progress = True
+
+        refill()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                job = running.pop(fut)
+                in_flight[job[0]] -= 1
+                err = fut.exception()
+                yield job, (None if err else fut.result()), err
+            refill()
+
+
+# ─── MAIN LOOP ───────────────────────────────────────────────────────────────
+def download_and_record(
+    conn: psycopg.Connection,
+    jobs: Iterable[Job],
+    workers: int = system_config.DOWNLOAD_WORKERS,
+    per_bank: int = system_config.DOWNLOAD_PER_BANK,
+    on_saved: Callable[[uuid.UUID, str], None] | None = None,
+) -> None:
+    """Download *jobs* and record each outcome; *on_saved* gets (report_id, bank_tag) of every new report."""
+    for (bank_tag, entry_id, html_path, _), result, err in download_concurrently(jobs, workers, per_bank):
+        if err is None:
+            final_pdf, digest = result
+            report_id = uuid.uuid4()
             with conn.cursor() as cur:
-                record_success(cur, entry_id, bank_tag, final_pdf)
+                canonical_id = record_success(cur, entry_id, bank_tag, final_pdf, digest, report_id)
+                DOWNLOAD_QUEUE.done(cur, entry_id)
                 conn.commit()
-            print(f"\n{basename}: ✓ saved to {final_pdf.relative_to(BASE_DOWNLOAD)}")
-        except Exception as e:
+            dup = f" (duplicate of {canonical_id})" if canonical_id else ""
+            log.debug("%s: ✓ saved to %s%s", final_pdf.name, final_pdf.relative_to(BASE_DOWNLOAD), dup)
+            if on_saved:
+                on_saved(report_id, bank_tag)
+        else:
             conn.rollback()
             with conn.cursor() as cur:
-                record_failure(cur, entry_id, bank_tag, html_path, e)
+                record_failure(cur, entry_id, bank_tag, html_path, err)
+                state = DOWNLOAD_QUEUE.fail(cur, entry_id, err)
                 conn.commit()
-            print(f"\n{basename}: ✗ binned")
+            retry = " – will retry" if state == "pending" else ""
+            log.warning("%s: ✗ binned (%s)%s", html_path.stem, err, retry)
+
+
+def drain_queue(
+    conn: psycopg.Connection,
+    banks: Iterable[str],
+    workers: int = system_config.DOWNLOAD_WORKERS,
+    per_bank: int = system_config.DOWNLOAD_PER_BANK,
+    on_saved: Callable[[uuid.UUID, str], None] | None = None,
+    stop: threading.Event | None = None,
+) -> None:
+    """
+    Claim and download batches until nothing runnable is left for *banks*,
+    or *stop* is set (the batch in hand is finished first).
+    """
+    banks = list(banks)
+    while not (stop is not None and stop.is_set()):
+        claimed, jobs = claim_jobs(conn, banks)
+        if not claimed:
+            return
+        download_and_record(conn, jobs, workers, per_bank, on_saved)
+
+
+def process_bank(conn: psycopg.Connection, bank_tag: str) -> None:
+    enqueue_downloads(conn, [bank_tag])
+    drain_queue(conn, [bank_tag])
 
 
 def pdf_downloader() -> None:
 
     print("--------------------- Running PDF Downloader --------------------")
     BASE_DOWNLOAD.mkdir(parents=True, exist_ok=True)
-    with psycopg.connect(**DSN, autocommit=False) as conn:
-        ensure_schema(conn)
-        for bank in HANDLERS:
-            process_bank(conn, bank)
+    try:
+        with connect() as conn:
+            ensure_schema(conn)
+            backfill_content_hashes(conn)
+            added = enqueue_downloads(conn, HANDLERS)
+            if added:
+                print(f"Queued {added} new emails for download")
+            drain_queue(conn, HANDLERS)
+    finally:
+        shutdown_driver_pool()
@@ -2,6 +2,7 @@
 from configuration import system_config
 import os
 import re
+from typing import Dict, Iterable, List, NamedTuple
 
 msg_folder = system_config.MSG_FOLDER
 download_folder = system_config.DOWNLOAD_FOLDER
@@ -38,16 +39,108 @@ def clean_filename(subject: str) -> str:
     safe = "".join(c for c in subject if c.isalnum() or c in " _-").strip()
     return safe[:50]
 
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Regex matching any of *words*, factored into a prefix trie so the engine
+    tries one branch per character instead of every keyword at every offset.
+    """
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class EmailClassification(NamedTuple):
+    bank: str
+    unwanted: bool
+    bank_matches: List[str]
+    unwanted_matches: List[str]
+
+
+class KeywordMatcher:
+    """
+    Bank tagger + noise filter compiled once from the keyword tables.
+
+    Both keyword sets are folded into a single trie-shaped regex, so one scan
+    over the lowercased text finds every (possibly overlapping) keyword hit.
+    The verdicts match the old per-keyword loops: the bank is the first one in
+    ``bank_keywords`` order with a whole-word hit, and a message is unwanted if
+    any noise keyword occurs as a substring.
+    """
+
+    def __init__(self, banks: Dict[str, List[str]], unwanted: Iterable[str], default: str = default_bank):
+        self.default = default
+        self._priority = {bank: i for i, bank in enumerate(banks)}
+        self._bank_of = {}
+        for bank, kws in banks.items():
+            for kw in kws:
+                # the text is lowercased before matching, so keywords with
+                # capitals could never hit; leave them out as before
+                if kw == kw.lower():
+                    self._bank_of.setdefault(kw, bank)
+        noise = [kw for kw in unwanted if kw == kw.lower()]
+
+        # every keyword, bank or noise, in one trie so the text is scanned once;
+        # each hit is then resolved with two anchored matches at its offset
+        self._scan = re.compile(_trie_pattern(list(self._bank_of) + noise))
+        # within one offset the highest-priority bank (then the longest
+        # keyword) has to win, so order the alternatives that way
+        bank_alts = sorted(self._bank_of, key=lambda kw: (self._priority[self._bank_of[kw]], -len(kw)))
+        self._bank_at = re.compile(r"\b(?:" + "|".join(map(re.escape, bank_alts)) + r")\b")
+        self._noise_at = re.compile("|".join(map(re.escape, sorted(noise, key=len, reverse=True))))
+
+    def classify(self, text: str) -> EmailClassification:
+        txt = text.lower()
+        bank_hits, noise_hits = [], []
+        search, bank_at, noise_at = self._scan.search, self._bank_at.match, self._noise_at.match
+        m = search(txt)
+        while m is not None:
+            pos = m.start()
+            hit = noise_at(txt, pos)
+            if hit is not None:
+                noise_hits.append(hit.group())
+            hit = bank_at(txt, pos)
+            if hit is not None:
+                bank_hits.append(hit.group())
+            # resume one character on, not at the end of the hit, so keywords
+            # overlapping this one ("jp morgan stanley") are still seen
+            m = search(txt, pos + 1)
+
+        bank = self.default
+        if bank_hits:
+            bank = min((self._bank_of[kw] for kw in bank_hits), key=self._priority.__getitem__)
+        return EmailClassification(bank, bool(noise_hits), bank_hits, noise_hits)
+
+    def classify_many(self, texts: Iterable[str]) -> List[EmailClassification]:
+        classify = self.classify
+        return [classify(t) for t in texts]
+
+
+matcher = KeywordMatcher(bank_keywords, unwanted_keywords)
+
+
+def classify_email(text: str) -> EmailClassification:
+    return matcher.classify(text)
+
+def classify_emails(texts: Iterable[str]) -> List[EmailClassification]:
+    return matcher.classify_many(texts)
+
 def detect_bank_from_text(text: str) -> str:
-    txt = text.lower()
-    for bank, kws in bank_keywords.items():
-        for kw in kws:
-            if re.search(rf"\b{re.escape(kw)}\b", txt):
-                return bank
-    return default_bank
+    return matcher.classify(text).bank
 
 def is_unwanted(text: str) -> bool:
-    return any(kw in text.lower() for kw in unwanted_keywords)
+    return matcher.classify(text).unwanted
 
 def ensure_folders():
     os.makedirs(download_folder, exist_ok=True)
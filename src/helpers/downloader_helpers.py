@@ -0,0 +1,447 @@
+"""
+downloader_helpers.py
+
+Shared plumbing for the bank-specific downloaders: SafeLinks unwrapping,
+browserless link extraction from saved email HTML, and HTTP fetches over a
+shared, per-host-throttled session with retry/backoff.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from html.parser import HTMLParser
+from typing import Callable, List, NamedTuple, Optional, TypeVar
+from urllib.parse import urlparse, parse_qs, unquote_plus
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import configuration.system_config as system_config
+from helpers import metrics
+
+T = TypeVar("T")
+log = logging.getLogger(__name__)
+
+try:  # lxml is much faster; html.parser is the stdlib fallback
+    from lxml import etree, html as lxml_html
+except ImportError:
+    etree = lxml_html = None
+
+
+# ─── SAFELINKS ───────────────────────────────────────────────────────────────
+def unwrap_safelinks(href: str) -> str:
+    """Return the target of an Outlook SafeLinks redirect, or *href* as is."""
+    parsed = urlparse(href)
+    qs = parse_qs(parsed.query)
+    return unquote_plus(qs.get("url", [href])[0])
+
+
+# ─── STATIC LINK EXTRACTION ──────────────────────────────────────────────────
+class LinkSelector(NamedTuple):
+    """
+    Which <a href> to pick out of an email. Expressed twice: as an XPath for
+    lxml, and as (ancestor class, href substring) for the html.parser path.
+    """
+    xpath: str
+    within_class: Optional[str] = None
+    href_contains: Optional[str] = None
+
+
+JPM_ORIGINAL_DOCUMENT = LinkSelector(
+    xpath="//p[contains(concat(' ', normalize-space(@class), ' '), ' originaldocumentlink ')]//a/@href",
+    within_class="originaldocumentlink",
+)
+PDF_HREF = LinkSelector(
+    xpath="//a[contains(translate(@href, 'PDF', 'pdf'), 'pdf')]/@href",
+    href_contains="pdf",
+)
+
+_compiled_xpaths: dict = {}
+
+
+def _xpath(selector: LinkSelector):
+    compiled = _compiled_xpaths.get(selector.xpath)
+    if compiled is None:
+        compiled = _compiled_xpaths[selector.xpath] = etree.XPath(selector.xpath)
+    return compiled
+
+
+class _AnchorCollector(HTMLParser):
+    """html.parser fallback: hrefs of <a> tags matching a LinkSelector."""
+
+    def __init__(self, selector: LinkSelector):
+        super().__init__(convert_charrefs=True)
+        self.selector = selector
+        self.hrefs: List[str] = []
+        self._open: List[tuple] = []  # (tag, has_class)
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        if tag == "p":
+            self.handle_endtag("p")  # an open <p> is implicitly closed by the next one
+        if tag not in ("br", "img", "meta", "link", "hr", "input"):
+            self._open.append((tag, self.selector.within_class in classes))
+        if tag != "a" or not attrs.get("href"):
+            return
+        href = attrs["href"]
+        if self.selector.within_class and not any(hit for _, hit in self._open):
+            return
+        if self.selector.href_contains and self.selector.href_contains not in href.lower():
+            return
+        self.hrefs.append(href)
+
+    def handle_endtag(self, tag):
+        for i in range(len(self._open) - 1, -1, -1):
+            if self._open[i][0] == tag:
+                del self._open[i:]
+                break
+
+
+def find_links_static(html_path: str, selector: LinkSelector) -> List[str]:
+    """
+    All hrefs in the saved email at *html_path* matching *selector*, in
+    document order and with SafeLinks unwrapped. No browser involved.
+    """
+    with metrics.timer("link"):
+        with open(html_path, "rb") as f:
+            raw = f.read()
+        if lxml_html is not None:
+            try:
+                hrefs = [str(h) for h in _xpath(selector)(lxml_html.fromstring(raw))]
+            except etree.ParserError:
+                return []   # empty file: no links, so the handler falls back to Chrome
+        else:
+            collector = _AnchorCollector(selector)
+            collector.feed(raw.decode("utf-8", errors="replace"))
+            collector.close()
+            hrefs = collector.hrefs
+    return [unwrap_safelinks(h.strip()) for h in hrefs if h.strip()]
+
+
+def find_link_static(html_path: str, selector: LinkSelector) -> Optional[str]:
+    links = find_links_static(html_path, selector)
+    return links[0] if links else None
+
+
+# ─── HTTP SESSION ────────────────────────────────────────────────────────────
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """One connection-pooled Session shared by every downloader thread."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=system_config.DOWNLOAD_PER_HOST * 4,
+                pool_maxsize=system_config.DOWNLOAD_WORKERS,
+            )
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+_host_slots: dict = {}
+_host_slots_lock = threading.Lock()
+
+
+@contextmanager
+def host_slot(url: str):
+    """Hold one of DOWNLOAD_PER_HOST concurrent slots for *url*'s host."""
+    host = urlparse(url).netloc.lower()
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(system_config.DOWNLOAD_PER_HOST)
+    with slot:
+        yield
+
+
+# ─── RETRY ───────────────────────────────────────────────────────────────────
+class RetryableHTTPError(requests.HTTPError):
+    """429 / 5xx; carries the server's Retry-After hint if it sent one."""
+
+    def __init__(self, resp: requests.Response):
+        super().__init__(f"{resp.status_code} for {resp.url}", response=resp)
+        try:
+            self.retry_after = float(resp.headers.get("Retry-After", ""))
+        except ValueError:
+            self.retry_after = None
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class IncompleteDownload(requests.RequestException):
+    """The connection ended before Content-Length bytes arrived."""
+
+
+class NotAPdfError(ValueError):
+    """The server answered, but with something other than a PDF."""
+
+
+RETRYABLE = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    IncompleteDownload,
+    RetryableHTTPError,
+)
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter: uniform in [0, min(cap, base·2^n)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def with_retries(
+    fn: Callable[[], T],
+    attempts: int = system_config.DOWNLOAD_RETRIES,
+    base: float = system_config.DOWNLOAD_BACKOFF_BASE,
+    cap: float = system_config.DOWNLOAD_BACKOFF_CAP,
+) -> T:
+    """Call *fn*, retrying transient HTTP failures with jittered backoff."""
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except RETRYABLE as e:
+            if attempt == attempts - 1:
+                raise
+            delay = backoff_delay(attempt, base, cap)
+            if getattr(e, "retry_after", None):
+                delay = max(delay, min(cap, e.retry_after))
+            log.info("retry %d/%d in %.1fs: %s", attempt + 1, attempts - 1, delay, e)
+            metrics.count("retries", stage="download", error=type(e).__name__)
+            time.sleep(delay)
+
+
+# ─── HTTP ────────────────────────────────────────────────────────────────────
+def is_pdf(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(4) == b"%PDF"
+
+
+class DownloadResult(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+    not_modified: bool = False  # 304: the copy from last time was reused
+    resumed_from: int = 0       # bytes already on disk from an earlier attempt
+
+
+# Per-URL download state lives under DOWNLOAD_STATE_FOLDER, keyed by a hash
+# of the URL: <key>.json holds the validators (ETag / Last-Modified) and the
+# checksum of the last good copy, <key>.part an unfinished transfer. Both sit
+# on the download volume, so finishing a transfer is an atomic rename.
+_state_by_path: dict = {}
+_state_lock = threading.Lock()
+_url_locks: dict = {}
+
+
+def _state_paths(url: str) -> tuple:
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    root = system_config.DOWNLOAD_STATE_FOLDER
+    os.makedirs(root, exist_ok=True)
+    return os.path.join(root, key + ".json"), os.path.join(root, key + ".part")
+
+
+def _range_total(resp) -> Optional[int]:
+    """Full size of the resource from a Content-Range ("bytes 0-99/1234", "bytes */1234")."""
+    total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+
+def _load_state(meta_path: str) -> dict:
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(meta_path: str, state: dict) -> None:
+    tmp = meta_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, meta_path)
+    with _state_lock:
+        _state_by_path[os.path.abspath(state["path"])] = meta_path
+
+
+def relocate(src, dst) -> None:
+    """
+    Rename a downloaded file, keeping its URL state pointing at it so the
+    next conditional GET for that URL can still reuse it.
+    """
+    os.rename(src, dst)
+    with _state_lock:
+        meta_path = _state_by_path.pop(os.path.abspath(src), None)
+    if meta_path:
+        state = _load_state(meta_path)
+        state["path"] = str(dst)
+        _save_state(meta_path, state)
+
+
+def _url_lock(url: str) -> threading.Lock:
+    # two emails linking the same report must not share one .part at once
+    with _state_lock:
+        return _url_locks.setdefault(url, threading.Lock())
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    """Hard-link *dst* to *src* (no extra bytes on disk), copying if we can't."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _hash_prefix(path: str, chunk_size: int) -> "hashlib._Hash":
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest
+
+
+def sha256_file(path, chunk_size: int = system_config.DOWNLOAD_CHUNK_SIZE) -> str:
+    return _hash_prefix(str(path), chunk_size).hexdigest()
+
+
+def replace_with_link(src, dst) -> bool:
+    """
+    Make *dst* a hard link to *src* (same bytes, stored once), atomically.
+    Returns False, leaving *dst* alone, where hard links aren't possible.
+    """
+    tmp = f"{dst}.link"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        return False
+    os.replace(tmp, dst)
+    return True
+
+
+def fetch_pdf(
+    pdf_url: str,
+    download_folder: str,
+    filename: Optional[str] = None,
+    chunk_size: int = system_config.DOWNLOAD_CHUNK_SIZE,
+) -> DownloadResult:
+    """
+    Download *pdf_url* into *download_folder*, robustly:
+
+    * streams in *chunk_size* pieces to a .part file, renamed into place
+      only once complete, so a cut transfer never leaves a truncated PDF;
+    * resumes a .part left by an earlier attempt with an HTTP Range
+      request (guarded by If-Range, so a changed file restarts cleanly);
+      a .part that already holds the whole file (416 on the Range) is
+      finished off, one of the wrong size thrown away and fetched again;
+    * sends If-None-Match / If-Modified-Since from the last good fetch and,
+      on 304, reuses that copy instead of downloading again;
+    * computes SHA-256 while streaming and checks the %PDF magic.
+
+    Runs through the shared session and per-host limit, with retries.
+    """
+    os.makedirs(download_folder, exist_ok=True)
+    filename = filename or os.path.basename(urlparse(pdf_url).path) or "document.pdf"
+    out_path = os.path.join(download_folder, filename)
+    meta_path, part_path = _state_paths(pdf_url)
+
+    def attempt() -> DownloadResult:
+        state = _load_state(meta_path)
+        validator = state.get("etag") or state.get("last_modified")
+        headers = {"Accept-Encoding": "identity"}  # byte ranges must mean file bytes
+        have = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if have and validator:
+            headers["Range"] = f"bytes={have}-"
+            headers["If-Range"] = validator
+        elif state.get("path") and os.path.exists(state["path"]):
+            if state.get("etag"):
+                headers["If-None-Match"] = state["etag"]
+            if state.get("last_modified"):
+                headers["If-Modified-Since"] = state["last_modified"]
+
+        restart = False
+        with host_slot(pdf_url):
+            resp = get_session().get(pdf_url, stream=True, headers=headers, timeout=system_config.HTTP_TIMEOUT)
+            with resp:
+                if resp.status_code == 304:
+                    if os.path.abspath(state["path"]) != os.path.abspath(out_path):
+                        link_or_copy(state["path"], out_path)
+                    return DownloadResult(out_path, state["sha256"], state["size"], not_modified=True)
+                if resp.status_code in RETRY_STATUSES:
+                    raise RetryableHTTPError(resp)
+                validators = {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+
+                if resp.status_code == 416 and have:
+                    # nothing left past the end of the .part: it's the whole file (cut
+                    # off before the rename) if the size is right, else start over
+                    validators = {"etag": state.get("etag"), "last_modified": state.get("last_modified")}
+                    if have == (_range_total(resp) or state.get("total")):
+                        resumed, got = have, 0
+                        digest = _hash_prefix(part_path, chunk_size)
+                    else:
+                        os.remove(part_path)
+                        restart = True
+                else:
+                    resp.raise_for_status()
+                    resumed = have if resp.status_code == 206 else 0
+                    digest = _hash_prefix(part_path, chunk_size) if resumed else hashlib.sha256()
+                    expected = resp.headers.get("Content-Length")
+                    got = 0
+                    # remember validators first, so a cut transfer can be resumed
+                    _save_state(meta_path, {
+                        "url": pdf_url,
+                        **validators,
+                        "path": state.get("path") or out_path,
+                        "sha256": state.get("sha256"),
+                        "size": state.get("size"),
+                        "total": _range_total(resp) if resumed else (int(expected) if expected else None),
+                    })
+                    with open(part_path, "ab" if resumed else "wb") as f:
+                        for chunk in resp.iter_content(chunk_size):
+                            f.write(chunk)
+                            digest.update(chunk)
+                            got += len(chunk)
+                    if expected is not None and got < int(expected):
+                        raise IncompleteDownload(f"{got} of {expected} bytes from {pdf_url}")
+        if restart:
+            return attempt()   # without the .part there's no Range, so this can't loop
+
+        if not is_pdf(part_path):
+            os.remove(part_path)
+            raise NotAPdfError(f"{pdf_url} did not return a PDF")
+        size = resumed + got
+        os.replace(part_path, out_path)
+        result = DownloadResult(out_path, digest.hexdigest(), size, resumed_from=resumed)
+        _save_state(meta_path, {
+            "url": pdf_url,
+            **validators,
+            "path": out_path,
+            "sha256": result.sha256,
+            "size": size,
+        })
+        metrics.count("bytes", got, stage="download")
+        if resumed:
+            log.debug("resumed %s from byte %d", pdf_url, resumed)
+        return result
+
+    with _url_lock(pdf_url):
+        return with_retries(attempt)
+
+
+def download_pdf_with_requests(pdf_url: str, download_folder: str) -> str:
+    """
+    Download the given PDF URL over HTTP (see fetch_pdf).
+    Returns the local file path.
+    """
+    return fetch_pdf(pdf_url, download_folder).path
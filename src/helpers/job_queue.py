@@ -0,0 +1,205 @@
+"""
+job_queue.py
+
+Postgres-backed work queues for the download and ingestion stages.
+
+Each queue is a table of jobs keyed by the row they work on (an email's
+entry_id, a report's report_id) with a small state machine:
+
+    pending ──claim──▶ claimed ──done──▶ done
+       ▲                  │
+       └──fail (retry)────┤
+                          └──fail (out of attempts)──▶ failed
+
+Workers claim batches with SELECT … FOR UPDATE SKIP LOCKED, so any number
+of processes on any number of machines can share one queue without double
+work. A claim carries a lease; if a worker dies, its jobs become claimable
+again once the lease expires. Failed attempts go back to pending with an
+exponential delay until max_attempts is reached.
+
+Methods take a cursor and leave committing to the caller, like the
+record_* helpers in pdf_downloader; commit right after claim() so the row
+locks are released.
+"""
+
+import os
+import socket
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import psycopg
+
+import configuration.system_config as system_config
+
+PENDING, CLAIMED, DONE, FAILED = "pending", "claimed", "done", "failed"
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    def __init__(
+        self,
+        table: str,
+        key: str,
+        key_type: str,
+        lease_seconds: int,
+        max_attempts: int = system_config.JOB_MAX_ATTEMPTS,
+        retry_delay: float = system_config.JOB_RETRY_DELAY,
+    ):
+        self.table = table
+        self.key = key
+        self.key_type = key_type
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    # ─── schema ──────────────────────────────────────────────────────────────
+    def ensure(self, cur: psycopg.Cursor) -> None:
+        t, k = self.table, self.key
+        cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {t} (
+          {k}              {self.key_type} PRIMARY KEY,
+          bank_tag         VARCHAR(20),
+          state            TEXT NOT NULL DEFAULT '{PENDING}'
+                           CHECK (state IN ('{PENDING}', '{CLAIMED}', '{DONE}', '{FAILED}')),
+          attempts         INT NOT NULL DEFAULT 0,
+          claimed_by       TEXT,
+          lease_expires_at TIMESTAMPTZ,
+          available_at     TIMESTAMPTZ NOT NULL DEFAULT now(),
+          last_error       TEXT,
+          enqueued_at      TIMESTAMPTZ NOT NULL DEFAULT now(),
+          updated_at       TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS idx_{t}_pending
+          ON {t}(available_at) WHERE state = '{PENDING}';
+        CREATE INDEX IF NOT EXISTS idx_{t}_leases
+          ON {t}(lease_expires_at) WHERE state = '{CLAIMED}';
+        """)
+
+    # ─── producers ───────────────────────────────────────────────────────────
+    def enqueue(self, cur: psycopg.Cursor, jobs: Iterable[Tuple[object, Optional[str]]]) -> None:
+        """Add (key, bank_tag) jobs; keys already queued are left untouched."""
+        cur.executemany(
+            f"INSERT INTO {self.table} ({self.key}, bank_tag) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+            list(jobs),
+        )
+
+    def enqueue_query(self, cur: psycopg.Cursor, select_sql: str, params: Sequence = ()) -> int:
+        """Add every (key, bank_tag) row *select_sql* returns, server side."""
+        cur.execute(
+            f"INSERT INTO {self.table} ({self.key}, bank_tag) {select_sql} ON CONFLICT DO NOTHING",
+            params,
+        )
+        return cur.rowcount
+
+    # ─── consumers ───────────────────────────────────────────────────────────
+    def claim(
+        self,
+        cur: psycopg.Cursor,
+        limit: int,
+        worker: Optional[str] = None,
+        banks: Optional[Sequence[str]] = None,
+        lease_seconds: Optional[int] = None,
+    ) -> List[Tuple[object, Optional[str]]]:
+        """
+        Lease up to *limit* runnable jobs (pending and due, or claimed with
+        an expired lease) to *worker*; returns their (key, bank_tag).
+        *lease_seconds* overrides the queue's lease, for slow paths like
+        Message Batches.
+        """
+        t, k = self.table, self.key
+        cur.execute(
+            f"""
+            UPDATE {t} j
+               SET state = '{CLAIMED}',
+                   attempts = j.attempts + 1,
+                   claimed_by = %(worker)s,
+                   lease_expires_at = now() + make_interval(secs => %(lease)s),
+                   updated_at = now()
+             WHERE j.{k} IN (
+                   SELECT {k}
+                     FROM {t}
+                    WHERE ((state = '{PENDING}' AND available_at <= now())
+                        OR (state = '{CLAIMED}' AND lease_expires_at < now()))
+                      AND attempts < %(max_attempts)s
+                      AND (%(banks)s::text[] IS NULL OR bank_tag = ANY(%(banks)s::text[]))
+                    ORDER BY enqueued_at
+                    LIMIT %(limit)s
+                      FOR UPDATE SKIP LOCKED)
+            RETURNING j.{k}, j.bank_tag
+            """,
+            {
+                "worker": worker or worker_id(),
+                "lease": lease_seconds or self.lease_seconds,
+                "max_attempts": self.max_attempts,
+                "banks": list(banks) if banks is not None else None,
+                "limit": limit,
+            },
+        )
+        return cur.fetchall()
+
+    def extend(self, cur: psycopg.Cursor, key) -> None:
+        """Push a long-running job's lease out again."""
+        cur.execute(
+            f"UPDATE {self.table} SET lease_expires_at = now() + make_interval(secs => %s), "
+            f"updated_at = now() WHERE {self.key} = %s AND state = '{CLAIMED}'",
+            (self.lease_seconds, key),
+        )
+
+    def done(self, cur: psycopg.Cursor, key) -> None:
+        cur.execute(
+            f"UPDATE {self.table} SET state = '{DONE}', lease_expires_at = NULL, "
+            f"last_error = NULL, updated_at = now() WHERE {self.key} = %s",
+            (key,),
+        )
+
+    def fail(self, cur: psycopg.Cursor, key, error: Exception) -> str:
+        """
+        Record a failed attempt: back to pending after an exponential delay,
+        or 'failed' for good once max_attempts is used up. Returns the new state.
+        """
+        cur.execute(
+            f"""
+            UPDATE {self.table}
+               SET state = CASE WHEN attempts >= %(max_attempts)s THEN '{FAILED}' ELSE '{PENDING}' END,
+                   available_at = now() + make_interval(secs => %(delay)s * power(2, attempts - 1)),
+                   lease_expires_at = NULL,
+                   last_error = %(error)s,
+                   updated_at = now()
+             WHERE {self.key} = %(key)s
+            RETURNING state
+            """,
+            {"max_attempts": self.max_attempts, "delay": self.retry_delay, "error": str(error), "key": key},
+        )
+        row = cur.fetchone()
+        return row[0] if row else FAILED
+
+    def reap(self, cur: psycopg.Cursor) -> int:
+        """Mark jobs whose lease ran out on their last attempt as failed."""
+        cur.execute(
+            f"""
+            UPDATE {self.table}
+               SET state = '{FAILED}', last_error = coalesce(last_error, 'lease expired'), updated_at = now()
+             WHERE state = '{CLAIMED}' AND lease_expires_at < now() AND attempts >= %s
+            """,
+            (self.max_attempts,),
+        )
+        return cur.rowcount
+
+    def peek(self, cur: psycopg.Cursor, limit: int) -> List[Tuple[object, Optional[str]]]:
+        """Runnable jobs, without claiming them (for dry runs)."""
+        cur.execute(
+            f"SELECT {self.key}, bank_tag FROM {self.table} "
+            f"WHERE state = '{PENDING}' AND available_at <= now() ORDER BY enqueued_at LIMIT %s",
+            (limit,),
+        )
+        return cur.fetchall()
+
+    def counts(self, cur: psycopg.Cursor) -> dict:
+        cur.execute(f"SELECT state, count(*) FROM {self.table} GROUP BY state")
+        return dict(cur.fetchall())
+
+
+DOWNLOAD_QUEUE = JobQueue("download_jobs", "entry_id", "TEXT", system_config.DOWNLOAD_LEASE_SECONDS)
+INGEST_QUEUE = JobQueue("ingest_jobs", "report_id", "UUID", system_config.INGEST_LEASE_SECONDS)
@@ -0,0 +1,338 @@
+"""
+metrics.py
+
+Per-stage timings and counters for the whole pipeline, in-process and with
+no extra dependencies.
+
+Every stage wraps its unit of work in timer():
+
+    with metrics.timer("download", bank="JPM"):
+        ...
+
+which records the seconds into the reportai_stage_seconds histogram (and
+a failure into reportai_stage_errors_total) under that stage's labels.
+Bytes, pages, tokens and retries are counters:
+
+    metrics.count("bytes", len(raw), stage="saveas")
+    metrics.count("tokens", msg.usage.input_tokens, api="claude", kind="input")
+
+Where it all goes:
+
+* METRICS_JSON_LOG - one JSON line per finished span and per event()
+  (stage, seconds, ok, labels; "-" for stderr), for tracing a single
+  report through the run after the fact
+* METRICS_TEXTFILE - the Prometheus text format, rewritten atomically
+  (node_exporter's textfile collector picks it up)
+* METRICS_PORT     - the same served live on http://host:port/metrics
+* profile_table()  - the end-of-run table run.py prints: calls, total,
+  mean, p50/p95/max and errors per stage, then the counters
+
+Stages: scrape, tag, saveas, db_insert, link, download, extract, render,
+claude, embed, vector_insert, and report for a report end to end. Spans
+nest - download includes its link lookup, scrape everything under it -
+so the stage totals don't add up to the run time.
+"""
+from __future__ import annotations
+
+import bisect
+import inspect
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import configuration.system_config as sysconfig
+
+PREFIX = "reportai_"
+# seconds; covers a tag lookup (ms) up to a long Claude call (minutes)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RESERVOIR = 1024      # latency samples kept per series for the percentiles
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.n = 0
+        self.max = 0.0
+        self.samples: List[float] = []
+
+    def add(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.n += 1
+        self.max = max(self.max, value)
+        # reservoir sampling: a uniform sample of everything seen, in bounded memory
+        if len(self.samples) < RESERVOIR:
+            self.samples.append(value)
+        else:
+            i = random.randrange(self.n)
+            if i < RESERVOIR:
+                self.samples[i] = value
+
+
+# ─── REGISTRY ────────────────────────────────────────────────────────────────
+_lock = threading.Lock()
+_counters: Dict[str, Dict[Labels, float]] = {}
+_histograms: Dict[str, Dict[Labels, Histogram]] = {}
+_log = None
+_log_lock = threading.Lock()
+
+
+def count(name: str, n: float = 1, **labels) -> None:
+    """Add *n* to the counter reportai_<name>_total{labels}."""
+    if not n:
+        return
+    key = _labels(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + n
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """Record *value* in the histogram reportai_<name>{labels}."""
+    key = _labels(labels)
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        hist = series.get(key)
+        if hist is None:
+            hist = series[key] = Histogram()
+        hist.add(value)
+
+
+def event(name: str, **fields) -> None:
+    """One structured line in METRICS_JSON_LOG (nothing when it's unset)."""
+    path = sysconfig.METRICS_JSON_LOG
+    if not path:
+        return
+    line = json.dumps({"ts": round(time.time(), 3), "event": name, "thread": threading.current_thread().name,
+                       **fields}, default=str)
+    global _log
+    with _log_lock:
+        if path == "-":
+            print(line, file=sys.stderr, flush=True)
+            return
+        if _log is None or _log.name != path:
+            _log = open(path, "a", encoding="utf-8", buffering=1)
+        _log.write(line + "\n")
+
+
+@contextmanager
+def timer(stage: str, trace: Optional[dict] = None, **labels):
+    """
+    Time the block as one *stage* span; an exception counts as an error and
+    goes on up. *trace* fields (report ids and the like - too many distinct
+    values for a Prometheus label) only go to the JSON log.
+    """
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except BaseException as e:
+        ok = False
+        count("stage_errors", stage=stage, error=type(e).__name__, **labels)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        observe("stage_seconds", seconds, stage=stage, **labels)
+        event("span", stage=stage, seconds=round(seconds, 6), ok=ok, **labels, **(trace or {}))
+
+
+def timed(stage: str, **labels):
+    """Decorator form of timer(); works on plain and async functions."""
+    def wrap(fn):
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def run_async(*args, **kwargs):
+                with timer(stage, **labels):
+                    return await fn(*args, **kwargs)
+            return run_async
+
+        @wraps(fn)
+        def run(*args, **kwargs):
+            with timer(stage, **labels):
+                return fn(*args, **kwargs)
+        return run
+    return wrap
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+# ─── PROMETHEUS ──────────────────────────────────────────────────────────────
+def _fmt_labels(key: Labels, extra: Labels = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+def _num(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def exposition() -> str:
+    """Everything recorded so far, in the Prometheus text exposition format."""
+    out = []
+    with _lock:
+        for name in sorted(_counters):
+            metric = f"{PREFIX}{name}_total"
+            out.append(f"# TYPE {metric} counter")
+            for key, value in sorted(_counters[name].items()):
+                out.append(f"{metric}{_fmt_labels(key)} {_num(value)}")
+        for name in sorted(_histograms):
+            metric = f"{PREFIX}{name}"
+            out.append(f"# TYPE {metric} histogram")
+            for key, hist in sorted(_histograms[name].items()):
+                cumulative = 0
+                for bound, n in zip(BUCKETS + (float("inf"),), hist.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else _num(bound)
+                    out.append(f"{metric}_bucket{_fmt_labels(key, (('le', le),))} {cumulative}")
+                out.append(f"{metric}_sum{_fmt_labels(key)} {hist.sum!r}")
+                out.append(f"{metric}_count{_fmt_labels(key)} {hist.n}")
+    return "\n".join(out) + "\n"
+
+
+def write_textfile(path: Optional[str] = None) -> Optional[str]:
+    """Write exposition() to *path* (METRICS_TEXTFILE by default) via a temp file and rename."""
+    path = path or sysconfig.METRICS_TEXTFILE
+    if not path:
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(exposition())
+    os.replace(tmp, path)
+    return path
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = exposition().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port: Optional[int] = None, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on *port* (METRICS_PORT by default) from a daemon thread."""
+    port = port if port is not None else sysconfig.METRICS_PORT
+    if port is None:
+        return None
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Metrics on http://{host}:{server.server_address[1]}/metrics", flush=True)
+    return server
+
+
+# ─── PROFILE ─────────────────────────────────────────────────────────────────
+def _percentile(samples: List[Tuple[float, float]], q: float) -> float:
+    """
+    q-quantile of (value, weight) samples. Each label series keeps its own
+    reservoir, so a sample stands for n/len(reservoir) observations of its
+    series; unweighted, a busy series would count no more than a quiet one.
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    target = q * sum(w for _, w in ordered)
+    seen = 0.0
+    for value, weight in ordered:
+        seen += weight
+        if seen > target:
+            return value
+    return ordered[-1][0]
+
+
+def _size(value: float, name: str) -> str:
+    if name == "bytes":
+        for unit in ("B", "KB", "MB", "GB"):
+            if value < 1024 or unit == "GB":
+                return f"{value:,.0f} {unit}" if unit == "B" else f"{value:,.1f} {unit}"
+            value /= 1024
+    return f"{value:,.0f}"
+
+
+def snapshot() -> dict:
+    """
+    What's been recorded, as plain data: {"stages": {stage: {calls, total,
+    mean, p50, p95, p99, max, errors}}, "counters": {name: [{labels, value}]}}
+    with all labels of a stage merged. benchmarks save this as JSON.
+    """
+    with _lock:
+        stages: Dict[str, Histogram] = {}
+        weighted: Dict[str, List[Tuple[float, float]]] = {}
+        for key, hist in _histograms.get("stage_seconds", {}).items():
+            stage = dict(key).get("stage", "?")
+            merged = stages.setdefault(stage, Histogram())
+            merged.n += hist.n
+            merged.sum += hist.sum
+            merged.max = max(merged.max, hist.max)
+            if hist.samples:
+                weight = hist.n / len(hist.samples)
+                weighted.setdefault(stage, []).extend((v, weight) for v in hist.samples)
+        errors: Dict[str, float] = {}
+        for key, n in _counters.get("stage_errors", {}).items():
+            stage = dict(key).get("stage", "?")
+            errors[stage] = errors.get(stage, 0) + n
+        counters = {
+            name: [{"labels": dict(key), "value": value} for key, value in sorted(series.items())]
+            for name, series in sorted(_counters.items()) if name != "stage_errors"
+        }
+    return {
+        "stages": {
+            stage: {
+                "calls": h.n,
+                "total": h.sum,
+                "mean": h.sum / h.n,
+                "p50": _percentile(weighted.get(stage, []), 0.5),
+                "p95": _percentile(weighted.get(stage, []), 0.95),
+                "p99": _percentile(weighted.get(stage, []), 0.99),
+                "max": h.max,
+                "errors": errors.get(stage, 0),
+            }
+            for stage, h in sorted(stages.items(), key=lambda kv: -kv[1].sum)
+        },
+        "counters": counters,
+    }
+
+
+def profile_table(snap: Optional[dict] = None) -> str:
+    """Per-stage latency and the counters (snapshot() by default), as a plain-text table."""
+    snap = snap or snapshot()
+    lines = [f"{'stage':14} {'calls':>7} {'total s':>9} {'mean s':>8} {'p50 s':>8} {'p95 s':>8} {'max s':>8} {'errors':>6}"]
+    for stage, st in snap["stages"].items():
+        lines.append(
+            f"{stage:14} {st['calls']:7d} {st['total']:9.2f} {st['mean']:8.3f} {st['p50']:8.3f} "
+            f"{st['p95']:8.3f} {st['max']:8.3f} {st['errors']:6.0f}"
+        )
+    for name, series in snap["counters"].items():
+        for item in series:
+            labels = ", ".join(f"{k}={v}" for k, v in item["labels"].items())
+            lines.append(f"  {name:12} {_size(item['value'], name):>14}  {labels}")
+    return "\n".join(lines)
@@ -0,0 +1,133 @@
+"""
+facets.py
+
+Faceted filtering over report_tags (see ai_summary.tagging).
+
+Filters are {facet: [values]}: a report matches when it has at least one
+of the values for every facet given (OR within a facet, AND across them),
+plus the usual received date and bank filters. Each facet is a lookup on
+idx_report_tags_facet_value, so "region Asia and topic monetary policy"
+never reads a summary. Values go through the same normalisation as at
+ingestion, so "US" finds "United States".
+
+    find_reports(conn, {"region": ["Asia"], "topic": ["monetary policy"]}, since="2025-01-01")
+    facet_counts(conn, {"region": ["Asia"]})   # what else those reports are tagged with
+
+    cd src && python -m search.facets --tag region=Asia --tag "topic=monetary policy" --counts
+"""
+from __future__ import annotations
+
+import argparse
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from ai_summary import tagging
+from search import pgvector_store, vector_index
+
+Filters = Optional[Dict[str, Sequence[str]]]
+
+
+class TaggedReport(NamedTuple):
+    report_id: object
+    received_ts: object
+    bank_tag: Optional[str]
+    report_path: Optional[str]
+
+
+def filter_sql(tags: Filters = None, since=None, until=None, bank=None) -> Tuple[str, dict]:
+    """WHERE clause over report_vectors v LEFT JOIN reports r, and its parameters."""
+    where, params = pgvector_store.filter_sql(since, until, bank, base=())
+    clauses = [where] if where != "TRUE" else []
+    for i, (facet, values) in enumerate(sorted((tags or {}).items())):
+        if facet not in tagging.FACETS:
+            raise ValueError(f"unknown facet {facet!r}; expected one of {', '.join(tagging.FACETS)}")
+        values = [v for v in (tagging.normalise(facet, v) for v in ([values] if isinstance(values, str) else values)) if v]
+        clauses.append(
+            f"v.report_id IN (SELECT t.report_id FROM report_tags t "
+            f"WHERE t.facet = %(facet{i})s AND t.value = ANY(%(values{i})s))"
+        )
+        params[f"facet{i}"], params[f"values{i}"] = facet, values
+    return " AND ".join(clauses) or "TRUE", params
+
+
+def find_reports(conn, tags: Filters = None, since=None, until=None, bank=None,
+                 limit: int = 100, offset: int = 0) -> List[TaggedReport]:
+    """Reports matching the filters, newest first."""
+    where, params = filter_sql(tags, since, until, bank)
+    params.update(limit=limit, offset=offset)
+    rows = conn.execute(
+        f"""
+        SELECT v.report_id, v.email_received_ts, r.bank_tag, v.report_path
+          FROM report_vectors v
+          LEFT JOIN reports r ON r.report_id = v.report_id
+         WHERE {where}
+         ORDER BY v.email_received_ts DESC NULLS LAST, v.report_id
+         LIMIT %(limit)s OFFSET %(offset)s
+        """,
+        params,
+    ).fetchall()
+    return [TaggedReport(*row) for row in rows]
+
+
+def facet_counts(conn, tags: Filters = None, since=None, until=None, bank=None,
+                 facets: Sequence[str] = tagging.FACETS, top: int = 20) -> Dict[str, List[Tuple[str, int]]]:
+    """{facet: [(value, reports)]}, the *top* values of each facet among the reports matching the filters."""
+    where, params = filter_sql(tags, since, until, bank)
+    params.update(facets=list(facets), top=top)
+    if where == "TRUE":
+        # nothing to narrow by: count straight off the tags index
+        source = "report_tags t"
+    else:
+        source = f"""report_tags t
+                     JOIN (SELECT v.report_id
+                             FROM report_vectors v
+                             LEFT JOIN reports r ON r.report_id = v.report_id
+                            WHERE {where}) m ON m.report_id = t.report_id"""
+    rows = conn.execute(
+        f"""
+        SELECT facet, value, n
+          FROM (SELECT t.facet, t.value, count(*) AS n,
+                       row_number() OVER (PARTITION BY t.facet ORDER BY count(*) DESC, t.value) AS pos
+                  FROM {source}
+                 WHERE t.facet = ANY(%(facets)s)
+                 GROUP BY t.facet, t.value) x
+         WHERE pos <= %(top)s
+         ORDER BY facet, n DESC, value
+        """,
+        params,
+    ).fetchall()
+    counts: Dict[str, List[Tuple[str, int]]] = defaultdict(list)
+    for facet, value, n in rows:
+        counts[facet].append((value, n))
+    return dict(counts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Filter reports by their tags")
+    parser.add_argument("--tag", action="append", default=[], metavar="FACET=VALUE",
+                        help=f"facet filter ({', '.join(tagging.FACETS)}); repeat for several")
+    parser.add_argument("--since", help="received on/after (YYYY-MM-DD)")
+    parser.add_argument("--until", help="received before (YYYY-MM-DD)")
+    parser.add_argument("--bank", action="append", help="bank tag; repeat for several")
+    parser.add_argument("--counts", action="store_true", help="show value counts per facet instead of reports")
+    parser.add_argument("-n", type=int, default=50)
+    args = parser.parse_args()
+
+    tags: Dict[str, list] = defaultdict(list)
+    for item in args.tag:
+        facet, _, value = item.partition("=")
+        tags[facet.strip().lower()].append(value)
+
+    conn = vector_index.connect()
+    if args.counts:
+        for facet, values in facet_counts(conn, tags, args.since, args.until, args.bank, top=args.n).items():
+            print(f"{facet}: " + ", ".join(f"{v} ({n})" for v, n in values))
+    else:
+        for rep in find_reports(conn, tags, args.since, args.until, args.bank, limit=args.n):
+            received = rep.received_ts.date() if rep.received_ts else "?"
+            print(f"{received}  {rep.bank_tag or '?':8} {rep.report_path}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
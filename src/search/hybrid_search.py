@@ -0,0 +1,178 @@
+"""
+hybrid_search.py
+
+Keyword + semantic search over the reports, fused by reciprocal rank.
+
+Embedding similarity finds reports *about* a topic but misses exact
+tickers, names and phrases ("JGB", "YCC", a CUSIP), and report_vectors.summary
+had no text index at all, so a keyword lookup meant reading every row. Both
+summaries and the extracted report text (report_pages) now carry a generated
+tsvector column with a GIN index, and a query runs two indexed legs:
+
+* text   – websearch_to_tsquery() matched through the GIN indexes, ranked
+           by ts_rank_cd (a summary hit weighted SUMMARY_RANK_WEIGHT times
+           a hit in the report text, best page per report)
+* vector – kNN on the HNSW index (search.pgvector_store), or the in-process
+           matrix (search.vector_index) while report_vectors.embedding is
+           still DOUBLE PRECISION[]
+
+Each leg returns its top HYBRID_CANDIDATES, and a report scores
+sum(1 / (RRF_K + rank)) over the legs it appears in. Rank fusion needs no
+calibration between ts_rank and cosine scores, which aren't comparable.
+
+    hybrid_search('"yield curve control" JGB', k=10, since="2025-01-01", bank="JPM")
+
+    cd src && python -m search.hybrid_search '"yield curve control" JGB' --bank JPM
+    cd src && python -m search.hybrid_search 'USDJPY -intervention' --keyword
+"""
+from __future__ import annotations
+
+import argparse
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import configuration.system_config as sysconfig
+from search import pgvector_store, vector_index
+
+
+class HybridHit(NamedTuple):
+    report_id: object
+    score: float                  # reciprocal rank fusion score
+    text_rank: Optional[int]      # 1-based position in each leg, None if absent
+    vector_rank: Optional[int]
+    received_ts: object
+    bank_tag: Optional[str]
+    report_path: Optional[str]
+    summary: Optional[str]
+    snippet: Optional[str]        # matching words highlighted in the summary
+
+
+# ─── LEGS ────────────────────────────────────────────────────────────────────
+def text_search(conn, query: str, n: int = sysconfig.HYBRID_CANDIDATES, since=None, until=None, bank=None) -> List[tuple]:
+    """[(report_id, rank)] for the *n* best full-text matches of *query* in summaries and report text."""
+    where, params = pgvector_store.filter_sql(since, until, bank, base=())
+    params.update(cfg=sysconfig.FTS_CONFIG, query=query, n=n, weight=sysconfig.SUMMARY_RANK_WEIGHT)
+    rows = conn.execute(
+        f"""
+        WITH q AS (SELECT websearch_to_tsquery(%(cfg)s::regconfig, %(query)s) AS q),
+        hits AS (
+            SELECT v.report_id, %(weight)s * ts_rank_cd(v.summary_tsv, q.q, 32) AS rank
+              FROM report_vectors v, q
+             WHERE v.summary_tsv @@ q.q
+            UNION ALL
+            SELECT r.report_id, p.rank
+              FROM (SELECT p.content_sha256, max(ts_rank_cd(p.tsv, q.q, 32)) AS rank
+                      FROM report_pages p, q
+                     WHERE p.tsv @@ q.q
+                     GROUP BY p.content_sha256) p
+              JOIN reports r ON r.content_sha256 = p.content_sha256
+        )
+        SELECT h.report_id, sum(h.rank) AS rank
+          FROM hits h
+          JOIN report_vectors v ON v.report_id = h.report_id
+          LEFT JOIN reports r ON r.report_id = h.report_id
+         WHERE {where}
+         GROUP BY h.report_id
+         ORDER BY rank DESC, h.report_id
+         LIMIT %(n)s
+        """,
+        params,
+    ).fetchall()
+    return [(rid, float(rank)) for rid, rank in rows]
+
+
+def vector_search(conn, vector, n: int = sysconfig.HYBRID_CANDIDATES, since=None, until=None, bank=None) -> List[tuple]:
+    """[(report_id, cosine similarity)] for the *n* nearest reports."""
+    if pgvector_store.is_migrated(conn, "report_vectors"):
+        return pgvector_store.knn(conn, vector, n, since=since, until=until, bank=bank)
+    hits = vector_index.search_reports(vector, n, since=since, until=until, bank=bank, conn=conn)
+    return [(h.report_id, h.score) for h in hits]
+
+
+def rrf(legs: Sequence[Sequence], k: int = sysconfig.RRF_K) -> Dict[object, float]:
+    """Reciprocal rank fusion of ranked id lists."""
+    scores: Dict[object, float] = {}
+    for ranked in legs:
+        for pos, rid in enumerate(ranked, start=1):
+            scores[rid] = scores.get(rid, 0.0) + 1.0 / (k + pos)
+    return scores
+
+
+# ─── SEARCH ──────────────────────────────────────────────────────────────────
+def hybrid_search(
+    query: str,
+    k: int = 10,
+    since=None,
+    bank=None,
+    until=None,
+    keyword_only: bool = False,
+    candidates: int = sysconfig.HYBRID_CANDIDATES,
+    apis=None,
+    conn=None,
+) -> List[HybridHit]:
+    """
+    Top *k* reports for *query* by fused full-text and embedding rank,
+    optionally only those received since/until a date and from one bank
+    (or a list of banks). keyword_only skips the embedding call and the
+    vector leg (exact lookups, no Voyage round trip).
+    """
+    own_conn = conn is None
+    conn = conn or vector_index.connect()
+    try:
+        n = max(candidates, k)
+        text = [rid for rid, _ in text_search(conn, query, n, since, until, bank)]
+        vector = []
+        if not keyword_only:
+            emb = vector_index.embed_query(query, apis)
+            vector = [rid for rid, _ in vector_search(conn, emb, n, since, until, bank)]
+
+        scores = rrf([text, vector])
+        top = sorted(scores, key=lambda rid: -scores[rid])[:k]
+        if not top:
+            return []
+        text_pos = {rid: i for i, rid in enumerate(text, start=1)}
+        vector_pos = {rid: i for i, rid in enumerate(vector, start=1)}
+        details = {
+            row[0]: row[1:]
+            for row in conn.execute(
+                """
+                SELECT v.report_id, v.email_received_ts, r.bank_tag, v.report_path, v.summary,
+                       ts_headline(%(cfg)s::regconfig, coalesce(v.summary, ''),
+                                   websearch_to_tsquery(%(cfg)s::regconfig, %(query)s),
+                                   'MaxFragments=2, MinWords=8, MaxWords=25')
+                  FROM report_vectors v
+                  LEFT JOIN reports r ON r.report_id = v.report_id
+                 WHERE v.report_id = ANY(%(ids)s)
+                """,
+                {"cfg": sysconfig.FTS_CONFIG, "query": query, "ids": top},
+            )
+        }
+    finally:
+        if own_conn:
+            conn.close()
+    return [
+        HybridHit(rid, scores[rid], text_pos.get(rid), vector_pos.get(rid), *details.get(rid, (None,) * 5))
+        for rid in top
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Hybrid keyword + semantic search over ingested reports")
+    parser.add_argument("query", help="web-search syntax: \"exact phrase\", or, -excluded")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--since", help="received on/after (YYYY-MM-DD)")
+    parser.add_argument("--until", help="received before (YYYY-MM-DD)")
+    parser.add_argument("--bank", action="append", help="bank tag; repeat for several")
+    parser.add_argument("--keyword", action="store_true", help="full-text only, no embedding call")
+    args = parser.parse_args()
+
+    for hit in hybrid_search(args.query, args.k, since=args.since, until=args.until, bank=args.bank,
+                             keyword_only=args.keyword):
+        received = hit.received_ts.date() if hit.received_ts else "?"
+        legs = f"text #{hit.text_rank or '-'} vec #{hit.vector_rank or '-'}"
+        print(f"{hit.score:6.4f}  {received}  {hit.bank_tag or '?':8} {legs:18} {hit.report_path}")
+        if hit.snippet:
+            print("        " + " ".join(hit.snippet.split())[:200])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+pgvector_store.py
+
+Report embeddings stored as pgvector columns with an HNSW index, and kNN
+queries in SQL on top.
+
+report_vectors.embedding and report_chunks.embedding started out as
+DOUBLE PRECISION[]: 8 bytes a dimension, no index, and any similarity query
+a full scan that unpacks every array. Here they become VECTOR_TYPE(EMBED_DIM)
+columns ("vector", or "halfvec" at 2 bytes a dimension on pgvector >= 0.7)
+with an HNSW cosine index.
+
+migrate() converts an existing table in place without stopping ingestion:
+a new column is added and backfilled VECTOR_MIGRATE_BATCH rows per
+transaction, then - under a short table lock - the stragglers are copied,
+the old column dropped and the new one renamed to `embedding`. Inserts
+need no change: pgvector casts float arrays to vectors on assignment, so
+ingestion writes the new type directly. Readers that want a plain list
+select embedding::real[], which works before and after the migration.
+The extension is only created for a new table or a migration, so an
+unmigrated float8[] database keeps working without pgvector installed.
+
+The columns are typed to one dimension. A model with another one needs
+resize(), which reembed_reports() does when the first new vectors come
+back; stop ingestion and set EMBED_MODEL / EMBED_DIM to the new model
+first, or its inserts fail on the dimension (and are retried later).
+
+    cd src && python -m search.pgvector_store migrate
+    cd src && python -m search.pgvector_store search "BoJ yield curve control exit" --bank JPM
+
+* knn()            – nearest reports to a vector, with date/bank filters
+* similar_reports()/near_duplicates() – neighbours of a stored report
+* knn_reports()    – search_reports() equivalent answered by Postgres
+"""
+from __future__ import annotations
+
+import argparse
+import uuid
+from typing import List, Optional, Sequence, Tuple
+
+import configuration.system_config as sysconfig
+
+TABLES = ("report_vectors", "report_chunks")
+
+
+def vector_type(dim: Optional[int] = None) -> str:
+    return f"{sysconfig.VECTOR_TYPE}({dim or sysconfig.EMBED_DIM})"
+
+
+def ensure_extension(conn, table: Optional[str] = None) -> None:
+    """CREATE EXTENSION vector - with *table*, only if that table is about to be created."""
+    if table is not None and column_type(conn, table) is not None:
+        return
+    conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+
+
+def column_type(conn, table: str, column: str = "embedding") -> Optional[str]:
+    row = conn.execute(
+        """
+        SELECT format_type(a.atttypid, a.atttypmod)
+          FROM pg_attribute a
+         WHERE a.attrelid = to_regclass(%s) AND a.attname = %s AND NOT a.attisdropped
+        """,
+        (table, column),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def is_migrated(conn, table: str) -> bool:
+    return (column_type(conn, table) or "").split("(")[0] in ("vector", "halfvec")
+
+
+def column_dim(conn, table: str) -> Optional[int]:
+    """Dimension of a pgvector *table*.embedding (None for float8[])."""
+    ctype = column_type(conn, table) or ""
+    return int(ctype.split("(")[1].rstrip(")")) if is_migrated(conn, table) and "(" in ctype else None
+
+
+def ensure_index(conn, table: str) -> None:
+    ops = "halfvec_cosine_ops" if sysconfig.VECTOR_TYPE == "halfvec" else "vector_cosine_ops"
+    conn.execute(
+        f"""
+        CREATE INDEX IF NOT EXISTS idx_{table}_embedding_hnsw
+          ON {table} USING hnsw (embedding {ops})
+          WITH (m = {int(sysconfig.HNSW_M)}, ef_construction = {int(sysconfig.HNSW_EF_CONSTRUCTION)})
+        """
+    )
+
+
+def ensure_storage(cur, table: str) -> None:
+    """Index *table*.embedding if it is a pgvector column, else point at migrate()."""
+    if is_migrated(cur, table):
+        ensure_index(cur, table)
+        dim = column_dim(cur, table)
+        if dim and dim != sysconfig.EMBED_DIM:
+            print(f"{table}.embedding holds {dim}-dim vectors but EMBED_DIM is {sysconfig.EMBED_DIM}; "
+                  f"run reembed_reports() with the new model to convert it")
+    else:
+        print(f"{table}.embedding is still {column_type(cur, table)}; "
+              f"run `python -m search.pgvector_store migrate` to move it to {vector_type()} with an HNSW index")
+
+
+# ─── MIGRATION ───────────────────────────────────────────────────────────────
+def migrate(conn, table: str = "report_vectors", batch: Optional[int] = None) -> int:
+    """
+    Convert *table*.embedding from DOUBLE PRECISION[] to VECTOR_TYPE(EMBED_DIM)
+    and index it; returns rows converted. Safe to interrupt and re-run.
+    *conn* must be in autocommit mode.
+    """
+    ensure_extension(conn)
+    if column_type(conn, table) is None:
+        return 0
+    if is_migrated(conn, table):
+        ensure_index(conn, table)
+        return 0
+
+    vtype = vector_type()
+    batch = batch or sysconfig.VECTOR_MIGRATE_BATCH
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS embedding_v {vtype}")
+    done = 0
+    while True:
+        # ctid batches: works for any key, and each batch is its own short transaction
+        n = conn.execute(
+            f"""
+            UPDATE {table} SET embedding_v = embedding::{vtype}
+             WHERE ctid = ANY(ARRAY(SELECT ctid FROM {table}
+                                     WHERE embedding_v IS NULL AND embedding IS NOT NULL
+                                     LIMIT %s))
+            """,
+            (batch,),
+        ).rowcount
+        if not n:
+            break
+        done += n
+        print(f"{table}: converted {done} embeddings")
+
+    with conn.transaction():
+        # rows written by ingestion since the last batch, then the swap
+        conn.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+        done += conn.execute(
+            f"UPDATE {table} SET embedding_v = embedding::{vtype} "
+            f"WHERE embedding_v IS NULL AND embedding IS NOT NULL"
+        ).rowcount
+        conn.execute(f"ALTER TABLE {table} DROP COLUMN embedding")
+        conn.execute(f"ALTER TABLE {table} RENAME COLUMN embedding_v TO embedding")
+    print(f"{table}: embedding is now {vtype}; building HNSW index...")
+    ensure_index(conn, table)
+    return done
+
+
+def resize(conn, table: str, dim: int) -> bool:
+    """
+    Retype a pgvector *table*.embedding to *dim* dimensions for a new
+    embedding model: the HNSW index is dropped, the stored embeddings are
+    cleared (vectors can't be cast across dimensions; the re-embed writes
+    new ones) and the empty index rebuilt. False if there was nothing to do.
+    *conn* must be in autocommit mode.
+    """
+    current = column_dim(conn, table)
+    if current is None or current == dim:
+        return False
+    vtype = f"{column_type(conn, table).split('(')[0]}({int(dim)})"
+    with conn.transaction():
+        conn.execute(f"DROP INDEX IF EXISTS idx_{table}_embedding_hnsw")
+        conn.execute(f"ALTER TABLE {table} ALTER COLUMN embedding TYPE {vtype} USING NULL")
+    print(f"{table}: embedding is now {vtype} (was {current} dimensions); rebuilding HNSW index...")
+    ensure_index(conn, table)
+    return True
+
+
+# ─── QUERIES ─────────────────────────────────────────────────────────────────
+def filter_sql(since=None, until=None, bank=None, exclude: Sequence = (), base=("v.embedding IS NOT NULL",)) -> Tuple[str, dict]:
+    """WHERE clause (over report_vectors v LEFT JOIN reports r) and its parameters."""
+    where, params = list(base), {}
+    if since is not None:
+        where.append("v.email_received_ts >= %(since)s")
+        params["since"] = since
+    if until is not None:
+        where.append("v.email_received_ts < %(until)s")
+        params["until"] = until
+    if bank is not None:
+        where.append("r.bank_tag = ANY(%(banks)s)")
+        params["banks"] = [bank] if isinstance(bank, str) else list(bank)
+    if exclude:
+        where.append("v.report_id <> ALL(%(exclude)s)")
+        params["exclude"] = list(exclude)
+    return " AND ".join(where) or "TRUE", params
+
+
+def knn(conn, vector, k: int = 10, since=None, until=None, bank=None, exclude: Sequence = ()) -> List[tuple]:
+    """
+    [(report_id, cosine similarity)] for the *k* reports nearest *vector*.
+
+    HNSW filters after it walks the graph, so a narrow filter can leave
+    fewer than k rows out of the ef_search candidates; in that case the
+    query is re-run as an exact scan over the filtered rows.
+    """
+    where, params = filter_sql(since, until, bank, exclude)
+    q = [float(x) for x in vector]
+    params.update(q=q, k=k)
+    sql = f"""
+        SELECT v.report_id, 1 - (v.embedding <=> %(q)s::{vector_type(len(q))}) AS score
+          FROM report_vectors v
+          LEFT JOIN reports r ON r.report_id = v.report_id
+         WHERE {where}
+         ORDER BY v.embedding <=> %(q)s::{vector_type(len(q))}
+         LIMIT %(k)s
+    """
+    with conn.transaction():
+        conn.execute(f"SET LOCAL hnsw.ef_search = {int(max(sysconfig.HNSW_EF_SEARCH, k))}")
+        rows = conn.execute(sql, params).fetchall()
+        if len(rows) < k and len(params) > 2:
+            conn.execute("SET LOCAL enable_indexscan = off")
+            rows = conn.execute(sql, params).fetchall()
+    return [(rid, float(score)) for rid, score in rows]
+
+
+def similar_reports(conn, report_id, k: int = 10, **filters) -> List[tuple]:
+    """Reports nearest to a stored one (itself excluded)."""
+    row = conn.execute(
+        "SELECT embedding::real[] FROM report_vectors WHERE report_id = %s", (report_id,)
+    ).fetchone()
+    if not row or row[0] is None:
+        return []
+    return knn(conn, row[0], k, exclude=[report_id], **filters)
+
+
+def near_duplicates(conn, report_id, threshold: float = 0.98, k: int = 20) -> List[tuple]:
+    """Stored reports whose summaries are near-identical to *report_id*'s (cosine >= threshold)."""
+    return [(rid, score) for rid, score in similar_reports(conn, report_id, k) if score >= threshold]
+
+
+def knn_reports(query, k: int = 10, since=None, bank=None, until=None, apis=None, conn=None):
+    """search.vector_index.search_reports(), answered by the HNSW index instead of the local matrix."""
+    from search.vector_index import SearchHit, connect, embed_query
+
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        vector = embed_query(query, apis) if isinstance(query, str) else query
+        hits = knn(conn, vector, k, since=since, until=until, bank=bank)
+        details = {
+            row[0]: row[1:]
+            for row in conn.execute(
+                """
+                SELECT v.report_id, v.email_received_ts, r.bank_tag, v.report_path, v.summary
+                  FROM report_vectors v
+                  LEFT JOIN reports r ON r.report_id = v.report_id
+                 WHERE v.report_id = ANY(%s)
+                """,
+                ([rid for rid, _ in hits],),
+            )
+        } if hits else {}
+    finally:
+        if own_conn:
+            conn.close()
+    return [SearchHit(rid, score, *details.get(rid, (None, None, None, None))) for rid, score in hits]
+
+
+def main() -> None:
+    from search.vector_index import connect
+
+    parser = argparse.ArgumentParser(description="pgvector storage and kNN search for report embeddings")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("migrate", help="convert embedding columns to pgvector and build the HNSW indexes")
+    s = sub.add_parser("search", help="kNN search in Postgres")
+    s.add_argument("query")
+    s.add_argument("-k", type=int, default=10)
+    s.add_argument("--since")
+    s.add_argument("--until")
+    s.add_argument("--bank", action="append")
+    d = sub.add_parser("similar", help="reports nearest a stored one")
+    d.add_argument("report_id", type=uuid.UUID)
+    d.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    conn = connect()
+    if args.cmd == "migrate":
+        for table in TABLES:
+            print(f"{table}: {migrate(conn, table)} rows converted")
+    elif args.cmd == "search":
+        for hit in knn_reports(args.query, args.k, since=args.since, until=args.until, bank=args.bank, conn=conn):
+            received = hit.received_ts.date() if hit.received_ts else "?"
+            print(f"{hit.score:6.3f}  {received}  {hit.bank_tag or '?':8} {hit.report_path}")
+    else:
+        for rid, score in similar_reports(conn, args.report_id, args.k):
+            print(f"{score:6.3f}  {rid}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+vector_index.py
+
+Semantic search over the reports in report_vectors.
+
+The embeddings live in a DOUBLE PRECISION[] column, which Postgres can only
+hand back row by row (search.pgvector_store is the alternative once the
+column is migrated to pgvector and HNSW-indexed). Here they're copied once into a contiguous float32
+matrix on disk (unit-normalised, so cosine similarity is a dot product),
+memory-mapped, and topped up before each query with whatever was embedded
+in report_vectors since the last refresh (embedded_at watermark): new
+rows are appended, re-embedded ones overwritten in place, and vectors of
+another dimension (a new model) start the index over. A query is
+one matrix-vector product plus argpartition for the top k; the received
+date and bank filters are boolean masks over per-row metadata kept
+alongside the matrix.
+
+Files, per embedding model, under SEARCH_INDEX_FOLDER:
+  <model>.f32   rows x dim float32
+  <model>.ids   16-byte report_id per row
+  <model>.ts    received time per row (int64 epoch seconds)
+  <model>.bank  bank code per row (int16, index into meta["banks"])
+  <model>.json  row count, dim, bank names, watermark - written last, so a
+                crash mid-append just leaves bytes past the end to ignore
+
+Rows deleted from report_vectors stay in the files but are dropped from
+the results; --rebuild clears them out.
+
+    search_reports("BoJ yield curve control exit", k=10, since="2025-01-01", bank="JPM")
+
+    cd src && python -m search.vector_index "BoJ yield curve control exit" -k 10 --bank JPM
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import uuid
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import psycopg
+
+import configuration.system_config as sysconfig
+
+NO_TIME = np.iinfo(np.int64).min     # rows without a received time never pass a date filter
+FETCH_ROWS = 5000                    # rows per round trip when topping up
+
+
+class SearchHit(NamedTuple):
+    report_id: uuid.UUID
+    score: float
+    received_ts: Optional[dt.datetime]
+    bank_tag: Optional[str]
+    report_path: Optional[str]
+    summary: Optional[str]
+
+
+def _epoch(ts) -> int:
+    if ts is None:
+        return NO_TIME
+    if isinstance(ts, str):
+        ts = dt.datetime.fromisoformat(ts)
+    if isinstance(ts, dt.date) and not isinstance(ts, dt.datetime):
+        ts = dt.datetime.combine(ts, dt.time())
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=dt.timezone.utc)
+    return int(ts.timestamp())
+
+
+def normalise(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+# ─── INDEX ───────────────────────────────────────────────────────────────────
+class VectorIndex:
+    """Memory-mapped embedding matrix with row metadata; rows are appended or overwritten, never removed."""
+
+    def __init__(self, folder: str = sysconfig.SEARCH_INDEX_FOLDER, model: str = sysconfig.EMBED_MODEL):
+        self.folder = folder
+        self.model = model
+        self.base = os.path.join(folder, model.replace("/", "_"))
+        self.meta = {"model": model, "rows": 0, "dim": None, "banks": [], "watermark": None}
+        if os.path.exists(self.base + ".json"):
+            with open(self.base + ".json") as f:
+                self.meta = json.load(f)
+        self._positions = None
+        self._map()
+
+    @property
+    def rows(self) -> int:
+        return self.meta["rows"]
+
+    def _map(self) -> None:
+        n, dim = self.rows, self.meta["dim"]
+        if not n:
+            self.vectors = np.zeros((0, dim or 0), dtype=np.float32)
+            self.ids = np.zeros((0, 16), dtype=np.uint8)
+            self.ts = np.zeros(0, dtype=np.int64)
+            self.bank = np.zeros(0, dtype=np.int16)
+        else:
+            self.vectors = np.memmap(self.base + ".f32", np.float32, "r", shape=(n, dim))
+            self.ids = np.memmap(self.base + ".ids", np.uint8, "r", shape=(n, 16))
+            self.ts = np.memmap(self.base + ".ts", np.int64, "r", shape=(n,))
+            self.bank = np.memmap(self.base + ".bank", np.int16, "r", shape=(n,))
+
+    def positions(self) -> dict:
+        """report_id bytes -> row number."""
+        if self._positions is None:
+            self._positions = {bytes(row): i for i, row in enumerate(self.ids)}
+        return self._positions
+
+    def bank_code(self, bank_tag: Optional[str]) -> int:
+        banks = self.meta["banks"]
+        if bank_tag not in banks:
+            banks.append(bank_tag)
+        return banks.index(bank_tag)
+
+    def _columns(self, vectors, received: Sequence, banks: Sequence[Optional[str]]) -> dict:
+        vectors = normalise(vectors)
+        if self.meta["dim"] is None:
+            self.meta["dim"] = int(vectors.shape[1])
+        elif vectors.shape[1] != self.meta["dim"]:
+            raise ValueError(f"embedding dim {vectors.shape[1]} != index dim {self.meta['dim']}; rebuild the index")
+        return {
+            ".f32": vectors,
+            ".ts": np.array([_epoch(t) for t in received], dtype=np.int64),
+            ".bank": np.array([self.bank_code(b) for b in banks], dtype=np.int16),
+        }
+
+    def append(self, ids: Sequence[uuid.UUID], vectors, received: Sequence, banks: Sequence[Optional[str]]) -> None:
+        if not len(ids):
+            return
+        columns = self._columns(vectors, received, banks)
+        columns[".ids"] = np.frombuffer(b"".join(u.bytes for u in ids), dtype=np.uint8).reshape(-1, 16)
+        os.makedirs(self.folder, exist_ok=True)
+        for ext, arr in columns.items():
+            row_bytes = arr.itemsize * (arr.shape[1] if arr.ndim == 2 else 1)
+            with open(self.base + ext, "ab") as f:
+                f.truncate(self.rows * row_bytes)   # drop anything a crash left behind
+                f.write(np.ascontiguousarray(arr).tobytes())
+        if self._positions is not None:
+            self._positions.update((u.bytes, self.rows + i) for i, u in enumerate(ids))
+        self.meta["rows"] += len(ids)
+        self._write_meta()
+        self._map()
+
+    def overwrite(self, rows: Sequence[int], vectors, received: Sequence, banks: Sequence[Optional[str]]) -> None:
+        """Replace the vector and metadata of existing *rows* (a re-embedded report)."""
+        if not len(rows):
+            return
+        for ext, arr in self._columns(vectors, received, banks).items():
+            row_bytes = arr.itemsize * (arr.shape[1] if arr.ndim == 2 else 1)
+            with open(self.base + ext, "r+b") as f:
+                for i, values in zip(rows, arr):
+                    f.seek(i * row_bytes)
+                    f.write(np.ascontiguousarray(values).tobytes())
+        self._write_meta()   # new bank codes
+        self._map()
+
+    def _write_meta(self) -> None:
+        tmp = self.base + ".json.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.base + ".json")
+
+    def clear(self) -> None:
+        for ext in (".f32", ".ids", ".ts", ".bank", ".json"):
+            if os.path.exists(self.base + ext):
+                os.remove(self.base + ext)
+        self.meta = {"model": self.model, "rows": 0, "dim": None, "banks": [], "watermark": None}
+        self._positions = None
+        self._map()
+
+    # ─── refresh ─────────────────────────────────────────────────────────────
+    def refresh(self, conn, slack: float = sysconfig.SEARCH_REFRESH_SLACK) -> int:
+        """
+        Take in report_vectors rows embedded since the last refresh; returns
+        how many. Reports already in the index are overwritten in place;
+        newly embedded vectors of another dimension clear the index and read
+        everything again, keeping only rows of the new dimension.
+        """
+        since = self.meta["watermark"]
+        if since:
+            since = dt.datetime.fromisoformat(since) - dt.timedelta(seconds=slack)
+        # not keyed on the watermark: a first build cut short leaves rows with no watermark
+        positions = self.positions() if self.rows else {}
+        added, watermark, rebuild = 0, self.meta["watermark"], None
+        # server-side cursor, so a first build streams rather than loading every row
+        with conn.transaction(), conn.cursor(name="vector_index_refresh") as cur:
+            cur.itersize = FETCH_ROWS
+            cur.execute(
+                """
+                SELECT v.report_id, v.embedding::real[], v.email_received_ts, r.bank_tag, v.embedded_at
+                  FROM report_vectors v
+                  LEFT JOIN reports r ON r.report_id = v.report_id
+                 WHERE v.embedding IS NOT NULL
+                   AND (%(since)s::timestamptz IS NULL OR v.embedded_at >= %(since)s::timestamptz)
+                 ORDER BY v.embedded_at, v.report_id
+                """,
+                {"since": since},
+            )
+            while rows := cur.fetchmany(FETCH_ROWS):
+                dim = self.meta["dim"] or len(rows[0][1])
+                if any(len(r[1]) != dim for r in rows):
+                    if since:
+                        rebuild = next(len(r[1]) for r in rows if len(r[1]) != dim)
+                        break
+                    # a full read half way through a re-embed: the rest come back once redone
+                    rows = [r for r in rows if len(r[1]) == dim]
+                    if not rows:
+                        continue
+                new = [r for r in rows if r[0].bytes not in positions]
+                old = [r for r in rows if r[0].bytes in positions]
+                self.overwrite([positions[r[0].bytes] for r in old], [r[1] for r in old],
+                               [r[2] for r in old], [r[3] for r in old])
+                self.append([r[0] for r in new], [r[1] for r in new], [r[2] for r in new], [r[3] for r in new])
+                positions = self.positions()
+                added += len(rows)
+                watermark = max(r[4] for r in rows).isoformat()
+        if rebuild:
+            # re-embedded with a model of another dimension: start over in the new one
+            print(f"{self.model}: embeddings are now {rebuild}-dim; rebuilding the search index")
+            self.clear()
+            self.meta["dim"] = rebuild
+            return self.refresh(conn, slack)
+        if watermark != self.meta["watermark"]:
+            self.meta["watermark"] = watermark
+            self._write_meta()
+        return added
+
+    # ─── query ───────────────────────────────────────────────────────────────
+    def mask(self, since=None, until=None, bank: Optional[str | Iterable[str]] = None) -> Optional[np.ndarray]:
+        """Rows passing the filters, or None when there are none."""
+        keep = None
+        if since is not None:
+            keep = self.ts >= _epoch(since)
+        if until is not None:
+            m = (self.ts < _epoch(until)) & (self.ts != NO_TIME)
+            keep = m if keep is None else keep & m
+        if bank is not None:
+            wanted = [bank] if isinstance(bank, str) else list(bank)
+            codes = [self.meta["banks"].index(b) for b in wanted if b in self.meta["banks"]]
+            m = np.isin(self.bank, codes)
+            keep = m if keep is None else keep & m
+        return keep
+
+    def search(self, query_vector, k: int = 10, since=None, until=None, bank=None) -> List[tuple]:
+        """[(report_id, cosine similarity)] best first."""
+        if not self.rows:
+            return []
+        q = normalise(query_vector).reshape(-1)
+        keep = self.mask(since, until, bank)
+        if keep is None:
+            rows = None
+            scores = self.vectors @ q
+        else:
+            rows = np.flatnonzero(keep)
+            if rows.size == 0:
+                return []
+            if rows.size < self.rows // 4:
+                scores = self.vectors[rows] @ q          # selective filter: score only those rows
+            else:
+                scores = np.where(keep, self.vectors @ q, -np.inf)
+                rows = None
+        k = min(k, scores.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        idx = top if rows is None else rows[top]
+        return [(uuid.UUID(bytes=bytes(self.ids[i])), float(scores[j]))
+                for i, j in zip(idx, top) if np.isfinite(scores[j])]
+
+
+# ─── API ─────────────────────────────────────────────────────────────────────
+_indexes: dict = {}
+
+
+def get_index(model: str = sysconfig.EMBED_MODEL, folder: str = sysconfig.SEARCH_INDEX_FOLDER) -> VectorIndex:
+    """The process-wide index for *model* (opened once, then kept mapped)."""
+    key = (folder, model)
+    if key not in _indexes:
+        _indexes[key] = VectorIndex(folder, model)
+    return _indexes[key]
+
+
+def connect():
+    dsn = sysconfig.DSN
+    return psycopg.connect(**dsn, autocommit=True) if isinstance(dsn, dict) else psycopg.connect(dsn, autocommit=True)
+
+
+def embed_query(query: str, apis=None, model: str = sysconfig.EMBED_MODEL) -> list:
+    from ai_summary import rate_limiting
+    from ai_summary import summarization_vectorization as sv
+
+    async def run():
+        a = apis or sv.default_apis()
+        resp = await rate_limiting.embed(a.voyage, a.voyage_limits, [query], model=model, input_type="query")
+        return resp.embeddings[0]
+
+    return asyncio.run(run())
+
+
+def search_reports(
+    query,
+    k: int = 10,
+    since=None,
+    bank=None,
+    until=None,
+    refresh: bool = True,
+    apis=None,
+    conn=None,
+    index: Optional[VectorIndex] = None,
+) -> List[SearchHit]:
+    """
+    Top *k* reports for *query* (text, or an already-embedded vector) by
+    cosine similarity of their summary embeddings, optionally only those
+    received since/until a date and from one bank (or a list of banks).
+    """
+    index = index or get_index()
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        if refresh:
+            from ai_summary import summarization_vectorization as sv
+
+            sv.ensure_report_vectors(conn)
+            index.refresh(conn)
+        vector = embed_query(query, apis, index.model) if isinstance(query, str) else query
+        hits = index.search(vector, k, since=since, until=until, bank=bank)
+        if not hits:
+            return []
+        details = {
+            row[0]: row[1:]
+            for row in conn.execute(
+                """
+                SELECT v.report_id, v.email_received_ts, r.bank_tag, v.report_path, v.summary
+                  FROM report_vectors v
+                  LEFT JOIN reports r ON r.report_id = v.report_id
+                 WHERE v.report_id = ANY(%s)
+                """,
+                ([rid for rid, _ in hits],),
+            )
+        }
+    finally:
+        if own_conn:
+            conn.close()
+    # a report deleted from report_vectors since it was indexed is no hit
+    return [SearchHit(rid, score, *details[rid]) for rid, score in hits if rid in details]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Semantic search over ingested reports")
+    parser.add_argument("query")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--since", help="received on/after (YYYY-MM-DD)")
+    parser.add_argument("--until", help="received before (YYYY-MM-DD)")
+    parser.add_argument("--bank", action="append", help="bank tag; repeat for several")
+    parser.add_argument("--rebuild", action="store_true", help="build the index from scratch (drops deleted reports)")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        get_index().clear()
+    for hit in search_reports(args.query, args.k, since=args.since, until=args.until, bank=args.bank):
+        received = hit.received_ts.date() if hit.received_ts else "?"
+        print(f"{hit.score:6.3f}  {received}  {hit.bank_tag or '?':8} {hit.report_path}")
+        if hit.summary:
+            print("        " + " ".join(hit.summary.split())[:160])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+ChromeDriverPool without Chrome: PooledDriver is swapped for a stand-in.
+
+    cd src && python -m pytest tests
+"""
+import threading
+import time
+
+import pytest
+
+import downloaders.GS_downloader as gs
+
+
+class FakeDriver:
+    started = 0
+
+    def __init__(self, download_dir):
+        self.download_dir = download_dir
+        self.uses = 0
+        FakeDriver.started += 1
+
+    def healthy(self) -> bool:
+        return True
+
+    def quit(self) -> None:
+        pass
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(gs, "PooledDriver", FakeDriver)
+    FakeDriver.started = 0
+    pool = gs.ChromeDriverPool(size=1, max_uses=1)
+    yield pool
+    pool.close()
+
+
+def test_waiter_gets_a_driver_after_the_holder_retires(pool):
+    holding, release = threading.Event(), threading.Event()
+    got = []
+
+    def first():
+        with pool.driver():
+            holding.set()
+            release.wait(5)
+
+    def second():
+        holding.wait(5)
+        with pool.driver() as pooled:
+            got.append(pooled)
+
+    threads = [threading.Thread(target=first, daemon=True), threading.Thread(target=second, daemon=True)]
+    for t in threads:
+        t.start()
+    holding.wait(5)
+    time.sleep(0.2)                     # second is now waiting in checkout
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert not any(t.is_alive() for t in threads), "checkout blocked after the only driver retired"
+    assert len(got) == 1
+    assert FakeDriver.started == 2      # max_uses=1: each checkout gets a fresh driver
+    assert pool._live == 0